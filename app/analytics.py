@@ -0,0 +1,166 @@
+import calendar
+import os
+import threading
+from datetime import date
+
+from db import dict_cursor
+
+# Log rows folded into the rollups per statement by the analytics.fold job;
+# `flask analytics-refresh` folds until the log is empty.
+FOLD_BATCH = int(os.environ.get("ANALYTICS_FOLD_BATCH", 5000))
+# Longest month range one API request may cover, and keys returned per month.
+MAX_MONTHS = 36
+DEFAULT_KEYS = 20
+MAX_KEYS = 200
+
+# Rollup dimension -> table_stats dimension holding the listing counts that
+# occupancy is measured against.
+DIMENSIONS = {
+    "city": "property_place",
+    "state": "property_state",
+    "type": "property_type",
+    "total": "property",
+}
+
+FOLD_QUERY = "SELECT fold_booking_rollup_log(%s)"
+# The lock fold_booking_rollup_log tries; held until commit.
+FOLD_LOCK_QUERY = "SELECT pg_advisory_xact_lock(hashtext('fold_booking_rollup_log'))"
+PENDING_QUERY = "SELECT count(*), min(logged_at) FROM booking_rollup_log"
+SEED_LOG_QUERY = """
+    INSERT INTO booking_rollup_log(city, state, property_type, renter_email, start_date, end_date, total_cost, sign)
+    SELECT p.city, p.state, b."Property_Type", b.renter_email, b.start_date, b.end_date, b.total_cost, 1
+    FROM "Bookings" b
+    JOIN "Property Info" p ON p.property_id = b.property_id
+    ORDER BY b.booking_id
+"""
+# Top keys per month by revenue, with the current listing count of each key.
+ROLLUP_QUERY = """
+    SELECT r.month, r.key, r.bookings, r.booked_nights, r.revenue, r.renters,
+           COALESCE(s.row_count, 0) AS listings
+    FROM (
+        SELECT *, row_number() OVER (PARTITION BY month ORDER BY revenue DESC, key) AS rank
+        FROM booking_rollup
+        WHERE dimension = %(dimension)s
+          AND month BETWEEN %(first)s AND %(last)s
+          AND (%(key)s::text IS NULL OR key = %(key)s)
+    ) r
+    LEFT JOIN table_stats s ON s.dimension = %(stats_dimension)s AND s.key = r.key
+    WHERE r.rank <= %(limit)s
+    ORDER BY r.month, r.rank
+"""
+
+_stats = {"folds": 0, "folded": 0}
+_stats_lock = threading.Lock()
+
+
+def add_months(month, count):
+    """First day of the month `count` months after `month` (negative goes back)."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_month(raw):
+    """Parse YYYY-MM into the first day of that month; raises ValueError."""
+    year, month = raw.split("-")
+    return date(int(year), int(month), 1)
+
+
+def months_between(first, last):
+    """Months in the inclusive range [first, last]."""
+    return (last.year - first.year) * 12 + last.month - first.month + 1
+
+
+def fold(conn, batch=FOLD_BATCH):
+    """
+    Fold up to `batch` pending log rows into the rollups. Returns rows folded,
+    or None when another fold is running.
+    """
+    with conn.cursor() as cur:
+        cur.execute(FOLD_QUERY, (batch,))
+        folded = cur.fetchone()[0]
+    if folded:
+        with _stats_lock:
+            _stats["folds"] += 1
+            _stats["folded"] += folded
+    return folded
+
+
+def fold_all(conn, batch=FOLD_BATCH, progress=None):
+    """
+    Fold the whole log, committing per batch. Returns rows folded. Each batch
+    waits for a running fold instead of stopping at it.
+    """
+    total = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(FOLD_LOCK_QUERY)
+        folded = fold(conn, batch)
+        conn.commit()
+        if not folded:
+            return total
+        total += folded
+        if progress:
+            progress(total)
+
+
+def pending(conn):
+    """(log rows not yet folded, when the oldest was logged)."""
+    with conn.cursor() as cur:
+        cur.execute(PENDING_QUERY)
+        return cur.fetchone()
+
+
+def rebuild(conn):
+    """
+    Recompute the rollups from "Bookings" in one transaction. Returns bookings
+    rolled up. The seeded log is folded in a single pass: batches would rescan
+    the rows already deleted by this transaction.
+    """
+    with conn.cursor() as cur:
+        cur.execute('LOCK TABLE "Property Info", "Bookings" IN SHARE MODE')
+        # Wait out a running fold, so the fold below cannot find it busy.
+        cur.execute(FOLD_LOCK_QUERY)
+        cur.execute("TRUNCATE booking_rollup, booking_rollup_renters, booking_rollup_log")
+        cur.execute(SEED_LOG_QUERY)
+        seeded = cur.rowcount
+    fold(conn, batch=None)
+    return seeded
+
+
+def rollups(conn, dimension, first, last, key=None, limit=DEFAULT_KEYS):
+    """
+    Monthly rollup rows of `dimension` from `first` to `last` (month starts),
+    the top `limit` keys by revenue per month, or just `key`.
+
+    occupancy is booked nights over the nights the key's current listings
+    could have been booked that month; listings added or removed since then
+    are not tracked per month.
+    """
+    with dict_cursor(conn) as cur:
+        cur.execute(
+            ROLLUP_QUERY,
+            {
+                "dimension": dimension,
+                "stats_dimension": DIMENSIONS[dimension],
+                "first": first,
+                "last": last,
+                "key": key,
+                "limit": limit,
+            },
+        )
+        rows = cur.fetchall()
+    for row in rows:
+        capacity = row["listings"] * calendar.monthrange(row["month"].year, row["month"].month)[1]
+        row["occupancy"] = row["booked_nights"] / capacity if capacity else None
+    return rows
+
+
+def collect_metrics():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    yield "booking_rollup_folds_total", "Folds of the booking rollup log that found rows.", "counter", [
+        ({}, snapshot["folds"])
+    ]
+    yield "booking_rollup_folded_total", "Booking rollup log rows folded into the rollups.", "counter", [
+        ({}, snapshot["folded"])
+    ]
@@ -1,22 +1,98 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from decimal import Decimal
 from functools import wraps
+import io
+import logging
 
+import click
 from flask import (
     Flask,
+    Response,
+    abort,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
     session,
+    stream_with_context,
     url_for,
 )
 import psycopg2
 
+import analytics
+import availability
+import bookings
+import cache
+import catalog
+import changefeed
+from conditional import (
+    conditional,
+    listing_validator,
+    renter_bookings_validator,
+    search_validator,
+)
+import db
 from db import get_connection, dict_cursor
+from pagination import decode_token, page_size, paginate
+import exports
+import instrumentation
+import jobs
+import listing_import
+import matches
+import prepared
+import properties
+import rewards
+import search
+import search_cache
+import serving
+import stats
+import tasks
 
 app = Flask(__name__)
 app.secret_key = "dev-secret-key"
+db.init_app(app)
+instrumentation.init_app(app)
+instrumentation.add_collector(cache.collect_metrics)
+instrumentation.add_collector(search_cache.collect_metrics)
+instrumentation.add_collector(prepared.collect_metrics)
+instrumentation.add_collector(changefeed.collect_metrics)
+instrumentation.add_collector(catalog.collect_metrics)
+instrumentation.add_collector(availability.collect_metrics)
+instrumentation.add_collector(matches.collect_metrics)
+instrumentation.add_collector(analytics.collect_metrics)
+instrumentation.add_collector(jobs.collect_metrics)
+instrumentation.add_collector(jobs.collect_queue_metrics, shared=True)
+
+# Hot statements, prepared once per pooled connection (see prepared.py).
+USER_BY_EMAIL = prepared.register(
+    "user_by_email",
+    'SELECT email, first_name, last_name, phone, user_type FROM "User" WHERE email = %s',
+)
+HOME_LISTINGS = prepared.register(
+    "home_listings",
+    'SELECT property_id, type, street, city, state, zip, price, availability FROM "Property Info" WHERE availability = TRUE ORDER BY property_id DESC LIMIT 5',
+)
+RENTER_CARDS = prepared.register(
+    "renter_cards",
+    'SELECT * FROM "PaymentCard" WHERE renter_email = %s ORDER BY card_id',
+)
+RENTER_CARD_CHOICES = prepared.register(
+    "renter_card_choices",
+    'SELECT card_id, card_brand, card_last4 FROM "PaymentCard" WHERE renter_email = %s ORDER BY card_id',
+)
+RENTER_BOOKINGS = prepared.register(
+    "renter_bookings",
+    '''
+    SELECT b.booking_id, b.start_date, b.end_date, b.total_cost, b."Property_Type",
+           p.property_id, p.street, p.city, p.state, p.zip
+    FROM "Bookings" b
+    JOIN "Property Info" p ON p.property_id = b.property_id
+    WHERE b.renter_email = %s
+    ORDER BY b.start_date DESC
+    ''',
+)
+SEARCH_BY_IDS = prepared.register("search_by_ids", search.BY_IDS_QUERY)
 
 
 def login_required(role=None):
@@ -36,26 +112,50 @@ def login_required(role=None):
     return decorator
 
 
+def _fetch_user(email):
+    with get_connection() as conn:
+        with dict_cursor(conn) as cur:
+            prepared.execute(cur, USER_BY_EMAIL, (email,))
+            return cur.fetchone()
+
+
 def get_user(email):
+    return cache.user_cache.get_or_load(email, lambda: _fetch_user(email))
+
+
+def _fetch_profile(table, email):
     with get_connection() as conn:
         with dict_cursor(conn) as cur:
-            cur.execute(
-                'SELECT email, first_name, last_name, phone, user_type FROM "User" WHERE email = %s',
-                (email,),
-            )
+            cur.execute(f'SELECT * FROM "{table}" WHERE email = %s', (email,))
             return cur.fetchone()
 
 
+def get_agent_profile(email):
+    return cache.profile_cache.get_or_load(
+        ("agent", email), lambda: _fetch_profile("Agent", email)
+    )
+
+
+def get_renter_profile(email):
+    return cache.profile_cache.get_or_load(
+        ("renter", email), lambda: _fetch_profile("ProspectiveRenter", email)
+    )
+
+
 @app.route("/")
+@db.read_only
+@conditional(listing_validator)
 def index():
     user_email = session.get("user_email")
     user = get_user(user_email) if user_email else None
     with get_connection() as conn:
-        with dict_cursor(conn) as cur:
-            cur.execute(
-                'SELECT property_id, type, street, city, state, zip, price, availability FROM "Property Info" WHERE availability = TRUE ORDER BY property_id DESC LIMIT 5'
-            )
-            properties = cur.fetchall()
+
+        def load(version):
+            with dict_cursor(conn) as cur:
+                prepared.execute(cur, HOME_LISTINGS)
+                return cur.fetchall()
+
+        properties = search_cache.fetch(conn, search_cache.cache_key("home"), load)
     return render_template("index.html", user=user, properties=properties)
 
 
@@ -136,6 +236,7 @@ def register():
                             'INSERT INTO "ProspectiveRenter"(email, desired_move_in_date, preferred_location, monthly_budget) VALUES (%s, %s, %s, %s)',
                             (email, move_in_date, preferred_location, monthly_budget),
                         )
+            cache.invalidate_user(email)
             session["user_email"] = email
             session["user_type"] = user_type
             flash("Registration successful.", "success")
@@ -151,33 +252,29 @@ def register():
 @login_required(role="renter")
 def renter_dashboard():
     email = session["user_email"]
+    renter = get_renter_profile(email)
     with get_connection() as conn:
         with dict_cursor(conn) as cur:
-            cur.execute(
-                'SELECT * FROM "ProspectiveRenter" WHERE email = %s', (email,)
-            )
-            renter = cur.fetchone()
             cur.execute(
                 'SELECT * FROM "Address" WHERE email = %s ORDER BY address_id',
                 (email,),
             )
             addresses = cur.fetchall()
-            cur.execute(
-                'SELECT * FROM "PaymentCard" WHERE renter_email = %s ORDER BY card_id',
-                (email,),
-            )
+            prepared.execute(cur, RENTER_CARDS, (email,))
             cards = cur.fetchall()
             cur.execute(
                 "SELECT bookings_count FROM renter_rewards WHERE renter_email = %s",
                 (email,),
             )
             rewards = cur.fetchone()
+        recommendations = matches.recommended(conn, email)
     return render_template(
         "renter_dashboard.html",
         renter=renter,
         addresses=addresses,
         cards=cards,
         rewards=rewards["bookings_count"] if rewards else 0,
+        recommendations=recommendations,
     )
 
 
@@ -185,20 +282,10 @@ def renter_dashboard():
 @login_required(role="agent")
 def agent_dashboard():
     email = session["user_email"]
+    agent = get_agent_profile(email)
     with get_connection() as conn:
-        with dict_cursor(conn) as cur:
-            cur.execute('SELECT * FROM "Agent" WHERE email = %s', (email,))
-            agent = cur.fetchone()
-            cur.execute('SELECT COUNT(*) FROM "Property Info"')
-            property_count = cur.fetchone()["count"]
-            cur.execute('SELECT COUNT(*) FROM "Bookings"')
-            booking_count = cur.fetchone()["count"]
-    return render_template(
-        "agent_dashboard.html",
-        agent=agent,
-        property_count=property_count,
-        booking_count=booking_count,
-    )
+        dashboard = stats.dashboard_stats(conn)
+    return render_template("agent_dashboard.html", agent=agent, **dashboard)
 
 
 @app.route("/addresses", methods=["GET", "POST"])
@@ -211,15 +298,19 @@ def addresses():
         city = request.form.get("city")
         state = request.form.get("state")
         zip_code = request.form.get("zip")
+        latitude = request.form.get("latitude", type=float)
+        longitude = request.form.get("longitude", type=float)
         if not street or not city:
             flash("Street and city are required.", "warning")
+        elif (latitude is None) != (longitude is None):
+            flash("Enter both latitude and longitude, or neither.", "warning")
         else:
             try:
                 with get_connection() as conn:
                     with conn.cursor() as cur:
                         cur.execute(
-                            'INSERT INTO "Address"(email, label, street, city, state, zip) VALUES (%s, %s, %s, %s, %s, %s)',
-                            (email, label, street, city, state, zip_code),
+                            'INSERT INTO "Address"(email, label, street, city, state, zip, latitude, longitude) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+                            (email, label, street, city, state, zip_code, latitude, longitude),
                         )
                 flash("Address added.", "success")
             except psycopg2.Error as exc:
@@ -298,10 +389,7 @@ def cards():
 
     with get_connection() as conn:
         with dict_cursor(conn) as cur:
-            cur.execute(
-                'SELECT * FROM "PaymentCard" WHERE renter_email = %s ORDER BY card_id',
-                (email,),
-            )
+            prepared.execute(cur, RENTER_CARDS, (email,))
             cards = cur.fetchall()
     return render_template("cards.html", cards=cards, addresses=addresses)
 
@@ -323,71 +411,82 @@ def delete_card(card_id):
     return redirect(url_for("cards"))
 
 
+def saved_address_origin(conn, values):
+    """(latitude, longitude) of the renter's saved address picked for a radius search."""
+    address_id = values.get("near_address", type=int)
+    if address_id is None or "user_email" not in session:
+        return None
+    with conn.cursor() as cur:
+        cur.execute(
+            'SELECT latitude, longitude FROM "Address" WHERE address_id = %s AND email = %s',
+            (address_id, session["user_email"]),
+        )
+        row = cur.fetchone()
+    if row is None or row[0] is None or row[1] is None:
+        flash("That address has no coordinates to search around.", "warning")
+        return None
+    return row
+
+
 @app.route("/search", methods=["GET", "POST"])
+@db.read_only
+@conditional(search_validator)
 def search_properties():
-    filters = []
-    params = []
-    if request.method == "POST":
-        city = request.form.get("city")
-        state = request.form.get("state")
-        ptype = request.form.get("type")
-        max_price = request.form.get("max_price")
-        only_available = request.form.get("only_available")
-
-        if city:
-            filters.append("LOWER(p.city) LIKE %s")
-            params.append(f"%{city.lower()}%")
-        if state:
-            filters.append("LOWER(p.state) LIKE %s")
-            params.append(f"%{state.lower()}%")
-        if ptype:
-            filters.append("p.type = %s")
-            params.append(ptype)
-        if max_price:
-            filters.append("p.price <= %s")
-            params.append(Decimal(max_price))
-        if only_available:
-            filters.append("p.availability = TRUE")
-    else:
-        filters.append("p.availability = TRUE")
-
-    where_clause = "WHERE " + " AND ".join(filters) if filters else ""
-    query = f'''
-        SELECT p.property_id, p.type, p.street, p.city, p.state, p.zip, p."Sq_Footage", p.price, p.description, p.availability,
-               n.crime_rate, n.schools, n.vacation_homes, n.land
-        FROM "Property Info" p
-        LEFT JOIN "Neighborhood" n ON n.property_id = p.property_id
-        {where_clause}
-        ORDER BY p.price ASC, p.property_id DESC
-    '''
+    values = request.values
     with get_connection() as conn:
-        with dict_cursor(conn) as cur:
-            cur.execute(query, params)
-            properties = cur.fetchall()
-    return render_template("search_properties.html", properties=properties)
+        filters = search.parse_filters(values, saved_address_origin(conn, values))
+        limit = page_size(values)
+        after = decode_token("search", values.get("page"))
+        query, params = search.build_query(filters, after, limit)
+
+        def load(version):
+            ids = catalog.search(conn, filters, after, limit, version)
+            if ids == []:
+                return []
+            with dict_cursor(conn) as cur:
+                if ids is not None:
+                    prepared.execute(cur, SEARCH_BY_IDS, (ids,))
+                elif search.preparable(filters):
+                    prepared.execute(cur, prepared.dynamic("search", query), params)
+                else:
+                    cur.execute(query, params)
+                return cur.fetchall()
+
+        if "check_in" in filters:
+            # Depends on bookings, which listing_version does not track.
+            rows = load(None)
+        else:
+            rows = search_cache.fetch(
+                conn, search_cache.cache_key("search", filters, after, limit), load
+            )
+    properties, next_token = paginate(
+        rows, limit, "search", search.row_key(filters)
+    )
+    form_args = {
+        field: values[field] for field in search.SEARCH_FIELDS if field in values
+    }
+    if "per_page" in values:
+        form_args["per_page"] = limit
+    next_url = (
+        url_for("search_properties", page=next_token, **form_args)
+        if next_token
+        else None
+    )
+    first_url = url_for("search_properties", **form_args) if after else None
+    return render_template(
+        "search_properties.html",
+        properties=properties,
+        filters=values,
+        search=filters,
+        next_url=next_url,
+        first_url=first_url,
+    )
 
 
 @app.route("/book/<int:property_id>", methods=["GET", "POST"])
 @login_required(role="renter")
 def book_property(property_id):
     email = session["user_email"]
-    with get_connection() as conn:
-        with dict_cursor(conn) as cur:
-            cur.execute(
-                'SELECT property_id, type, street, city, state, zip, price, description, availability FROM "Property Info" WHERE property_id = %s',
-                (property_id,),
-            )
-            property_info = cur.fetchone()
-            if not property_info:
-                flash("Property not found.", "danger")
-                return redirect(url_for("search_properties"))
-
-            cur.execute(
-                'SELECT card_id, card_brand, card_last4 FROM "PaymentCard" WHERE renter_email = %s ORDER BY card_id',
-                (email,),
-            )
-            cards = cur.fetchall()
-
     if request.method == "POST":
         start_date_raw = request.form.get("start_date")
         end_date_raw = request.form.get("end_date")
@@ -403,48 +502,36 @@ def book_property(property_id):
             return redirect(url_for("book_property", property_id=property_id))
 
         try:
-            with get_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(
-                        'SELECT card_id FROM "PaymentCard" WHERE card_id = %s AND renter_email = %s',
-                        (int(card_id), email),
-                    )
-                    if not cur.fetchone():
-                        flash("Select a valid payment card.", "danger")
-                        return redirect(url_for("book_property", property_id=property_id))
-
-                    cur.execute(
-                        'SELECT price, type FROM "Property Info" WHERE property_id = %s',
-                        (property_id,),
-                    )
-                    row = cur.fetchone()
-                    if not row:
-                        flash("Property not found.", "danger")
-                        return redirect(url_for("search_properties"))
-
-                    price, prop_type = row
-                    days = (end_date - start_date).days
-                    multiplier = max(days / 30, 1)
-                    total_cost = Decimal(price) * Decimal(multiplier)
-                    cur.execute(
-                        'INSERT INTO "Bookings"(property_id, renter_email, card_id, start_date, end_date, total_cost, "Property_Type") VALUES (%s, %s, %s, %s, %s, %s, %s)',
-                        (
-                            property_id,
-                            email,
-                            int(card_id),
-                            start_date,
-                            end_date,
-                            total_cost,
-                            prop_type,
-                        ),
-                    )
+            bookings.create_booking(
+                email, property_id, int(card_id), start_date, end_date
+            )
             flash("Booking created.", "success")
             return redirect(url_for("my_bookings"))
-        except psycopg2.Error as exc:
+        except bookings.PropertyNotFound as exc:
+            flash(str(exc), "danger")
+            return redirect(url_for("search_properties"))
+        except bookings.BookingError as exc:
+            flash(str(exc), "danger")
+        except psycopg2.Error:
             flash(
                 "Could not create booking (dates may overlap or card/property invalid).",
                 "danger",
             )
+
+    with get_connection() as conn:
+        with dict_cursor(conn) as cur:
+            cur.execute(
+                'SELECT property_id, type, street, city, state, zip, price, description, availability FROM "Property Info" WHERE property_id = %s',
+                (property_id,),
+            )
+            property_info = cur.fetchone()
+            if not property_info:
+                flash("Property not found.", "danger")
+                return redirect(url_for("search_properties"))
+
+            prepared.execute(cur, RENTER_CARD_CHOICES, (email,))
+            cards = cur.fetchall()
+
     return render_template(
         "book_property.html", property=property_info, cards=cards
     )
@@ -452,86 +539,67 @@ def book_property(property_id):
 
 @app.route("/my_bookings")
 @login_required(role="renter")
+@conditional(renter_bookings_validator)
 def my_bookings():
     email = session["user_email"]
     with get_connection() as conn:
         with dict_cursor(conn) as cur:
-            cur.execute(
-                '''
-                SELECT b.booking_id, b.start_date, b.end_date, b.total_cost, b."Property_Type",
-                       p.property_id, p.street, p.city, p.state, p.zip
-                FROM "Bookings" b
-                JOIN "Property Info" p ON p.property_id = b.property_id
-                WHERE b.renter_email = %s
-                ORDER BY b.start_date DESC
-                ''',
-                (email,),
-            )
+            prepared.execute(cur, RENTER_BOOKINGS, (email,))
             bookings = cur.fetchall()
     return render_template("my_bookings.html", bookings=bookings)
 
 
 @app.route("/agent/properties")
 @login_required(role="agent")
+@db.read_only
+@conditional(listing_validator)
 def agent_properties():
+    limit = page_size(request.args)
+    after = decode_token("agent_properties", request.args.get("page"))
+    where_clause = "WHERE p.property_id < %s" if after else ""
+    params = [after[0]] if after else []
     with get_connection() as conn:
         with dict_cursor(conn) as cur:
             cur.execute(
-                '''
+                f'''
                 SELECT p.property_id, p.type, p.street, p.city, p.state, p.zip, p.price, p.availability,
                        n.crime_rate, n.schools
                 FROM "Property Info" p
                 LEFT JOIN "Neighborhood" n ON n.property_id = p.property_id
+                {where_clause}
                 ORDER BY p.property_id DESC
-                '''
-            )
-            properties = cur.fetchall()
-    return render_template("agent_properties.html", properties=properties)
-
-
-def _load_property(property_id):
-    with get_connection() as conn:
-        with dict_cursor(conn) as cur:
-            cur.execute(
-                'SELECT * FROM "Property Info" WHERE property_id = %s',
-                (property_id,),
-            )
-            prop = cur.fetchone()
-            if not prop:
-                return None
-            subtype = {}
-            if prop["type"] == "house":
-                cur.execute(
-                    'SELECT "No_of_Rooms" FROM "House" WHERE property_id = %s',
-                    (property_id,),
-                )
-                subtype = cur.fetchone() or {}
-            elif prop["type"] == "apartment":
-                cur.execute(
-                    'SELECT "No_of_Rooms", "Building_Type" FROM "Apartment" WHERE property_id = %s',
-                    (property_id,),
-                )
-                subtype = cur.fetchone() or {}
-            elif prop["type"] == "commercial":
-                cur.execute(
-                    'SELECT "Business_Types", "No_of_Rooms" FROM "Commercial Building" WHERE property_id = %s',
-                    (property_id,),
-                )
-                subtype = cur.fetchone() or {}
-
-            cur.execute(
-                'SELECT crime_rate, schools, vacation_homes, land FROM "Neighborhood" WHERE property_id = %s',
-                (property_id,),
+                LIMIT %s
+                ''',
+                params + [limit + 1],
             )
-            neighborhood = cur.fetchone()
-    return {"property": prop, "subtype": subtype, "neighborhood": neighborhood}
+            rows = cur.fetchall()
+    properties, next_token = paginate(
+        rows, limit, "agent_properties", lambda p: (p["property_id"],)
+    )
+    per_page = {"per_page": limit} if "per_page" in request.args else {}
+    next_url = (
+        url_for("agent_properties", page=next_token, **per_page)
+        if next_token
+        else None
+    )
+    first_url = url_for("agent_properties", **per_page) if after else None
+    return render_template(
+        "agent_properties.html",
+        properties=properties,
+        next_url=next_url,
+        first_url=first_url,
+    )
 
 
 @app.route("/agent/properties/new", methods=["GET", "POST"])
 @app.route("/agent/properties/<int:property_id>/edit", methods=["GET", "POST"])
 @login_required(role="agent")
 def agent_property_form(property_id=None):
-    existing = _load_property(property_id) if property_id else None
+    if property_id:
+        with get_connection() as conn:
+            existing = properties.load_property(conn, property_id)
+    else:
+        existing = None
     if property_id and not existing:
         flash("Property not found.", "danger")
         return redirect(url_for("agent_properties"))
@@ -546,6 +614,8 @@ def agent_property_form(property_id=None):
         price = request.form.get("price")
         description = request.form.get("description")
         availability = bool(request.form.get("availability"))
+        latitude = request.form.get("latitude", type=float)
+        longitude = request.form.get("longitude", type=float)
         rooms = request.form.get("rooms") or None
         building_type = request.form.get("building_type")
         business_types = request.form.get("business_types")
@@ -561,86 +631,52 @@ def agent_property_form(property_id=None):
                     "agent_property_form", property_id=property_id
                 )
             )
+        if (latitude is None) != (longitude is None):
+            flash("Enter both latitude and longitude, or neither.", "warning")
+            return redirect(
+                url_for(
+                    "agent_property_form", property_id=property_id
+                )
+            )
 
         try:
             with get_connection() as conn:
-                with conn.cursor() as cur:
-                    if property_id:
-                        cur.execute(
-                            '''
-                            UPDATE "Property Info"
-                            SET type = %s, street = %s, city = %s, state = %s, zip = %s,
-                                "Sq_Footage" = %s, price = %s, description = %s, availability = %s
-                            WHERE property_id = %s
-                            ''',
-                            (
-                                ptype,
-                                street,
-                                city,
-                                state,
-                                zip_code,
-                                int(sq_ft) if sq_ft else None,
-                                Decimal(price),
-                                description,
-                                availability,
-                                property_id,
-                            ),
-                        )
-                        cur.execute('DELETE FROM "House" WHERE property_id = %s', (property_id,))
-                        cur.execute('DELETE FROM "Apartment" WHERE property_id = %s', (property_id,))
-                        cur.execute('DELETE FROM "Commercial Building" WHERE property_id = %s', (property_id,))
-                    else:
-                        cur.execute(
-                            '''
-                            INSERT INTO "Property Info"(type, street, city, state, zip, "Sq_Footage", price, description, availability)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            RETURNING property_id
-                            ''',
-                            (
-                                ptype,
-                                street,
-                                city,
-                                state,
-                                zip_code,
-                                int(sq_ft) if sq_ft else None,
-                                Decimal(price),
-                                description,
-                                availability,
-                            ),
-                        )
-                        property_id = cur.fetchone()[0]
-
-                    if ptype == "house" and rooms:
-                        cur.execute(
-                            'INSERT INTO "House"(property_id, "No_of_Rooms") VALUES (%s, %s)',
-                            (property_id, int(rooms)),
-                        )
-                    elif ptype == "apartment" and rooms:
-                        cur.execute(
-                            'INSERT INTO "Apartment"(property_id, "No_of_Rooms", "Building_Type") VALUES (%s, %s, %s)',
-                            (property_id, int(rooms), building_type),
-                        )
-                    elif ptype == "commercial":
-                        cur.execute(
-                            'INSERT INTO "Commercial Building"(property_id, "Business_Types", "No_of_Rooms") VALUES (%s, %s, %s)',
-                            (property_id, business_types, int(rooms) if rooms else None),
-                        )
-
-                    if any([crime_rate, schools, vacation_homes, land]):
-                        cur.execute(
-                            'DELETE FROM "Neighborhood" WHERE property_id = %s',
-                            (property_id,),
-                        )
-                        cur.execute(
-                            'INSERT INTO "Neighborhood"(property_id, crime_rate, schools, vacation_homes, land) VALUES (%s, %s, %s, %s, %s)',
-                            (
-                                property_id,
-                                float(crime_rate) if crime_rate else None,
-                                schools,
-                                vacation_homes,
-                                land,
-                            ),
-                        )
+                property_id = properties.save_property(
+                    conn,
+                    property_id,
+                    fields={
+                        "type": ptype,
+                        "street": street,
+                        "city": city,
+                        "state": state,
+                        "zip": zip_code,
+                        "Sq_Footage": int(sq_ft) if sq_ft else None,
+                        "price": Decimal(price),
+                        "description": description,
+                        "availability": availability,
+                        "latitude": latitude,
+                        "longitude": longitude,
+                    },
+                    subtype={
+                        "No_of_Rooms": int(rooms) if rooms else None,
+                        "Building_Type": building_type,
+                        "Business_Types": business_types,
+                    },
+                    neighborhood=(
+                        {
+                            "crime_rate": float(crime_rate) if crime_rate else None,
+                            "schools": schools,
+                            "vacation_homes": vacation_homes,
+                            "land": land,
+                        }
+                        if any([crime_rate, schools, vacation_homes, land])
+                        else None
+                    ),
+                )
+                if property_id is None:
+                    flash("Property not found.", "danger")
+                    return redirect(url_for("agent_properties"))
+                tasks.listings_changed(conn)
             flash("Property saved.", "success")
             return redirect(url_for("agent_properties"))
         except psycopg2.Error as exc:
@@ -658,8 +694,90 @@ def agent_property_form(property_id=None):
     )
 
 
+IMPORT_REJECTS_SHOWN = 100
+
+
+@app.route("/agent/properties/import", methods=["GET", "POST"])
+@login_required(role="agent")
+def agent_property_import():
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("Choose a CSV or NDJSON file to import.", "warning")
+            return redirect(url_for("agent_property_import"))
+        fmt = request.form.get("format") or listing_import.detect_format(
+            upload.filename
+        )
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        try:
+            with get_connection() as conn:
+                report = listing_import.import_listings(
+                    conn, stream, fmt, dry_run=bool(request.form.get("dry_run"))
+                )
+                if report["imported"] and not request.form.get("dry_run"):
+                    tasks.listings_changed(conn)
+        except (psycopg2.Error, UnicodeDecodeError, ValueError) as exc:
+            flash(f"Import failed: {getattr(exc, 'pgerror', None) or exc}", "danger")
+            return redirect(url_for("agent_property_import"))
+        flash(
+            f"{'Validated' if request.form.get('dry_run') else 'Imported'} "
+            f"{report['imported']} listings, rejected {len(report['rejects'])} rows.",
+            "success" if not report["rejects"] else "warning",
+        )
+        return render_template(
+            "agent_property_import.html",
+            rejects=report["rejects"][:IMPORT_REJECTS_SHOWN],
+            reject_count=len(report["rejects"]),
+            columns=listing_import.IMPORT_COLUMNS,
+        )
+    return render_template(
+        "agent_property_import.html",
+        rejects=None,
+        reject_count=0,
+        columns=listing_import.IMPORT_COLUMNS,
+    )
+
+
+def _parse_date_arg(raw):
+    if not raw:
+        return None
+    try:
+        return datetime.strptime(raw, "%Y-%m-%d").date()
+    except ValueError:
+        abort(400, description=f"Invalid date: {raw}")
+
+
+@app.route("/agent/export/<dataset>.<fmt>")
+@login_required(role="agent")
+def agent_export(dataset, fmt):
+    if dataset not in ("bookings", "listings") or fmt not in exports.FORMATS:
+        abort(404)
+    query, params, columns = exports.export_query(
+        dataset,
+        start=_parse_date_arg(request.args.get("from")),
+        end=_parse_date_arg(request.args.get("to")),
+        property_id=request.args.get("property_id", type=int),
+        renter_email=request.args.get("renter_email"),
+    )
+    render, mimetype = exports.FORMATS[fmt]
+
+    def generate():
+        with get_connection() as conn:
+            yield from render(exports.stream_rows(conn, query, params), columns)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={dataset}.{fmt}"},
+    )
+
+
+CALENDAR_WEEKS_SHOWN = 8
+
+
 @app.route("/agent/properties/<int:property_id>/bookings")
 @login_required(role="agent")
+@db.read_only
 def agent_property_bookings(property_id):
     with get_connection() as conn:
         with dict_cursor(conn) as cur:
@@ -683,9 +801,414 @@ def agent_property_bookings(property_id):
                 (property_id,),
             )
             bookings = cur.fetchall()
+        start = date.today() - timedelta(days=date.today().weekday())
+        end = start + timedelta(weeks=CALENDAR_WEEKS_SHOWN) - timedelta(days=1)
+        ranges = availability.calendars(conn, [property_id], start, end)
+    days = list(availability.days(ranges.get(property_id, [])))
+    weeks = [days[i : i + 7] for i in range(0, len(days), 7)]
+    return render_template(
+        "agent_property_bookings.html", prop=prop, bookings=bookings, weeks=weeks
+    )
+
+
+ANALYTICS_TREND_MONTHS = 12
+ANALYTICS_KEYS_SHOWN = 25
+
+
+def _month_arg(name, default):
+    raw = request.args.get(name)
+    if not raw:
+        return default
+    try:
+        return analytics.parse_month(raw)
+    except ValueError:
+        abort(400, description=f"Invalid month: {raw}")
+
+
+def _dimension_arg():
+    dimension = request.args.get("dimension", "city")
+    if dimension not in analytics.DIMENSIONS:
+        abort(400, description=f"dimension must be one of {', '.join(analytics.DIMENSIONS)}")
+    return dimension
+
+
+@app.route("/agent/analytics")
+@login_required(role="agent")
+@db.read_only
+def agent_analytics():
+    dimension = _dimension_arg()
+    month = _month_arg("month", date.today().replace(day=1))
+    first = analytics.add_months(month, 1 - ANALYTICS_TREND_MONTHS)
+    with get_connection() as conn:
+        pending, oldest = analytics.pending(conn)
+        trend = analytics.rollups(conn, "total", first, month)
+        breakdown = analytics.rollups(
+            conn, dimension, month, month, limit=ANALYTICS_KEYS_SHOWN
+        )
     return render_template(
-        "agent_property_bookings.html", prop=prop, bookings=bookings
+        "agent_analytics.html",
+        dimension=dimension,
+        dimensions=list(analytics.DIMENSIONS),
+        month=month,
+        previous_month=analytics.add_months(month, -1),
+        next_month=analytics.add_months(month, 1),
+        trend=trend,
+        breakdown=breakdown,
+        pending=pending,
+        oldest=oldest,
+    )
+
+
+@app.route("/events/listings")
+def listing_events():
+    """Server-sent stream of booking and listing changes, optionally per property."""
+    try:
+        property_ids = [int(v) for v in request.args.getlist("property_id")]
+    except ValueError:
+        abort(400)
+    if serving.draining:
+        abort(503)
+    try:
+        subscription = changefeed.feed.subscribe(property_ids)
+    except changefeed.TooManySubscribers:
+        abort(503)
+    response = Response(
+        stream_with_context(changefeed.sse_stream(subscription)),
+        mimetype="text/event-stream",
+    )
+    response.call_on_close(subscription.close)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.cli.command("rewards-reconcile")
+@click.option("--fix", is_flag=True, help="Rewrite counters that drifted.")
+def rewards_reconcile(fix):
+    """Verify rewards counters against the bookings table."""
+    with get_connection() as conn:
+        drift = rewards.reconcile(conn, fix=fix)
+    for row in drift:
+        click.echo(
+            f"{row['renter_email']}: count {row['bookings_count']} -> {row['expected_count']}, "
+            f"spent {row['total_spent']} -> {row['expected_spent']}"
+        )
+    if not drift:
+        click.echo("Rewards counters are consistent.")
+    elif fix:
+        click.echo(f"Rebuilt {len(drift)} rewards rows.")
+    else:
+        raise SystemExit(1)
+
+
+@app.cli.command("import-listings")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format", "fmt", type=click.Choice(["csv", "ndjson"]), help="Defaults to the file extension."
+)
+@click.option("--dry-run", is_flag=True, help="Validate without inserting.")
+def import_listings_command(path, fmt, dry_run):
+    """Bulk load listings from a CSV or NDJSON file."""
+    fmt = fmt or listing_import.detect_format(path)
+    with open(path, encoding="utf-8-sig", newline="") as stream:
+        with get_connection() as conn:
+            report = listing_import.import_listings(conn, stream, fmt, dry_run=dry_run)
+            if report["imported"] and not dry_run:
+                tasks.listings_changed(conn)
+    for reject in report["rejects"]:
+        click.echo(f"row {reject['row_no']}: {reject['error']}", err=True)
+    verb = "Validated" if dry_run else "Imported"
+    click.echo(f"{verb} {report['imported']} listings, rejected {len(report['rejects'])} rows.")
+
+
+@app.cli.command("export")
+@click.argument("dataset", type=click.Choice(["bookings", "listings"]))
+@click.option("--format", "fmt", type=click.Choice(sorted(exports.FORMATS)), default="csv")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="Defaults to stdout.")
+@click.option("--from", "start", type=click.DateTime(["%Y-%m-%d"]), help="Stays ending on or after.")
+@click.option("--to", "end", type=click.DateTime(["%Y-%m-%d"]), help="Stays starting on or before.")
+@click.option("--property", "property_id", type=int)
+@click.option("--renter", "renter_email")
+@click.option("--itersize", type=int, help="Rows per server-side cursor fetch.")
+def export_command(dataset, fmt, output, start, end, property_id, renter_email, itersize):
+    """Stream bookings or listings to CSV or NDJSON."""
+    query, params, columns = exports.export_query(
+        dataset,
+        start=start.date() if start else None,
+        end=end.date() if end else None,
+        property_id=property_id,
+        renter_email=renter_email,
     )
+    render, _ = exports.FORMATS[fmt]
+    with click.open_file(output or "-", "w", encoding="utf-8", newline="") as out:
+        with get_connection() as conn:
+            for chunk in render(exports.stream_rows(conn, query, params, itersize), columns):
+                out.write(chunk)
+
+
+@app.cli.command("stats-rebuild")
+def stats_rebuild():
+    """Recompute the dashboard statistics rollup from the base tables."""
+    with get_connection() as conn:
+        rows = stats.rebuild(conn)
+    click.echo(f"Rebuilt {rows} statistics rows.")
+
+
+@app.cli.command("stats-refresh")
+@click.option("--batch", type=int, default=stats.FOLD_BATCH, show_default=True)
+def stats_refresh(batch):
+    """Fold pending row count changes into the dashboard statistics."""
+    conn = db.connect()
+    try:
+        folded = stats.fold_all(conn, batch)
+    finally:
+        conn.close()
+    click.echo(f"Folded {folded} statistics changes.")
+
+
+@app.cli.command("matches-rebuild")
+@click.option("--batch", type=int, default=matches.REFRESH_BATCH, show_default=True)
+def matches_rebuild(batch):
+    """Recompute every renter's recommended listings from scratch."""
+    conn = db.connect()
+    try:
+        renters, kept = matches.rebuild(
+            conn,
+            batch,
+            progress=lambda renters, kept: click.echo(f"{renters} renters, {kept} matches"),
+        )
+    finally:
+        conn.close()
+    click.echo(f"Rebuilt matches for {renters} renters ({kept} matches).")
+
+
+@app.cli.command("matches-refresh")
+def matches_refresh():
+    """Recompute the recommendations that listing or preference changes made stale."""
+    conn = db.connect()
+    try:
+        refreshed = matches.refresh_dirty(conn)
+    finally:
+        conn.close()
+    click.echo(f"Refreshed matches for {refreshed} renters.")
+
+
+@app.cli.command("analytics-rebuild")
+def analytics_rebuild():
+    """Recompute the booking analytics rollups from the bookings table."""
+    with get_connection() as conn:
+        bookings = analytics.rebuild(conn)
+    click.echo(f"Rolled up {bookings} bookings.")
+
+
+@app.cli.command("analytics-refresh")
+@click.option("--batch", type=int, default=analytics.FOLD_BATCH, show_default=True)
+def analytics_refresh(batch):
+    """Fold pending booking changes into the analytics rollups."""
+    conn = db.connect()
+    try:
+        folded = analytics.fold_all(conn, batch)
+    finally:
+        conn.close()
+    click.echo(f"Folded {folded} booking changes.")
+
+
+@app.cli.command("jobs-worker")
+@click.option("--concurrency", "-c", type=int, default=2, show_default=True)
+@click.option("--batch", type=int, default=jobs.CLAIM_BATCH, show_default=True)
+def jobs_worker(concurrency, batch):
+    """Run background job worker processes until SIGTERM or Ctrl-C."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(message)s")
+    click.echo(f"Starting {concurrency} job workers.")
+    jobs.run_pool(concurrency, batch)
+
+
+@app.cli.command("jobs-requeue")
+@click.option("--kind", help="Only dead jobs of this kind.")
+def jobs_requeue(kind):
+    """Move dead-lettered jobs back onto the queue."""
+    with get_connection() as conn:
+        count = jobs.requeue_dead(conn, kind)
+    click.echo(f"Requeued {count} jobs.")
+
+
+@app.cli.command("catalog-stats")
+def catalog_stats():
+    """Load the in-memory listing catalog and report its memory footprint."""
+    if catalog.np is None:
+        click.echo("The listing catalog needs numpy (pip install numpy).")
+        return
+    with get_connection() as conn:
+        catalog.load(conn)
+    footprint = catalog.footprint()
+    click.echo(f"{footprint['listings']:,} listings")
+    for column, size in footprint["bytes"].items():
+        click.echo(f"{column:>14}: {size:>12,} bytes")
+    click.echo(f"{'total':>14}: {footprint['total_bytes']:>12,} bytes")
+    click.echo(f"{'per million':>14}: {footprint['bytes_per_million']:>12,} bytes")
+
+
+@app.cli.command("replica-check")
+def replica_check():
+    """Show which server each configured replica reaches and its replay lag."""
+    if not db.REPLICA_DSNS:
+        click.echo("No replicas configured (set DB_REPLICA_DSNS).")
+        return
+    for replica in db.get_replicas():
+        replica.checked_at = 0.0
+        conn = replica.checkout()
+        if conn is None:
+            click.echo(f"{replica.name}: unavailable (lag {replica.lag})")
+            continue
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT inet_server_addr(), inet_server_port(), pg_is_in_recovery()"
+                )
+                host, port, standby = cur.fetchone()
+            conn.rollback()
+        finally:
+            replica.pool.putconn(conn)
+        role = "standby" if standby else "not in recovery"
+        click.echo(f"{replica.name}: {host}:{port} {role}, lag {replica.lag:.1f}s")
+
+
+API_BATCH_LIMIT = 200
+CALENDAR_DEFAULT_DAYS = 30
+
+
+def _ids_arg():
+    try:
+        ids = [int(value) for value in request.args.get("ids", "").split(",") if value]
+    except ValueError:
+        abort(400, description="ids must be a comma separated list of integers")
+    if len(ids) > API_BATCH_LIMIT:
+        abort(400, description=f"at most {API_BATCH_LIMIT} ids per request")
+    return ids
+
+
+@app.route("/api/properties")
+@login_required()
+def api_properties():
+    """Return full property aggregates for `?ids=1,2,3` in a single query."""
+    ids = _ids_arg()
+    with get_connection() as conn:
+        loaded = properties.load_properties(conn, ids)
+    return jsonify(
+        [
+            {
+                **aggregate["property"],
+                "subtype": aggregate["subtype"],
+                "neighborhood": aggregate["neighborhood"],
+            }
+            for _, aggregate in sorted(loaded.items())
+        ]
+    )
+
+
+@app.route("/api/availability")
+@login_required()
+@db.read_only
+def api_availability():
+    """
+    Booked and free days of `?ids=1,2,3` from `start` to `end` (inclusive).
+
+    `format=runs` (default) returns alternating free/booked run lengths per
+    property, starting with a free run; `format=ranges` returns explicit
+    {start, end, booked} ranges.
+    """
+    ids = _ids_arg()
+    start = _parse_date_arg(request.args.get("start")) or date.today()
+    end = _parse_date_arg(request.args.get("end")) or start + timedelta(
+        days=CALENDAR_DEFAULT_DAYS - 1
+    )
+    if end < start:
+        abort(400, description="end must not be before start")
+    if availability.window_days(start, end) > availability.MAX_WINDOW_DAYS:
+        abort(400, description=f"at most {availability.MAX_WINDOW_DAYS} days per request")
+    fmt = request.args.get("format", "runs")
+    if fmt not in ("runs", "ranges"):
+        abort(400, description="format must be runs or ranges")
+    with get_connection() as conn:
+        ranges = availability.calendars(conn, ids, start, end)
+    if fmt == "runs":
+        calendars = {
+            str(pid): availability.run_lengths(property_ranges)
+            for pid, property_ranges in ranges.items()
+        }
+    else:
+        calendars = {
+            str(pid): [
+                {"start": first.isoformat(), "end": last.isoformat(), "booked": booked}
+                for first, last, booked in property_ranges
+            ]
+            for pid, property_ranges in ranges.items()
+        }
+    return jsonify(
+        start=start.isoformat(), end=end.isoformat(), format=fmt, properties=calendars
+    )
+
+
+@app.route("/api/analytics")
+@login_required(role="agent")
+@db.read_only
+def api_analytics():
+    """
+    Monthly booking rollups of `dimension` (city, state, type or total) from
+    `from` to `to` (YYYY-MM, inclusive; the last 12 months by default).
+
+    Each month lists its top `limit` keys by revenue, or only `key`. renters
+    are distinct per month and cannot be summed across months. `pending`
+    counts booking changes not folded in yet, logged since `pending_since`.
+    """
+    dimension = _dimension_arg()
+    last = _month_arg("to", date.today().replace(day=1))
+    first = _month_arg("from", analytics.add_months(last, 1 - ANALYTICS_TREND_MONTHS))
+    if last < first:
+        abort(400, description="to must not be before from")
+    if analytics.months_between(first, last) > analytics.MAX_MONTHS:
+        abort(400, description=f"at most {analytics.MAX_MONTHS} months per request")
+    limit = request.args.get("limit", analytics.DEFAULT_KEYS, type=int)
+    if not 1 <= limit <= analytics.MAX_KEYS:
+        abort(400, description=f"limit must be between 1 and {analytics.MAX_KEYS}")
+    with get_connection() as conn:
+        pending, oldest = analytics.pending(conn)
+        rows = analytics.rollups(
+            conn, dimension, first, last, key=request.args.get("key"), limit=limit
+        )
+    return jsonify(
+        {
+            "dimension": dimension,
+            "from": first.strftime("%Y-%m"),
+            "to": last.strftime("%Y-%m"),
+            "pending": pending,
+            "pending_since": oldest.isoformat() if oldest else None,
+            "rows": [
+                {**row, "month": row["month"].strftime("%Y-%m")} for row in rows
+            ],
+        }
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(
+        instrumentation.render_metrics(),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
+@app.route("/health/ready")
+def ready():
+    """Readiness probe; fails once the worker starts draining for shutdown."""
+    if serving.draining:
+        return jsonify(status="draining"), 503
+    return jsonify(status="ok")
+
+
+@app.route("/health/db")
+def db_health():
+    return jsonify(dict(db.pool_stats(), replicas=db.replica_stats()))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+import os
+import threading
+from datetime import timedelta
+
+import cache
+import prepared
+
+# Longest window one calendar request may cover, in days.
+MAX_WINDOW_DAYS = int(os.environ.get("CALENDAR_MAX_DAYS", 366))
+CALENDAR_CACHE_SIZE = int(os.environ.get("CALENDAR_CACHE_SIZE", 5000))
+
+# Booked days per property merged into ranges with range_agg (adjacent and
+# back-to-back stays become one range), clipped to the window; free days are
+# the window minus that multirange. One row per range, not per day.
+CALENDAR = prepared.register(
+    "calendar_ranges",
+    """
+    WITH span AS (
+        SELECT daterange(%s::date, %s::date, '[]') AS days
+    ),
+    booked AS (
+        SELECT p.property_id,
+               COALESCE(
+                   range_agg(b.stay * s.days) FILTER (WHERE b.booking_id IS NOT NULL),
+                   '{}'::datemultirange
+               ) AS days
+        FROM "Property Info" p
+        CROSS JOIN span s
+        LEFT JOIN "Bookings" b ON b.property_id = p.property_id AND b.stay && s.days
+        WHERE p.property_id = ANY(%s)
+        GROUP BY p.property_id
+    )
+    SELECT k.property_id, lower(r) AS start_date, upper(r) AS end_date, TRUE AS booked
+    FROM booked k CROSS JOIN LATERAL unnest(k.days) r
+    UNION ALL
+    SELECT k.property_id, lower(r), upper(r), FALSE
+    FROM booked k CROSS JOIN span s
+    CROSS JOIN LATERAL unnest(datemultirange(s.days) - k.days) r
+    ORDER BY property_id, start_date
+    """,
+)
+VERSIONS = prepared.register(
+    "calendar_versions",
+    "SELECT property_id, version FROM booking_versions WHERE property_id = ANY(%s)",
+)
+
+_calendars = cache.TTLCache("calendar", CALENDAR_CACHE_SIZE, ttl=3600)
+_stats = {"queries": 0}
+_stats_lock = threading.Lock()
+
+
+def window_days(start, end):
+    """Days in the inclusive window [start, end]."""
+    return (end - start).days + 1
+
+
+def versions(cur, property_ids):
+    """Booking versions of `property_ids`; never-booked properties count as 0."""
+    prepared.execute(cur, VERSIONS, (list(property_ids),))
+    found = dict(cur.fetchall())
+    return tuple(found.get(pid, 0) for pid in property_ids)
+
+
+def _ranges(cur, property_ids, start, end):
+    """{property_id: [(first_day, last_day, booked), ...]} covering the window."""
+    prepared.execute(cur, CALENDAR, (start, end, list(property_ids)))
+    with _stats_lock:
+        _stats["queries"] += 1
+    ranges = {}
+    for property_id, first, after_last, booked in cur.fetchall():
+        ranges.setdefault(property_id, []).append(
+            (first, after_last - timedelta(days=1), booked)
+        )
+    return ranges
+
+
+def calendars(conn, property_ids, start, end):
+    """
+    Booked and free day ranges of each property over the inclusive window.
+
+    Results are cached per (ids, window) and tagged with the properties'
+    booking versions, read before the ranges so a concurrent booking can only
+    make a cached entry newer than its tag. Unknown ids are left out.
+    """
+    property_ids = tuple(sorted(set(property_ids)))
+    key = (property_ids, start, end)
+    with conn.cursor() as cur:
+        current = versions(cur, property_ids)
+        entry = _calendars.get(key)
+        if entry is not None and entry[0] == current:
+            return entry[1]
+        ranges = _ranges(cur, property_ids, start, end)
+    _calendars.set(key, (current, ranges))
+    return ranges
+
+
+def run_lengths(ranges):
+    """
+    Encode ranges as alternating run lengths in days, starting with a free run.
+
+    [3, 5, 22] over a 30-day window means 3 free days, 5 booked, 22 free; the
+    first run is 0 when the window opens on a booked day.
+    """
+    runs = []
+    for first, last, booked in ranges:
+        if not runs and booked:
+            runs.append(0)
+        runs.append((last - first).days + 1)
+    return runs
+
+
+def days(ranges):
+    """Expand ranges into (day, booked) pairs, for rendering small calendars."""
+    for first, last, booked in ranges:
+        for offset in range((last - first).days + 1):
+            yield first + timedelta(days=offset), booked
+
+
+def collect_metrics():
+    with _stats_lock:
+        queries = _stats["queries"]
+    yield "calendar_queries_total", "Availability calendars computed by the database.", "counter", [
+        ({}, queries)
+    ]
@@ -0,0 +1,84 @@
+import random
+import time
+
+import psycopg2
+import psycopg2.errors
+
+from db import get_connection
+import tasks
+
+# Attempts for transactions aborted by serialization failures or deadlocks.
+MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.02
+
+# Cost is the monthly price scaled by nights / 30, with a one month minimum.
+# Card ownership is enforced by the join: a foreign card yields no row.
+BOOK_QUERY = """
+    INSERT INTO "Bookings"(property_id, renter_email, card_id, start_date, end_date, total_cost, "Property_Type")
+    SELECT p.property_id, c.renter_email, c.card_id, %(start)s, %(end)s,
+           p.price * GREATEST((%(end)s::DATE - %(start)s::DATE) / 30.0, 1), p.type
+    FROM "Property Info" p
+    JOIN "PaymentCard" c ON c.card_id = %(card_id)s AND c.renter_email = %(email)s
+    WHERE p.property_id = %(property_id)s
+    RETURNING booking_id, total_cost
+"""
+
+DIAGNOSE_QUERY = """
+    SELECT EXISTS (SELECT 1 FROM "Property Info" WHERE property_id = %(property_id)s),
+           EXISTS (SELECT 1 FROM "PaymentCard" WHERE card_id = %(card_id)s AND renter_email = %(email)s)
+"""
+
+RETRYABLE = (psycopg2.errors.SerializationFailure, psycopg2.errors.DeadlockDetected)
+
+
+class BookingError(Exception):
+    """A booking was rejected; the message is safe to show to the renter."""
+
+
+class BookingConflict(BookingError):
+    """The requested stay overlaps an existing booking for the property."""
+
+
+class PropertyNotFound(BookingError):
+    pass
+
+
+def create_booking(email, property_id, card_id, start_date, end_date):
+    """
+    Book a property in one INSERT ... SELECT ... RETURNING round trip.
+
+    Returns (booking_id, total_cost). Raises BookingConflict when
+    no_overlap_per_property rejects the stay, PropertyNotFound for an unknown
+    property and BookingError for a card the renter does not own.
+    Serialization failures and deadlocks are retried with jittered
+    exponential backoff.
+    """
+    params = {
+        "email": email,
+        "property_id": property_id,
+        "card_id": card_id,
+        "start": start_date,
+        "end": end_date,
+    }
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(BOOK_QUERY, params)
+                    row = cur.fetchone()
+                    if row is None:
+                        cur.execute(DIAGNOSE_QUERY, params)
+                        property_exists, _ = cur.fetchone()
+                        if not property_exists:
+                            raise PropertyNotFound("Property not found.")
+                        raise BookingError("Select a valid payment card.")
+                tasks.booking_created(conn, row[0])
+            return row
+        except psycopg2.errors.ExclusionViolation as exc:
+            raise BookingConflict(
+                "Those dates overlap an existing booking for this property."
+            ) from exc
+        except RETRYABLE:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            time.sleep(RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Set CACHE_ENABLED=0 (or call set_enabled(False)) to bypass every cache,
+# e.g. in tests that write rows behind the app's back.
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") != "0"
+
+_caches = []
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+
+    Only caches within one process; other workers see a change once their
+    own entry expires, so keep `ttl` short for data that can be edited.
+    """
+
+    def __init__(self, name, maxsize, ttl):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        _caches.append(self)
+
+    @property
+    def active(self):
+        return CACHE_ENABLED and self.maxsize > 0
+
+    def get(self, key, default=None):
+        if not self.active:
+            return default
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                    self._stats["evictions"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if not self.active:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_load(self, key, load):
+        """Return the cached value or call `load()`; None results are not cached."""
+        value = self.get(key)
+        if value is None:
+            value = load()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._stats["invalidations"] += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._data), maxsize=self.maxsize)
+
+
+def set_enabled(enabled):
+    global CACHE_ENABLED
+    CACHE_ENABLED = enabled
+    if not enabled:
+        for cache in _caches:
+            cache.clear()
+
+
+def collect_metrics():
+    """Metric families for instrumentation.add_collector."""
+    snapshots = [(cache.name, cache.stats()) for cache in _caches]
+    for stat in ("hits", "misses", "evictions", "invalidations"):
+        yield f"cache_{stat}_total", f"Cache {stat} by cache.", "counter", [
+            ({"cache": name}, stats[stat]) for name, stats in snapshots
+        ]
+    yield "cache_entries", "Entries held by cache.", "gauge", [
+        ({"cache": name}, stats["size"]) for name, stats in snapshots
+    ]
+
+
+user_cache = TTLCache(
+    "user",
+    int(os.environ.get("USER_CACHE_SIZE", 10_000)),
+    float(os.environ.get("USER_CACHE_TTL", 300)),
+)
+profile_cache = TTLCache(
+    "profile",
+    int(os.environ.get("PROFILE_CACHE_SIZE", 10_000)),
+    float(os.environ.get("PROFILE_CACHE_TTL", 60)),
+)
+
+
+def invalidate_user(email):
+    """Drop everything cached for `email`; call after any write to its rows."""
+    user_cache.invalidate(email)
+    profile_cache.invalidate(("agent", email))
+    profile_cache.invalidate(("renter", email))
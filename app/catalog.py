@@ -0,0 +1,351 @@
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:  # optional: without NumPy every search goes to the database
+    np = None
+
+from search import TRIGRAM_MIN_LENGTH
+
+# Set CATALOG_ENABLED=1 (and install numpy) to filter /search in memory.
+CATALOG_ENABLED = os.environ.get("CATALOG_ENABLED", "0") == "1"
+# Seconds a search may be answered before listing_version is checked again.
+CATALOG_MAX_STALENESS = float(os.environ.get("CATALOG_MAX_STALENESS", 1))
+# Delta refreshes re-read rows stamped up to this many seconds before the
+# newest stamp already loaded, for transactions that committed out of order.
+CATALOG_OVERLAP = float(os.environ.get("CATALOG_OVERLAP", 60))
+# Rows scanned per step; scanning stops once a page is filled.
+SCAN_CHUNK = 16384
+LOAD_BATCH = 50_000
+# Deltas larger than this fraction of the catalog trigger a full rebuild.
+DELTA_REBUILD_FRACTION = 0.05
+
+TYPES = ("house", "apartment", "commercial", "vacation_home", "land")
+_TYPE_CODES = {name: code for code, name in enumerate(TYPES)}
+
+LOAD_QUERY = """
+    SELECT property_id, type, city, state, "Sq_Footage", price, availability, updated_at
+    FROM "Property Info"
+"""
+DELTA_QUERY = LOAD_QUERY + " WHERE updated_at > %s"
+VERSION_QUERY = """
+    SELECT v.version,
+           stats_total('property')
+    FROM listing_version v
+"""
+
+log = logging.getLogger("realestate.catalog")
+
+
+def _cents(price):
+    return int((Decimal(price) * 100).to_integral_value())
+
+
+class _Dictionary:
+    """Append-only string dictionary; codes index `values`."""
+
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.lowered = [value.lower() for value in self.values]
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value):
+        value = value or ""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.lowered.append(value.lower())
+        return code
+
+    def copy(self):
+        return _Dictionary(self.values)
+
+    def matching(self, needle):
+        """Codes matching a /search text filter (see search._text_filter)."""
+        if len(needle) >= TRIGRAM_MIN_LENGTH:
+            return [code for code, value in enumerate(self.lowered) if needle in value]
+        return [code for code, value in enumerate(self.lowered) if value.startswith(needle)]
+
+    def nbytes(self):
+        return sum(sys.getsizeof(value) for value in self.values)
+
+
+class Snapshot:
+    """
+    Immutable columnar copy of the filterable listing columns.
+
+    Rows are sorted like /search results (price ascending, property_id
+    descending), so a price bound or page token becomes a binary search and a
+    page is the first matching rows after it.
+    """
+
+    def __init__(self, columns, cities, states, version, watermark):
+        order = np.lexsort((-columns["ids"], columns["price"]))
+        self.columns = {name: values[order] for name, values in columns.items()}
+        self.cities = cities
+        self.states = states
+        self.version = version
+        self.watermark = watermark
+
+    def __len__(self):
+        return len(self.columns["ids"])
+
+    @classmethod
+    def from_batches(cls, batches, version=None):
+        """Build a snapshot from an iterable of row lists."""
+        cities, states = _Dictionary(), _Dictionary()
+        encoded = [_encode(rows, cities, states) for rows in batches]
+        encoded.append(_encode([], cities, states))
+        columns = {
+            name: np.concatenate([batch[name] for batch, _ in encoded])
+            for name in encoded[0][0]
+        }
+        stamps = [watermark for _, watermark in encoded if watermark is not None]
+        return cls(columns, cities, states, version, max(stamps) if stamps else None)
+
+    def with_changes(self, rows, version):
+        """Return a new snapshot with `rows` (full rows) inserted or replaced."""
+        cities, states = self.cities.copy(), self.states.copy()
+        changed, watermark = _encode(rows, cities, states)
+        keep = ~np.isin(self.columns["ids"], changed["ids"])
+        columns = {
+            name: np.concatenate([values[keep], changed[name]])
+            for name, values in self.columns.items()
+        }
+        if self.watermark is not None and (watermark is None or self.watermark > watermark):
+            watermark = self.watermark
+        return Snapshot(columns, cities, states, version, watermark)
+
+    def page(self, filters, after, limit):
+        """Return the ids of the page's rows plus one look-ahead row."""
+        columns = self.columns
+        ids, price = columns["ids"], columns["price"]
+        lo, hi = 0, len(ids)
+        if "max_price" in filters:
+            hi = int(np.searchsorted(price, _cents(filters["max_price"]), side="right"))
+        if after:
+            cents, last_id = _cents(after[0]), int(after[1])
+            tie_lo = int(np.searchsorted(price, cents, side="left"))
+            tie_hi = int(np.searchsorted(price, cents, side="right"))
+            ties = -ids[tie_lo:tie_hi]
+            lo = max(lo, tie_lo + int(np.searchsorted(ties, -last_id, side="right")))
+
+        predicates = []
+        if "type" in filters:
+            code = _TYPE_CODES.get(filters["type"])
+            if code is None:
+                return []
+            predicates.append((columns["type"], code))
+        for field, dictionary in (("city", self.cities), ("state", self.states)):
+            if field in filters:
+                codes = dictionary.matching(filters[field])
+                if not codes:
+                    return []
+                # Boolean table indexed by code: cheaper than np.isin per chunk.
+                table = np.zeros(len(dictionary.values), dtype=bool)
+                table[codes] = True
+                predicates.append((columns[field], table))
+        if filters.get("only_available"):
+            predicates.append((columns["available"], True))
+
+        found = []
+        needed = limit + 1
+        start = lo
+        while start < hi and needed > 0:
+            end = min(start + SCAN_CHUNK, hi)
+            mask = np.ones(end - start, dtype=bool)
+            for column, wanted in predicates:
+                if isinstance(wanted, np.ndarray):
+                    mask &= wanted[column[start:end]]
+                else:
+                    mask &= column[start:end] == wanted
+            hits = np.flatnonzero(mask)[:needed]
+            found.append(ids[hits + start])
+            needed -= len(hits)
+            start = end
+        return np.concatenate(found).tolist() if found else []
+
+    def nbytes(self):
+        sizes = {name: values.nbytes for name, values in self.columns.items()}
+        sizes["dictionaries"] = self.cities.nbytes() + self.states.nbytes()
+        return sizes
+
+
+def _encode(rows, cities, states):
+    """Turn (id, type, city, state, sqft, price, availability, updated_at) rows into arrays."""
+    count = len(rows)
+    columns = {
+        "ids": np.empty(count, dtype=np.int32),
+        "price": np.empty(count, dtype=np.int64),
+        "type": np.empty(count, dtype=np.uint8),
+        "city": np.empty(count, dtype=np.int32),
+        "state": np.empty(count, dtype=np.int32),
+        "sq_footage": np.empty(count, dtype=np.int32),
+        "available": np.empty(count, dtype=bool),
+    }
+    watermark = None
+    for i, (pid, ptype, city, state, sqft, price, available, updated_at) in enumerate(rows):
+        columns["ids"][i] = pid
+        columns["price"][i] = _cents(price)
+        columns["type"][i] = _TYPE_CODES[ptype]
+        columns["city"][i] = cities.encode(city)
+        columns["state"][i] = states.encode(state)
+        columns["sq_footage"][i] = sqft or 0
+        columns["available"][i] = available
+        if updated_at is not None and (watermark is None or updated_at > watermark):
+            watermark = updated_at
+    return columns, watermark
+
+
+class Catalog:
+    """
+    Process-wide listing catalog answering /search filters from memory.
+
+    Searches with keywords, dates or a radius still need the database
+    (full-text rank, booking overlap and distance order), as do searches
+    before the first load finished.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.checked_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self.stats = {"hits": 0, "fallbacks": 0, "full_loads": 0, "delta_loads": 0}
+
+    @property
+    def available(self):
+        return CATALOG_ENABLED and np is not None
+
+    def load(self, conn):
+        """Read every listing into a fresh snapshot."""
+        with conn.cursor() as cur:
+            cur.execute(VERSION_QUERY)
+            version, _ = cur.fetchone()
+        with conn.cursor(name="catalog_load") as cur:
+            cur.execute(LOAD_QUERY)
+            batches = iter(lambda: cur.fetchmany(LOAD_BATCH), [])
+            self.snapshot = Snapshot.from_batches(batches, version)
+        self.checked_at = time.monotonic()
+        self.stats["full_loads"] += 1
+        log.info("catalog loaded %d listings", len(self.snapshot))
+        return self.snapshot
+
+    def refresh(self, conn):
+        """Apply listing changes since the snapshot if listing_version moved."""
+        snapshot = self.snapshot
+        with conn.cursor() as cur:
+            cur.execute(VERSION_QUERY)
+            version, total = cur.fetchone()
+            if version == snapshot.version:
+                self.checked_at = time.monotonic()
+                return snapshot
+            if snapshot.watermark is None:
+                return self.load(conn)
+            cur.execute(
+                DELTA_QUERY,
+                (snapshot.watermark - timedelta(seconds=CATALOG_OVERLAP),),
+            )
+            rows = cur.fetchall()
+        if len(rows) > DELTA_REBUILD_FRACTION * max(len(snapshot), 1):
+            return self.load(conn)
+        updated = snapshot.with_changes(rows, version) if rows else snapshot
+        if total is not None and len(updated) != total:
+            # Deleted listings leave no updated_at trail; start over.
+            return self.load(conn)
+        updated.version = version
+        self.snapshot = updated
+        self.checked_at = time.monotonic()
+        self.stats["delta_loads"] += 1
+        return updated
+
+    def _current(self, conn, force=False):
+        if not force and time.monotonic() - self.checked_at < CATALOG_MAX_STALENESS:
+            return self.snapshot
+        # One thread refreshes; the others keep answering from the old snapshot.
+        if not self._refresh_lock.acquire(blocking=False):
+            return self.snapshot
+        try:
+            if self.snapshot is None:
+                return self.load(conn)
+            return self.refresh(conn)
+        finally:
+            self._refresh_lock.release()
+
+    def search(self, conn, filters, after, limit, version=None):
+        """
+        Return the page's property ids, or None when the database must answer.
+
+        With `version` (the listing_version a cached result will be tagged
+        with), a snapshot older than that version is refreshed first, and the
+        database answers if it still lags.
+        """
+        if not self.available or any(key in filters for key in ("q", "check_in", "lat")):
+            return None
+        snapshot = self._current(conn)
+        if snapshot is not None and version is not None and snapshot.version < version:
+            snapshot = self._current(conn, force=True)
+            if snapshot is not None and snapshot.version < version:
+                snapshot = None
+        if snapshot is None:
+            self.stats["fallbacks"] += 1
+            return None
+        self.stats["hits"] += 1
+        return snapshot.page(filters, after, limit)
+
+    def footprint(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        sizes = snapshot.nbytes()
+        total = sum(sizes.values())
+        return {
+            "listings": len(snapshot),
+            "bytes": sizes,
+            "total_bytes": total,
+            "bytes_per_million": round(total / max(len(snapshot), 1) * 1_000_000),
+        }
+
+
+_catalog = Catalog()
+
+
+def available():
+    return _catalog.available
+
+
+def search(conn, filters, after, limit, version=None):
+    return _catalog.search(conn, filters, after, limit, version)
+
+
+def load(conn):
+    return _catalog.load(conn)
+
+
+def footprint():
+    return _catalog.footprint()
+
+
+def collect_metrics():
+    footprint = _catalog.footprint()
+    stats = dict(_catalog.stats)
+    yield "catalog_listings", "Listings held by the in-memory catalog.", "gauge", [
+        ({}, footprint["listings"] if footprint else 0)
+    ]
+    yield "catalog_bytes", "Memory used by catalog columns.", "gauge", [
+        ({}, footprint["total_bytes"] if footprint else 0)
+    ]
+    yield "catalog_searches_total", "Searches answered by the catalog or the database.", "counter", [
+        ({"result": "hit"}, stats["hits"]),
+        ({"result": "fallback"}, stats["fallbacks"]),
+    ]
+    yield "catalog_loads_total", "Catalog loads by kind.", "counter", [
+        ({"kind": "full"}, stats["full_loads"]),
+        ({"kind": "delta"}, stats["delta_loads"]),
+    ]
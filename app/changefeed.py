@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import queue
+import random
+import select
+import threading
+import time
+
+import psycopg2
+
+import db
+
+CHANNEL = "listing_changes"
+# Events buffered per subscriber; a subscriber that falls further behind is
+# sent a single "resync" event instead of the backlog.
+SUBSCRIBER_QUEUE = int(os.environ.get("CHANGEFEED_QUEUE", 100))
+# Each open stream holds one of the worker's WEB_THREADS threads (see
+# gunicorn.conf.py). Streams get half of them by default and never all, so
+# page requests always have a thread left.
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 8))
+MAX_SUBSCRIBERS = min(
+    int(os.environ.get("CHANGEFEED_MAX_SUBSCRIBERS", max(WEB_THREADS // 2, 1))),
+    WEB_THREADS - 1,
+)
+# Streams end after about this many seconds and the browser reconnects, so a
+# forgotten tab cannot hold a thread indefinitely and load rebalances.
+MAX_LIFETIME = float(os.environ.get("CHANGEFEED_MAX_LIFETIME", 300))
+# Seconds between SSE keep-alive comments, which also detect closed clients.
+HEARTBEAT_SECONDS = float(os.environ.get("CHANGEFEED_HEARTBEAT", 15))
+RECONNECT_SECONDS = 2.0
+
+log = logging.getLogger("realestate.changefeed")
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, feed, property_ids):
+        self.feed = feed
+        self.property_ids = property_ids
+        self.queue = queue.Queue(SUBSCRIBER_QUEUE)
+
+    def wants(self, event):
+        if not self.property_ids or event.get("more"):
+            return True
+        return any(row[0] in self.property_ids for row in event["rows"])
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.feed.stats["dropped"] += 1
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            self.queue.put_nowait({"table": None, "op": "RESYNC", "rows": [], "more": True})
+
+    def end(self):
+        """Drop anything pending and make the stream finish."""
+        with self.queue.mutex:
+            self.queue.queue.clear()
+        self.queue.put_nowait(None)
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class ChangeFeed:
+    """
+    One LISTEN connection per process, fanned out to in-process subscribers.
+
+    The listener thread starts with the first subscription, so forked workers
+    each get their own, and reconnects with a fresh LISTEN after errors.
+    Subscribers are told to resync after a reconnect since events may be lost.
+    """
+
+    def __init__(self, channel=CHANNEL):
+        self.channel = channel
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {"events": 0, "dropped": 0, "reconnects": 0}
+
+    def subscribe(self, property_ids=()):
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                raise TooManySubscribers("too many open change streams")
+            subscription = Subscription(self, frozenset(property_ids))
+            self._subscribers.add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="changefeed", daemon=True
+                )
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def close_all(self):
+        """End every open stream, e.g. while the worker drains for shutdown."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.end()
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        self.stats["events"] += 1
+        for subscriber in subscribers:
+            if subscriber.wants(event):
+                subscriber.offer(event)
+
+    def _run(self):
+        first = True
+        while True:
+            try:
+                conn = db.connect()
+            except psycopg2.Error:
+                log.exception("change feed cannot connect; retrying")
+                time.sleep(RECONNECT_SECONDS)
+                continue
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                if not first:
+                    self.stats["reconnects"] += 1
+                    self.publish({"table": None, "op": "RESYNC", "rows": [], "more": True})
+                first = False
+                self._listen(conn)
+            except (psycopg2.Error, OSError):
+                log.exception("change feed connection lost; reconnecting")
+                time.sleep(RECONNECT_SECONDS)
+            finally:
+                conn.close()
+
+    def _listen(self, conn):
+        while True:
+            if select.select([conn], [], [], HEARTBEAT_SECONDS) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    event = json.loads(notify.payload)
+                except ValueError:
+                    log.warning("ignoring malformed change payload")
+                    continue
+                self.publish(event)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+feed = ChangeFeed()
+
+
+def sse_stream(subscription):
+    """
+    Yield server-sent events for `subscription` until the client disconnects
+    or the stream reaches its lifetime, jittered so reconnects spread out.
+    """
+    deadline = time.monotonic() + MAX_LIFETIME * random.uniform(0.8, 1.0)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = subscription.queue.get(timeout=min(HEARTBEAT_SECONDS, remaining))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                # Closed by the server; EventSource reconnects after `retry`.
+                return
+            kind = "resync" if event["op"] == "RESYNC" else event["table"]
+            yield f"event: {kind}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+    finally:
+        subscription.close()
+
+
+def collect_metrics():
+    stats = dict(feed.stats)
+    yield "changefeed_subscribers", "Open change stream subscriptions.", "gauge", [
+        ({}, feed.subscriber_count())
+    ]
+    yield "changefeed_events_total", "Change notifications received.", "counter", [
+        ({}, stats["events"])
+    ]
+    yield "changefeed_dropped_total", "Subscriber queues that overflowed.", "counter", [
+        ({}, stats["dropped"])
+    ]
+    yield "changefeed_reconnects_total", "Listener reconnects.", "counter", [
+        ({}, stats["reconnects"])
+    ]
@@ -0,0 +1,93 @@
+import hashlib
+from functools import wraps
+
+from flask import make_response, request, session
+
+from db import get_connection
+
+RENTER_BOOKINGS_QUERY = """
+    SELECT count(*), max(GREATEST(b.updated_at, p.updated_at))
+    FROM "Bookings" b
+    JOIN "Property Info" p ON p.property_id = b.property_id
+    WHERE b.renter_email = %s
+"""
+
+
+def listing_validator():
+    """Validator for pages built from listings, neighborhoods and availability."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version, changed_at FROM listing_version")
+            return cur.fetchone()
+
+
+def search_validator():
+    """listing_validator, except stay-date searches, which depend on bookings."""
+    if request.values.get("check_in") or request.values.get("check_out"):
+        return None
+    return listing_validator()
+
+
+def renter_bookings_validator():
+    """Validator for the logged-in renter's bookings and the listings they show."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(RENTER_BOOKINGS_QUERY, (session["user_email"],))
+            count, changed_at = cur.fetchone()
+    return (count, changed_at and changed_at.isoformat()), changed_at
+
+
+def _is_current(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(validator):
+    """
+    Answer GET requests with 304 Not Modified while the client's copy is current.
+
+    `validator()` returns (token, last_modified) from a query much cheaper than
+    the view, or None when the request cannot be validated; the view only
+    runs when the token changed. The ETag also covers the session user
+    because every page renders their navigation bar. Requests with pending
+    flash messages always render so the messages are shown.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method not in ("GET", "HEAD") or session.get("_flashes"):
+                return view(*args, **kwargs)
+            validated = validator()
+            if validated is None:
+                return view(*args, **kwargs)
+            token, last_modified = validated
+            etag = hashlib.sha1(
+                repr(
+                    (token, session.get("user_email"), session.get("user_type"))
+                ).encode()
+            ).hexdigest()
+            if last_modified is not None:
+                # HTTP dates have one-second resolution.
+                last_modified = last_modified.replace(microsecond=0)
+
+            if _is_current(etag, last_modified):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if "user_email" in session:
+                response.cache_control.private = True
+            return response
+
+        return wrapped
+
+    return decorator
@@ -1,21 +1,486 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
 import psycopg2
-import psycopg2.extras
+import psycopg2.extensions
+import psycopg2.pool
+from flask import g, has_app_context, request, session
+
+from instrumentation import TimingCursor, TimingDictCursor, add_collector
+
+# Connection settings. Adjust credentials as needed for your local setup.
+DB_CONFIG = {
+    "dbname": "realestate_db",
+    "user": "postgres",
+    "password": "1234",
+    "host": "localhost",
+    "port": 5433,
+    "options": "-c search_path=realestate,public",
+}
+
+# Pool sizing can be overridden from the environment without editing this file.
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", 2))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", 20))
+# Seconds a caller waits for a free connection before PoolTimeout is raised.
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))
+# Connections idle longer than this are pinged with SELECT 1 on checkout.
+POOL_CHECK_IDLE = float(os.environ.get("DB_POOL_CHECK_IDLE", 30))
+
+# Optional libpq DSNs. DB_PRIMARY_DSN replaces the connection settings above;
+# DB_REPLICA_DSNS is a comma-separated list of read replicas for views marked
+# @read_only. Without replicas everything runs on the primary.
+PRIMARY_DSN = os.environ.get("DB_PRIMARY_DSN")
+REPLICA_DSNS = [
+    dsn.strip() for dsn in os.environ.get("DB_REPLICA_DSNS", "").split(",") if dsn.strip()
+]
+# After a write, that session's reads stay on the primary for this long.
+REPLICA_STICKY_SECONDS = float(os.environ.get("DB_REPLICA_STICKY_SECONDS", 5))
+# Replicas lagging more than this many seconds are skipped until rechecked.
+REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", 5))
+# Seconds between replay-lag checks, and how long an unreachable replica is ejected.
+REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 5))
+REPLICA_RETRY = float(os.environ.get("DB_REPLICA_RETRY", 30))
+
+
+class PoolTimeout(psycopg2.pool.PoolError):
+    """Raised when no connection becomes free within the acquire timeout."""
+
+
+class Connection(psycopg2.extensions.connection):
+    """Connection that tracks the statements prepared in its session."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.stale_statements = set()
+        # Prepared generated statements, least recently used first.
+        self.dynamic_statements = OrderedDict()
+        self.replica = False
+
+
+def connect(dsn=None, replica=False):
+    """Open a new, unpooled connection to the primary, or to the replica at `dsn`."""
+    factories = {"connection_factory": Connection, "cursor_factory": TimingCursor}
+    dsn = dsn or PRIMARY_DSN
+    if dsn:
+        conn = psycopg2.connect(dsn, options=DB_CONFIG["options"], **factories)
+    else:
+        conn = psycopg2.connect(**DB_CONFIG, **factories)
+    if replica:
+        conn.replica = True
+        conn.set_session(readonly=True)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Thread-safe bounded connection pool.
+
+    Idle connections are handed out most-recently-used first and checked for
+    liveness before use. When all `maxconn` connections are checked out, callers
+    block for up to `timeout` seconds.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, check_idle, factory=connect):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("invalid pool size")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._factory = factory
+        self._cond = threading.Condition()
+        self._idle = []  # list of (conn, returned_at)
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._stats = {
+            "acquired": 0,
+            "created": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    def fill(self):
+        """Open connections until `minconn` are available."""
+        with self._cond:
+            missing = self.minconn - self._size
+            self._size += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            try:
+                conn = self._factory()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["created"] += 1
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"no database connection available after {timeout:.1f}s"
+                        )
+                    waited = True
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    conn, returned_at = None, None
+                    self._size += 1
+                self._in_use += 1
+
+            if conn is None:
+                try:
+                    conn = self._factory()
+                except Exception:
+                    self._forget(in_use=True)
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+            elif not self._is_alive(conn, returned_at):
+                self._discard(conn, in_use=True)
+                continue
+
+            with self._cond:
+                elapsed = time.monotonic() - started
+                self._stats["acquired"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                    self._stats["wait_time_total"] += elapsed
+                    self._stats["wait_time_max"] = max(
+                        self._stats["wait_time_max"], elapsed
+                    )
+            return conn
+
+    def putconn(self, conn, close=False):
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+        if close or conn.closed or self._closed:
+            self._discard(conn, in_use=True)
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                waiting=self._waiting,
+                minconn=self.minconn,
+                maxconn=self.maxconn,
+            )
+        return stats
+
+    def _is_alive(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, conn, in_use):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self._forget(in_use)
+
+    def _forget(self, in_use):
+        with self._cond:
+            self._size -= 1
+            if in_use:
+                self._in_use -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+
+class Replica:
+    """A read replica with its own pool, ejected while unreachable or lagging."""
+
+    LAG_QUERY = """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """
 
+    def __init__(self, name, dsn):
+        self.name = name
+        self.pool = ConnectionPool(
+            0,
+            POOL_MAX,
+            POOL_TIMEOUT,
+            POOL_CHECK_IDLE,
+            factory=lambda: connect(dsn, replica=True),
+        )
+        self.lag = None
+        self.ejected_until = 0.0
+        self.checked_at = 0.0
+        self.checkouts = 0
+        self.ejections = 0
+        self._lock = threading.Lock()
 
+    @property
+    def available(self):
+        return time.monotonic() >= self.ejected_until
+
+    def eject(self, seconds):
+        with self._lock:
+            self.ejected_until = time.monotonic() + seconds
+            self.ejections += 1
+
+    def checkout(self):
+        """Return a connection, or None after ejecting an unhealthy replica."""
+        try:
+            # A saturated replica is not unhealthy: fall back without waiting.
+            conn = self.pool.getconn(timeout=0)
+        except PoolTimeout:
+            return None
+        except psycopg2.Error:
+            self.eject(REPLICA_RETRY)
+            return None
+        if time.monotonic() - self.checked_at >= REPLICA_CHECK_INTERVAL:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(self.LAG_QUERY)
+                    self.lag = float(cur.fetchone()[0])
+                conn.rollback()
+            except psycopg2.Error:
+                self.pool.putconn(conn, close=True)
+                self.eject(REPLICA_RETRY)
+                return None
+            self.checked_at = time.monotonic()
+            if self.lag > REPLICA_MAX_LAG:
+                self.pool.putconn(conn)
+                self.eject(REPLICA_CHECK_INTERVAL)
+                return None
+        with self._lock:
+            self.checkouts += 1
+        return conn
+
+    def stats(self):
+        return dict(
+            self.pool.stats(),
+            name=self.name,
+            available=self.available,
+            lag=self.lag,
+            checkouts=self.checkouts,
+            ejections=self.ejections,
+        )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_replicas = None
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    POOL_MIN, POOL_MAX, POOL_TIMEOUT, POOL_CHECK_IDLE
+                )
+    return _pool
+
+
+def get_replicas():
+    """Return the configured replicas, creating their pools on first use."""
+    global _replicas
+    if _replicas is None:
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = [
+                    Replica(f"replica{i}", dsn) for i, dsn in enumerate(REPLICA_DSNS)
+                ]
+    return _replicas
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def replica_stats():
+    return [replica.stats() for replica in get_replicas()]
+
+
+def read_only(view):
+    """Let the view's queries run on a replica when one is available."""
+
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+
+    return wrapped
+
+
+def _checkout():
+    """Pick the pool for this app context's connection."""
+    if (
+        g.get("db_read_only")
+        and get_replicas()
+        and session.get("db_primary_until", 0) <= time.time()
+    ):
+        # Least busy replica first; fall through to the primary if none is usable.
+        replicas = sorted(
+            (r for r in get_replicas() if r.available),
+            key=lambda r: r.pool.stats()["in_use"],
+        )
+        for replica in replicas:
+            conn = replica.checkout()
+            if conn is not None:
+                return conn, replica.pool
+    pool = get_pool()
+    return pool.getconn(), pool
+
+
+@contextmanager
 def get_connection():
     """
-    Open a new database connection with the search_path set to the realestate schema.
-    Adjust credentials as needed for your local setup.
+    Borrow a pooled connection with the search_path set to the realestate schema.
+
+    Inside a Flask app context every call shares one connection, returned to the
+    pool at teardown; in views marked @read_only it may come from a replica.
+    Each outermost `with` block is its own transaction: it commits on success
+    and rolls back on error, like `with psycopg2_conn:`.
     """
-    return psycopg2.connect(
-        dbname="realestate_db",
-        user="postgres",
-        password="1234",
-        host="localhost",
-        port=5433,
-        options="-c search_path=realestate,public",
-    )
+    if not has_app_context():
+        pool = get_pool()
+        conn = pool.getconn()
+        try:
+            with conn:
+                yield conn
+        finally:
+            pool.putconn(conn)
+        return
+
+    if "db_conn" not in g:
+        g.db_conn, g.db_pool = _checkout()
+        g.db_depth = 0
+    conn = g.db_conn
+    g.db_depth += 1
+    try:
+        if g.db_depth > 1:
+            yield conn
+        else:
+            with conn:
+                yield conn
+    finally:
+        g.db_depth -= 1
+
+
+def release_connection(exc=None):
+    """Return the app context's connection to the pool (teardown hook)."""
+    conn = g.pop("db_conn", None)
+    pool = g.pop("db_pool", None)
+    g.pop("db_depth", None)
+    if conn is not None:
+        pool.putconn(conn)
+
+
+def _remember_write(response):
+    """Keep a session on the primary for a while after a request that may have written."""
+    if (
+        REPLICA_DSNS
+        and request.method not in ("GET", "HEAD", "OPTIONS")
+        and g.get("db_pool") is get_pool()
+    ):
+        session["db_primary_until"] = time.time() + REPLICA_STICKY_SECONDS
+    return response
+
+
+def _pool_metrics():
+    pools = [("primary", pool_stats())] + [(r["name"], r) for r in replica_stats()]
+    yield "db_pool_connections", "Pool connections by state.", "gauge", [
+        ({"pool": name, "state": state}, stats[state])
+        for name, stats in pools
+        for state in ("in_use", "idle")
+    ]
+    yield "db_pool_waiting", "Callers waiting for a connection.", "gauge", [
+        ({"pool": name}, stats["waiting"]) for name, stats in pools
+    ]
+    yield "db_pool_wait_seconds_total", "Time spent waiting for a connection.", "counter", [
+        ({"pool": name}, stats["wait_time_total"]) for name, stats in pools
+    ]
+    yield "db_pool_timeouts_total", "Acquire attempts that timed out.", "counter", [
+        ({"pool": name}, stats["timeouts"]) for name, stats in pools
+    ]
+    replicas = pools[1:]
+    if replicas:
+        yield "db_replica_available", "1 while the replica receives reads.", "gauge", [
+            ({"pool": name}, int(stats["available"])) for name, stats in replicas
+        ]
+        yield "db_replica_lag_seconds", "Replay lag at the last check.", "gauge", [
+            ({"pool": name}, stats["lag"] or 0) for name, stats in replicas
+        ]
+        yield "db_replica_checkouts_total", "Connections served by the replica.", "counter", [
+            ({"pool": name}, stats["checkouts"]) for name, stats in replicas
+        ]
+
+
+def init_app(app):
+    app.after_request(_remember_write)
+    app.teardown_appcontext(release_connection)
+    add_collector(_pool_metrics)
 
 
 def dict_cursor(conn):
-    return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    return conn.cursor(cursor_factory=TimingDictCursor)
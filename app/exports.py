@@ -0,0 +1,153 @@
+import csv
+import io
+import json
+import os
+import uuid
+
+import psycopg2.extras
+
+# Rows fetched per round trip from the server-side cursor.
+EXPORT_ITERSIZE = int(os.environ.get("EXPORT_ITERSIZE", 2000))
+# Rows rendered into each chunk handed to the response or file.
+ROWS_PER_CHUNK = 500
+
+BOOKING_COLUMNS = (
+    "booking_id",
+    "property_id",
+    "street",
+    "city",
+    "state",
+    "zip",
+    "Property_Type",
+    "renter_email",
+    "first_name",
+    "last_name",
+    "card_id",
+    "start_date",
+    "end_date",
+    "total_cost",
+)
+
+LISTING_COLUMNS = (
+    "property_id",
+    "type",
+    "street",
+    "city",
+    "state",
+    "zip",
+    "Sq_Footage",
+    "price",
+    "description",
+    "availability",
+    "latitude",
+    "longitude",
+    "crime_rate",
+    "schools",
+    "vacation_homes",
+    "land",
+)
+
+
+def bookings_query(start=None, end=None, property_id=None, renter_email=None):
+    """Return (sql, params) for bookings whose stay overlaps [start, end]."""
+    clauses = []
+    params = []
+    if start or end:
+        clauses.append("b.stay && daterange(%s, %s, '[]')")
+        params.extend([start, end])
+    if property_id:
+        clauses.append("b.property_id = %s")
+        params.append(property_id)
+    if renter_email:
+        clauses.append("b.renter_email = %s")
+        params.append(renter_email)
+    where_clause = "WHERE " + " AND ".join(clauses) if clauses else ""
+    query = f"""
+        SELECT b.booking_id, b.property_id, p.street, p.city, p.state, p.zip, b."Property_Type",
+               b.renter_email, u.first_name, u.last_name, b.card_id,
+               b.start_date, b.end_date, b.total_cost
+        FROM "Bookings" b
+        JOIN "User" u ON u.email = b.renter_email
+        JOIN "Property Info" p ON p.property_id = b.property_id
+        {where_clause}
+        ORDER BY b.booking_id
+    """
+    return query, params
+
+
+def listings_query(property_id=None):
+    where_clause = "WHERE p.property_id = %s" if property_id else ""
+    query = f"""
+        SELECT p.property_id, p.type, p.street, p.city, p.state, p.zip, p."Sq_Footage", p.price,
+               p.description, p.availability, p.latitude, p.longitude, n.crime_rate, n.schools, n.vacation_homes, n.land
+        FROM "Property Info" p
+        LEFT JOIN "Neighborhood" n ON n.property_id = p.property_id
+        {where_clause}
+        ORDER BY p.property_id
+    """
+    return query, [property_id] if property_id else []
+
+
+def export_query(dataset, start=None, end=None, property_id=None, renter_email=None):
+    """Return (sql, params, columns) for the "bookings" or "listings" export."""
+    if dataset == "bookings":
+        query, params = bookings_query(start, end, property_id, renter_email)
+        return query, params, BOOKING_COLUMNS
+    if dataset == "listings":
+        query, params = listings_query(property_id)
+        return query, params, LISTING_COLUMNS
+    raise ValueError(f"unknown export: {dataset}")
+
+
+def stream_rows(conn, query, params, itersize=None):
+    """
+    Yield rows from a named (server-side) cursor.
+
+    Only `itersize` rows are held client-side at a time, so memory stays flat
+    regardless of result size. The caller's transaction must stay open while
+    the generator is consumed.
+    """
+    name = f"export_{uuid.uuid4().hex}"
+    with conn.cursor(name, cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.itersize = itersize or EXPORT_ITERSIZE
+        cur.execute(query, params)
+        yield from cur
+
+
+def _chunks(rows, render_row, header=""):
+    buffer = io.StringIO()
+    buffer.write(header)
+    count = 0
+    for row in rows:
+        render_row(buffer, row)
+        count += 1
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def to_csv(rows, columns):
+    header = io.StringIO()
+    csv.writer(header).writerow(columns)
+
+    def render(buffer, row):
+        csv.writer(buffer).writerow(row[column] for column in columns)
+
+    return _chunks(rows, render, header.getvalue())
+
+
+def to_ndjson(rows, columns):
+    def render(buffer, row):
+        buffer.write(json.dumps({column: row[column] for column in columns}, default=str))
+        buffer.write("\n")
+
+    return _chunks(rows, render)
+
+
+FORMATS = {
+    "csv": (to_csv, "text/csv"),
+    "ndjson": (to_ndjson, "application/x-ndjson"),
+}
@@ -0,0 +1,48 @@
+# Production settings for `gunicorn -c gunicorn.conf.py wsgi:application`,
+# run from the app/ directory. Every value can be overridden from the
+# environment.
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Threads per worker; each open /events/listings stream holds one, and
+# changefeed.py caps the streams below this from the same WEB_THREADS.
+threads = int(os.environ.get("WEB_THREADS", 8))
+worker_class = "gthread"
+preload_app = True
+# Seconds in-flight requests get to finish after SIGTERM.
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.environ.get("WORKER_TIMEOUT", 60))
+keepalive = 5
+# Recycle workers now and then so slow leaks cannot accumulate.
+max_requests = int(os.environ.get("MAX_REQUESTS", 20000))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get("ACCESS_LOG", "-")
+# Workers share their /metrics through files here (see instrumentation.py).
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="realestate-metrics-"))
+
+
+def on_starting(server):
+    import instrumentation
+
+    instrumentation.clear_metrics_dir()
+
+
+def post_fork(server, worker):
+    import serving
+
+    serving.after_fork()
+
+
+def post_worker_init(worker):
+    import serving
+
+    serving.install_drain_handler()
+
+
+def worker_exit(server, worker):
+    import serving
+
+    serving.shutdown()
@@ -0,0 +1,342 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+import psycopg2.extensions
+import psycopg2.extras
+from flask import g, has_app_context, request
+
+# Statements slower than this are logged with their normalized SQL.
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 50)
+# With several worker processes (gunicorn.conf.py sets this), each writes its
+# metrics to a file here every METRICS_FLUSH_SECONDS and /metrics merges them:
+# counters and histograms are summed over all workers, dead ones included, and
+# gauges are reported per live worker with a pid label. Unset, /metrics shows
+# the serving process only.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+
+slow_log = logging.getLogger("realestate.slow_sql")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query):
+    """Collapse whitespace; statements are already parameterized templates."""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = repr(query)
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+def param_shape(params):
+    """Describe bind parameters by type only, so values never reach the log."""
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def family(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        samples = [("", dict(zip(self.labels, values)), value) for values, value in items]
+        return self.name, self.help, "counter", samples
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def family(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        samples = []
+        for label_values, series in items:
+            labels = dict(zip(self.labels, label_values))
+            for bound, count in zip(self.buckets, series):
+                samples.append(("_bucket", dict(labels, le=str(bound)), count))
+            samples.append(("_bucket", dict(labels, le="+Inf"), series[-1]))
+            samples.append(("_sum", labels, series[-2]))
+            samples.append(("_count", labels, series[-1]))
+        return self.name, self.help, "histogram", samples
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by endpoint.",
+    ("endpoint", "method", "status"),
+)
+REQUEST_QUERIES = Histogram(
+    "db_queries_per_request",
+    "SQL statements issued per request.",
+    ("endpoint",),
+    QUERY_COUNT_BUCKETS,
+)
+DB_TIME = Counter("db_time_seconds_total", "Time spent executing SQL.", ("endpoint",))
+DB_ROWS = Counter("db_rows_total", "Rows returned or affected by SQL.", ("endpoint",))
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.")
+
+_metrics = [REQUEST_LATENCY, REQUEST_QUERIES, DB_TIME, DB_ROWS, SLOW_QUERIES]
+_collectors = []
+_shared_collectors = []
+_flusher = None
+
+
+def add_collector(collect, shared=False):
+    """
+    Register a callable returning extra metric families at scrape time.
+
+    It must return an iterable of (name, help, type, [(labels dict, value), ...]).
+    Families with `shared` describe the database rather than this process;
+    they are collected by the process serving the scrape and never merged.
+    """
+    (_shared_collectors if shared else _collectors).append(collect)
+
+
+def record_query(query, params, elapsed, rows):
+    if has_app_context():
+        stats = g.setdefault("sql_stats", {"queries": 0, "time": 0.0, "rows": 0})
+        stats["queries"] += 1
+        stats["time"] += elapsed
+        stats["rows"] += max(rows, 0)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc()
+        slow_log.warning(
+            "slow query %.1fms rows=%d params=%s sql=%s",
+            elapsed * 1000,
+            rows,
+            param_shape(params),
+            normalize_sql(query),
+        )
+
+
+class _TimedExecute:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, vars, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, None, time.perf_counter() - started, self.rowcount)
+
+
+class TimingCursor(_TimedExecute, psycopg2.extensions.cursor):
+    pass
+
+
+class TimingDictCursor(_TimedExecute, psycopg2.extras.RealDictCursor):
+    pass
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+
+
+def _finish_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or "unmatched"
+    REQUEST_LATENCY.observe(
+        (endpoint, request.method, str(response.status_code)),
+        time.perf_counter() - started,
+    )
+    stats = g.get("sql_stats", {"queries": 0, "time": 0.0, "rows": 0})
+    REQUEST_QUERIES.observe((endpoint,), stats["queries"])
+    if stats["queries"]:
+        DB_TIME.inc((endpoint,), stats["time"])
+        DB_ROWS.inc((endpoint,), stats["rows"])
+    return response
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _collected(collectors):
+    for collect in collectors:
+        for name, help_text, kind, samples in collect():
+            yield name, help_text, kind, [("", labels, value) for labels, value in samples]
+
+
+def _families():
+    """This process's metric families as (name, help, type, [(suffix, labels, value)])."""
+    return [metric.family() for metric in _metrics] + list(_collected(_collectors))
+
+
+def _render(families):
+    lines = []
+    for name, help_text, kind, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return lines
+
+
+def flush(final=False):
+    """Write this process's metrics to METRICS_DIR; `final` when it is exiting."""
+    if not METRICS_DIR:
+        return
+    pid = os.getpid()
+    path = os.path.join(METRICS_DIR, f"{pid}.json")
+    with open(f"{path}.tmp", "w") as out:
+        json.dump({"pid": pid, "final": final, "families": _families()}, out)
+    os.replace(f"{path}.tmp", path)
+
+
+def start_flusher():
+    """Flush this process's metrics every METRICS_FLUSH_SECONDS from a daemon thread."""
+    global _flusher
+    if not METRICS_DIR or _flusher is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            try:
+                flush()
+            except OSError:
+                slow_log.exception("could not write metrics to %s", METRICS_DIR)
+
+    _flusher = threading.Thread(target=run, name="metrics-flush", daemon=True)
+    _flusher.start()
+
+
+def clear_metrics_dir():
+    """Forget the metrics of an earlier server run."""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            os.remove(path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(merged, snapshot, live):
+    for name, help_text, kind, samples in snapshot["families"]:
+        if kind == "gauge" and not live:
+            continue
+        family = merged.setdefault(name, [help_text, kind, {}])
+        for suffix, labels, value in samples:
+            if kind == "gauge":
+                labels = dict(labels, pid=str(snapshot["pid"]))
+            key = (suffix, tuple(labels.items()))
+            family[2][key] = family[2].get(key, 0) + value
+
+
+def _merged_families():
+    """Merge every worker's latest snapshot; dead workers are folded into archive.json."""
+    flush()
+    archive_path = os.path.join(METRICS_DIR, "archive.json")
+    merged = {}
+    with open(os.path.join(METRICS_DIR, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = {}
+        _add(archive, _read(archive_path) or {"pid": 0, "families": []}, live=False)
+        archived = False
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            if path == archive_path:
+                continue
+            snapshot = _read(path)
+            if snapshot is None:
+                continue
+            if snapshot["final"] or not _alive(snapshot["pid"]):
+                _add(archive, snapshot, live=False)
+                os.remove(path)
+                archived = True
+            else:
+                _add(merged, snapshot, live=True)
+        families = _unmerge(archive)
+        if archived:
+            with open(f"{archive_path}.tmp", "w") as out:
+                json.dump({"pid": 0, "final": True, "families": families}, out)
+            os.replace(f"{archive_path}.tmp", archive_path)
+    _add(merged, {"pid": 0, "families": families}, live=False)
+    return _unmerge(merged)
+
+
+def _unmerge(merged):
+    return [
+        (name, help_text, kind, [(suffix, dict(labels), value) for (suffix, labels), value in samples.items()])
+        for name, (help_text, kind, samples) in sorted(merged.items())
+    ]
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format."""
+    families = _merged_families() if METRICS_DIR else _families()
+    lines = _render(families) + _render(_collected(_shared_collectors))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,352 @@
+import logging
+import multiprocessing
+import os
+import random
+import select
+import signal
+import threading
+import time
+import traceback
+
+import psycopg2
+from psycopg2.extras import Json
+
+import db
+from db import dict_cursor
+
+CHANNEL = "jobs"
+# Jobs leased per claim; each then runs and commits in its own transaction.
+CLAIM_BATCH = int(os.environ.get("JOBS_CLAIM_BATCH", 4))
+# Seconds a claimed job stays leased to its worker. A job still leased after
+# that (its worker died or hung) is claimed again as its next attempt, so the
+# lease must cover a whole batch of handlers.
+LEASE_SECONDS = float(os.environ.get("JOBS_LEASE_SECONDS", 300))
+# Idle workers wake on NOTIFY, or after this many seconds for delayed jobs.
+POLL_SECONDS = float(os.environ.get("JOBS_POLL_SECONDS", 5))
+MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 5))
+# Retry n waits BACKOFF_BASE * 2**(n-1) seconds, capped and jittered down by
+# up to half so jobs failing together do not retry together.
+BACKOFF_BASE = float(os.environ.get("JOBS_BACKOFF_BASE", 5))
+BACKOFF_MAX = float(os.environ.get("JOBS_BACKOFF_MAX", 3600))
+RECONNECT_SECONDS = 2.0
+ERROR_LIMIT = 2000
+
+log = logging.getLogger("realestate.jobs")
+
+# Deduplicates against waiting (unleased) jobs only: a job already running
+# may have read the state before this transaction's write, so it needs a
+# successor. The NOT EXISTS check reads without locking. Transactions
+# enqueueing the same key at once do not see each other's copy and each add
+# one, which is cheaper than making every booking wait for the other's
+# commit; the extra copies find nothing left to do.
+ENQUEUE_QUERY = """
+    INSERT INTO jobs(kind, payload, dedupe_key, max_attempts, run_at)
+    SELECT %(kind)s, %(payload)s, %(dedupe_key)s, %(max_attempts)s,
+           now() + %(delay)s * interval '1 second'
+    WHERE %(dedupe_key)s::text IS NULL OR NOT EXISTS (
+        SELECT 1 FROM jobs WHERE dedupe_key = %(dedupe_key)s AND locked_until IS NULL
+    )
+    RETURNING id
+"""
+# Leases due jobs, plus jobs whose lease ran out, counting the attempt up
+# front so a job that kills its worker still uses up its attempts.
+CLAIM_QUERY = """
+    UPDATE jobs j
+    SET attempts = j.attempts + 1,
+        locked_until = now() + %s * interval '1 second',
+        last_error = CASE WHEN j.locked_until IS NULL THEN j.last_error
+                          ELSE 'lease expired before the job finished' END
+    FROM (
+        SELECT id FROM jobs
+        WHERE run_at <= now() AND (locked_until IS NULL OR locked_until <= now())
+        ORDER BY run_at, id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE j.id = due.id
+    RETURNING j.id, j.kind, j.payload, j.attempts, j.max_attempts, j.last_error,
+              extract(epoch FROM now() - j.run_at) AS waited
+"""
+# The attempts check makes these no-ops for a worker whose lease expired and
+# whose job was claimed again by another worker.
+DONE_QUERY = "DELETE FROM jobs WHERE id = %s AND attempts = %s"
+# A job superseded by a waiting copy with the same dedupe_key is not retried.
+RETRY_QUERY = """
+    UPDATE jobs
+    SET run_at = now() + %s * interval '1 second',
+        locked_until = NULL,
+        last_error = %s
+    WHERE id = %s AND attempts = %s
+      AND (dedupe_key IS NULL OR NOT EXISTS (
+          SELECT 1 FROM jobs w WHERE w.dedupe_key = jobs.dedupe_key AND w.locked_until IS NULL
+      ))
+"""
+BURY_QUERY = """
+    WITH dead AS (
+        DELETE FROM jobs WHERE id = %s AND attempts = %s
+        RETURNING id, kind, payload, LEAST(attempts, max_attempts) AS attempts, enqueued_at
+    )
+    INSERT INTO jobs_dead(id, kind, payload, attempts, enqueued_at, last_error)
+    SELECT id, kind, payload, attempts, enqueued_at, %s FROM dead
+"""
+REQUEUE_QUERY = """
+    WITH revived AS (
+        DELETE FROM jobs_dead WHERE %s::text IS NULL OR kind = %s
+        RETURNING kind, payload, enqueued_at
+    )
+    INSERT INTO jobs(kind, payload, enqueued_at)
+    SELECT kind, payload, enqueued_at FROM revived
+"""
+DEPTH_QUERY = """
+    SELECT kind,
+           count(*) FILTER (WHERE run_at <= now()) AS ready,
+           count(*) FILTER (WHERE run_at > now()) AS scheduled,
+           COALESCE(extract(epoch FROM now() - min(run_at) FILTER (WHERE run_at <= now())), 0) AS lag
+    FROM jobs
+    GROUP BY kind
+"""
+DEAD_QUERY = "SELECT kind, count(*) FROM jobs_dead GROUP BY kind"
+
+_handlers = {}
+_enqueued = {}
+_stats_lock = threading.Lock()
+
+
+class UnknownJob(Exception):
+    pass
+
+
+def handler(kind):
+    """
+    Register the decorated function as the handler of `kind` jobs.
+
+    Handlers are called as fn(conn, payload) inside a transaction of their
+    own, which commits with the job's removal; they must not commit
+    themselves. Raising makes the job retry.
+    """
+
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+
+    return register
+
+
+def enqueue(conn, kind, payload=None, dedupe_key=None, delay=0, max_attempts=MAX_ATTEMPTS):
+    """
+    Add a job in `conn`'s current transaction; it becomes visible to workers
+    when that transaction commits. With `dedupe_key`, nothing is added while
+    a committed, unclaimed job with the same key is waiting; concurrent
+    callers may still add one each, so such jobs must be safe to repeat.
+    Returns the job id or None.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            ENQUEUE_QUERY,
+            {
+                "kind": kind,
+                "payload": Json(payload or {}),
+                "dedupe_key": dedupe_key,
+                "max_attempts": max_attempts,
+                "delay": delay,
+            },
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    with _stats_lock:
+        _enqueued[kind] = _enqueued.get(kind, 0) + 1
+    return row[0]
+
+
+def backoff(attempt):
+    """Seconds before retry number `attempt` (1-based)."""
+    delay = min(BACKOFF_BASE * 2 ** (attempt - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _describe(exc):
+    return "".join(traceback.format_exception_only(type(exc), exc)).strip()[:ERROR_LIMIT]
+
+
+def _bury(cur, job, error):
+    cur.execute(BURY_QUERY, (job["id"], job["attempts"], error))
+    log.error("job %s (%s) failed for good: %s", job["id"], job["kind"], error)
+    return "dead"
+
+
+def _fail(cur, job, exc):
+    """Reschedule a failed job, or bury it after its last attempt. Returns the outcome."""
+    error = _describe(exc)
+    if isinstance(exc, UnknownJob) or job["attempts"] >= job["max_attempts"]:
+        return _bury(cur, job, error)
+    cur.execute(RETRY_QUERY, (backoff(job["attempts"]), error, job["id"], job["attempts"]))
+    if not cur.rowcount:
+        # A waiting copy of the job will do the work instead.
+        cur.execute(DONE_QUERY, (job["id"], job["attempts"]))
+    log.warning("job %s (%s) failed, will retry: %s", job["id"], job["kind"], error)
+    return "retried"
+
+
+def run_batch(conn, limit=CLAIM_BATCH):
+    """
+    Lease up to `limit` ready jobs, then run each in its own transaction.
+
+    The lease and the attempt are committed before any handler runs. A job
+    is deleted in the commit of its work; a failure rolls its work back and
+    reschedules it, or moves it to jobs_dead after its last attempt. Returns
+    {"claimed", "done", "retried", "dead", "waited"}, where waited is the
+    summed seconds the jobs spent ready before being claimed.
+    """
+    result = {"claimed": 0, "done": 0, "retried": 0, "dead": 0, "waited": 0.0}
+    with dict_cursor(conn) as cur:
+        cur.execute(CLAIM_QUERY, (LEASE_SECONDS, limit))
+        claimed = []
+        for job in cur.fetchall():
+            result["claimed"] += 1
+            result["waited"] += float(job["waited"])
+            if job["attempts"] > job["max_attempts"]:
+                # Its last attempt never finished.
+                result[_bury(cur, job, job["last_error"])] += 1
+            else:
+                claimed.append(job)
+        conn.commit()
+        for job in claimed:
+            try:
+                run = _handlers.get(job["kind"])
+                if run is None:
+                    raise UnknownJob(f"no handler for {job['kind']!r}")
+                run(conn, job["payload"])
+                cur.execute(DONE_QUERY, (job["id"], job["attempts"]))
+                conn.commit()
+            except Exception as exc:
+                conn.rollback()
+                result[_fail(cur, job, exc)] += 1
+                conn.commit()
+            else:
+                result["done"] += 1
+    return result
+
+
+def _wait(conn, stop, timeout):
+    """Sleep until a NOTIFY on the jobs channel, `stop`, or `timeout` seconds."""
+    if conn.notifies:
+        # Arrived while the last batch ran.
+        conn.notifies.clear()
+        return
+    deadline = time.monotonic() + timeout
+    while not stop.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if select.select([conn], [], [], min(remaining, 1.0)) != ([], [], []):
+            conn.poll()
+            if conn.notifies:
+                conn.notifies.clear()
+                return
+
+
+def work(stop, batch=CLAIM_BATCH, poll=POLL_SECONDS):
+    """Claim and run jobs until `stop` is set. Returns totals like run_batch."""
+    totals = {"claimed": 0, "done": 0, "retried": 0, "dead": 0, "waited": 0.0}
+    conn = None
+    while not stop.is_set():
+        try:
+            if conn is None:
+                conn = db.connect()
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                conn.commit()
+            result = run_batch(conn, batch)
+            for key, value in result.items():
+                totals[key] += value
+            if result["claimed"] < batch:
+                _wait(conn, stop, poll)
+        except (psycopg2.Error, OSError):
+            log.exception("job worker lost its connection; reconnecting")
+            if conn is not None:
+                conn.close()
+                conn = None
+            stop.wait(RECONNECT_SECONDS)
+    if conn is not None:
+        conn.close()
+    return totals
+
+
+def _worker_main(stop, batch, poll):
+    started = time.monotonic()
+    totals = work(stop, batch, poll)
+    log.info(
+        "worker %d stopped after %.0fs: %d done, %d retried, %d dead, %.3fs mean wait",
+        os.getpid(),
+        time.monotonic() - started,
+        totals["done"],
+        totals["retried"],
+        totals["dead"],
+        totals["waited"] / totals["claimed"] if totals["claimed"] else 0.0,
+    )
+
+
+def run_pool(concurrency, batch=CLAIM_BATCH, poll=POLL_SECONDS):
+    """
+    Run `concurrency` worker processes until SIGTERM or SIGINT, then let each
+    finish its current batch. Workers are forked, so they inherit the handlers
+    registered in this process; none may be holding a connection yet.
+    """
+    context = multiprocessing.get_context("fork")
+    stop = context.Event()
+
+    def request_stop(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    workers = [
+        context.Process(target=_worker_main, args=(stop, batch, poll), name=f"jobs-worker-{i}")
+        for i in range(concurrency)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+
+def requeue_dead(conn, kind=None):
+    """Move dead jobs (of `kind`, or all) back onto the queue with fresh attempts."""
+    with conn.cursor() as cur:
+        cur.execute(REQUEUE_QUERY, (kind, kind))
+        return cur.rowcount
+
+
+def collect_metrics():
+    with _stats_lock:
+        enqueued = dict(_enqueued)
+    yield "jobs_enqueued_total", "Jobs enqueued by this process, by kind.", "counter", [
+        ({"kind": kind}, count) for kind, count in sorted(enqueued.items())
+    ]
+
+
+def collect_queue_metrics():
+    """Queue depth read from the database; register with shared=True."""
+    try:
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(DEPTH_QUERY)
+                depth = cur.fetchall()
+                cur.execute(DEAD_QUERY)
+                dead = cur.fetchall()
+    except psycopg2.Error:
+        log.exception("could not read job queue depth")
+        return
+    yield "jobs_ready", "Jobs due to run, including running ones, by kind.", "gauge", [
+        ({"kind": kind}, ready) for kind, ready, _, _ in depth
+    ]
+    yield "jobs_scheduled", "Jobs delayed or waiting to retry, by kind.", "gauge", [
+        ({"kind": kind}, scheduled) for kind, _, scheduled, _ in depth
+    ]
+    yield "jobs_lag_seconds", "Age of the oldest job due to run, by kind.", "gauge", [
+        ({"kind": kind}, float(lag)) for kind, _, _, lag in depth
+    ]
+    yield "jobs_dead", "Jobs moved to the dead-letter table, by kind.", "gauge", [
+        ({"kind": kind}, count) for kind, count in dead
+    ]
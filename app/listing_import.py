@@ -0,0 +1,214 @@
+import csv
+import json
+
+from db import dict_cursor
+
+# Columns accepted in an import file, in staging-table order.
+IMPORT_COLUMNS = (
+    "type",
+    "street",
+    "city",
+    "state",
+    "zip",
+    "sq_ft",
+    "price",
+    "description",
+    "availability",
+    "rooms",
+    "building_type",
+    "business_types",
+    "crime_rate",
+    "schools",
+    "vacation_homes",
+    "land",
+    "latitude",
+    "longitude",
+)
+
+TRUE_VALUES = "('true','t','yes','y','1','on')"
+BOOLEAN_VALUES = "('true','t','yes','y','1','on','false','f','no','n','0','off')"
+
+STAGE_TABLE = f"""
+    CREATE TEMP TABLE listing_stage (
+        row_no INT NOT NULL,
+        {", ".join(f"{column} TEXT" for column in IMPORT_COLUMNS)},
+        property_id INT,
+        error TEXT
+    ) ON COMMIT DROP
+"""
+
+# Mirrors the CHECK, NOT NULL and length constraints of "Property Info",
+# its subtypes and "Neighborhood", so one bad row cannot abort the load.
+VALIDATE = f"""
+    UPDATE listing_stage SET error = NULLIF(concat_ws('; ',
+        CASE WHEN type IS NULL OR type NOT IN ('house','apartment','commercial','vacation_home','land')
+             THEN 'type must be one of house, apartment, commercial, vacation_home, land' END,
+        CASE WHEN street IS NULL THEN 'street is required' END,
+        CASE WHEN city IS NULL THEN 'city is required' END,
+        CASE WHEN price IS NULL THEN 'price is required'
+             WHEN price !~ '^[0-9]{{1,10}}(\\.[0-9]{{1,2}})?$' THEN 'price must be a non-negative amount' END,
+        CASE WHEN sq_ft !~ '^[0-9]{{1,9}}$' THEN 'sq_ft must be a positive integer'
+             WHEN sq_ft::INT = 0 THEN 'sq_ft must be a positive integer' END,
+        CASE WHEN rooms !~ '^[0-9]{{1,9}}$' THEN 'rooms must be a positive integer'
+             WHEN rooms::INT = 0 THEN 'rooms must be a positive integer' END,
+        CASE WHEN type = 'commercial' AND business_types IS NULL
+             THEN 'business_types is required for commercial listings' END,
+        CASE WHEN crime_rate IS NOT NULL AND crime_rate !~ '^-?[0-9]+(\\.[0-9]+)?$'
+             THEN 'crime_rate must be a number' END,
+        CASE WHEN (latitude IS NULL) <> (longitude IS NULL)
+             THEN 'latitude and longitude must be given together' END,
+        CASE WHEN latitude !~ '^-?[0-9]{{1,2}}(\\.[0-9]+)?$' THEN 'latitude must be a number'
+             WHEN abs(latitude::FLOAT8) > 90 THEN 'latitude must be between -90 and 90' END,
+        CASE WHEN longitude !~ '^-?[0-9]{{1,3}}(\\.[0-9]+)?$' THEN 'longitude must be a number'
+             WHEN abs(longitude::FLOAT8) > 180 THEN 'longitude must be between -180 and 180' END,
+        CASE WHEN lower(coalesce(availability, 'true')) NOT IN {BOOLEAN_VALUES}
+             THEN 'availability must be a boolean' END,
+        CASE WHEN lower(coalesce(vacation_homes, 'false')) NOT IN {BOOLEAN_VALUES}
+             THEN 'vacation_homes must be a boolean' END,
+        CASE WHEN lower(coalesce(land, 'false')) NOT IN {BOOLEAN_VALUES}
+             THEN 'land must be a boolean' END,
+        CASE WHEN length(type) > 20 OR length(street) > 200 OR length(city) > 100
+                  OR length(state) > 100 OR length(zip) > 20 OR length(building_type) > 100
+                  OR length(business_types) > 100 OR length(schools) > 200
+             THEN 'value too long' END
+    ), '')
+"""
+
+ASSIGN_IDS = """
+    UPDATE listing_stage
+    SET property_id = nextval(pg_get_serial_sequence('"Property Info"', 'property_id'))
+    WHERE error IS NULL
+"""
+
+FAN_OUT = (
+    f"""
+    INSERT INTO "Property Info"(property_id, type, street, city, state, zip, "Sq_Footage", price, description, availability,
+                                latitude, longitude)
+    SELECT property_id, type, street, city, state, zip, sq_ft::INT, price::NUMERIC(12,2), description,
+           lower(coalesce(availability, 'true')) IN {TRUE_VALUES},
+           latitude::FLOAT8, longitude::FLOAT8
+    FROM listing_stage WHERE error IS NULL
+    """,
+    """
+    INSERT INTO "House"(property_id, "No_of_Rooms")
+    SELECT property_id, rooms::INT FROM listing_stage
+    WHERE error IS NULL AND type = 'house' AND rooms IS NOT NULL
+    """,
+    """
+    INSERT INTO "Apartment"(property_id, "No_of_Rooms", "Building_Type")
+    SELECT property_id, rooms::INT, building_type FROM listing_stage
+    WHERE error IS NULL AND type = 'apartment' AND rooms IS NOT NULL
+    """,
+    """
+    INSERT INTO "Commercial Building"(property_id, "Business_Types", "No_of_Rooms")
+    SELECT property_id, business_types, rooms::INT FROM listing_stage
+    WHERE error IS NULL AND type = 'commercial'
+    """,
+    f"""
+    INSERT INTO "Neighborhood"(property_id, crime_rate, schools, vacation_homes, land)
+    SELECT property_id, crime_rate::REAL, schools,
+           lower(coalesce(vacation_homes, 'false')) IN {TRUE_VALUES},
+           lower(coalesce(land, 'false')) IN {TRUE_VALUES}
+    FROM listing_stage
+    WHERE error IS NULL
+      AND (crime_rate IS NOT NULL OR schools IS NOT NULL
+           OR lower(coalesce(vacation_homes, 'false')) IN {TRUE_VALUES}
+           OR lower(coalesce(land, 'false')) IN {TRUE_VALUES})
+    """,
+)
+
+
+class _CopyStream:
+    """Read-only file object rendering row tuples as CSV, for copy_expert."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._pending = ""
+        self._writer = csv.writer(self)
+        self._done = False
+
+    def write(self, text):
+        self._pending += text
+
+    def read(self, size=-1):
+        while not self._done and (size < 0 or len(self._pending) < size):
+            try:
+                self._writer.writerow(next(self._rows))
+            except StopIteration:
+                self._done = True
+        if size < 0:
+            chunk, self._pending = self._pending, ""
+        else:
+            chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+def detect_format(filename):
+    return "ndjson" if filename.lower().endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+def _records(stream, fmt, rejects):
+    """Yield (row_no, record dict); unparseable rows are appended to `rejects`."""
+    if fmt == "csv":
+        for row_no, record in enumerate(csv.DictReader(stream), start=1):
+            yield row_no, record
+        return
+    for row_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            rejects.append({"row_no": row_no, "error": f"invalid JSON: {exc}"})
+            continue
+        if not isinstance(record, dict):
+            rejects.append({"row_no": row_no, "error": "expected a JSON object"})
+            continue
+        yield row_no, record
+
+
+def _stage_rows(records):
+    for row_no, record in records:
+        values = []
+        for column in IMPORT_COLUMNS:
+            value = record.get(column)
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            value = "" if value is None else str(value).strip()
+            values.append(value)
+        yield (row_no, *values)
+
+
+def import_listings(conn, stream, fmt="csv", dry_run=False):
+    """
+    Load listings from a CSV or NDJSON text stream in a single transaction.
+
+    Rows are streamed into a temporary table with COPY, validated set-wise,
+    and fanned out to "Property Info", its subtype tables and "Neighborhood"
+    with one INSERT ... SELECT each. Invalid rows are skipped and reported.
+    Returns {"imported": int, "rejects": [{"row_no", "error"}, ...]}.
+    """
+    if fmt not in ("csv", "ndjson"):
+        raise ValueError(f"unsupported format: {fmt}")
+    rejects = []
+    with dict_cursor(conn) as cur:
+        cur.execute(STAGE_TABLE)
+        cur.copy_expert(
+            f"COPY listing_stage(row_no, {', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            _CopyStream(_stage_rows(_records(stream, fmt, rejects))),
+        )
+        cur.execute(VALIDATE)
+        cur.execute(
+            "SELECT row_no, error FROM listing_stage WHERE error IS NOT NULL ORDER BY row_no"
+        )
+        rejects.extend(cur.fetchall())
+        rejects.sort(key=lambda reject: reject["row_no"])
+        cur.execute(ASSIGN_IDS)
+        imported = cur.rowcount
+        if dry_run:
+            conn.rollback()
+            return {"imported": imported, "rejects": rejects}
+        for statement in FAN_OUT:
+            cur.execute(statement)
+        cur.execute("DROP TABLE listing_stage")
+    return {"imported": imported, "rejects": rejects}
@@ -0,0 +1,139 @@
+import os
+import threading
+
+import prepared
+from db import dict_cursor
+
+# Matches stored per renter, and listings considered on each side of the
+# budget per location; see the "Renter matches" section of schema.sql.
+MATCHES_PER_RENTER = int(os.environ.get("MATCHES_PER_RENTER", 20))
+MATCH_CANDIDATES = int(os.environ.get("MATCH_CANDIDATES", 50))
+RECOMMENDATIONS_SHOWN = 5
+REFRESH_BATCH = 1000
+# Share of the score for being free on the desired move-in date; stored
+# scores cover the other 0.8 (budget fit and location).
+FREE_ON_MOVE_IN_WEIGHT = 0.2
+
+REFRESH_QUERY = "SELECT refresh_renter_matches(%s::text[], %s, %s)"
+REFRESH_IF_STALE_QUERY = """
+    SELECT refresh_renter_matches(ARRAY[%s]::text[], %s, %s)
+    WHERE NOT EXISTS (
+        SELECT 1 FROM renter_match_state WHERE renter_email = %s AND NOT dirty
+    )
+"""
+DIRTY_QUERY = """
+    SELECT renter_email FROM renter_match_state
+    WHERE dirty AND renter_email > %s
+    ORDER BY renter_email
+    LIMIT %s
+"""
+RENTERS_QUERY = """
+    SELECT email FROM "ProspectiveRenter"
+    WHERE email > %s
+    ORDER BY email
+    LIMIT %s
+"""
+
+# Stored matches in index order, re-ranked with a GiST probe per listing for
+# a booking over the move-in date.
+RECOMMENDED = prepared.register(
+    "renter_recommendations",
+    """
+    SELECT p.property_id, p.type, p.street, p.city, p.state, p.price,
+           m.score + %s::real * f.free AS score, f.free = 1 AS free_on_move_in
+    FROM renter_matches m
+    JOIN "ProspectiveRenter" r ON r.email = m.renter_email
+    JOIN "Property Info" p ON p.property_id = m.property_id AND p.availability
+    CROSS JOIN LATERAL (
+        SELECT CASE
+            WHEN r.desired_move_in_date IS NULL THEN 1
+            WHEN property_free_during(
+                p.property_id,
+                daterange(r.desired_move_in_date, r.desired_move_in_date, '[]')
+            ) THEN 1
+            ELSE 0
+        END AS free
+    ) f
+    WHERE m.renter_email = %s
+    ORDER BY score DESC, p.property_id DESC
+    LIMIT %s
+    """,
+)
+
+_stats = {"read": 0, "dirty": 0, "rebuild": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(reason, renters):
+    with _stats_lock:
+        _stats[reason] += renters
+
+
+def refresh(conn, emails, reason="dirty"):
+    """Recompute the stored matches of `emails`; returns the matches kept."""
+    if not emails:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute(REFRESH_QUERY, (list(emails), MATCHES_PER_RENTER, MATCH_CANDIDATES))
+        kept = cur.fetchone()[0]
+    _count(reason, len(emails))
+    return kept
+
+
+def recommended(conn, email, limit=RECOMMENDATIONS_SHOWN):
+    """
+    Return the renter's best matching listings, refreshing them first if a
+    listing or preference change marked them dirty.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            REFRESH_IF_STALE_QUERY,
+            (email, MATCHES_PER_RENTER, MATCH_CANDIDATES, email),
+        )
+        if cur.rowcount:
+            _count("read", 1)
+    with dict_cursor(conn) as cur:
+        prepared.execute(cur, RECOMMENDED, (FREE_ON_MOVE_IN_WEIGHT, email, limit))
+        return cur.fetchall()
+
+
+def _batches(conn, query, batch):
+    after = ""
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(query, (after, batch))
+            emails = [row[0] for row in cur.fetchall()]
+        if not emails:
+            return
+        yield emails
+        after = emails[-1]
+
+
+def refresh_dirty(conn, batch=REFRESH_BATCH):
+    """Recompute every renter marked dirty, committing per batch. Returns renters refreshed."""
+    refreshed = 0
+    for emails in _batches(conn, DIRTY_QUERY, batch):
+        refresh(conn, emails)
+        conn.commit()
+        refreshed += len(emails)
+    return refreshed
+
+
+def rebuild(conn, batch=REFRESH_BATCH, progress=None):
+    """Build the matches of all renters from scratch, committing per batch."""
+    renters = matches = 0
+    for emails in _batches(conn, RENTERS_QUERY, batch):
+        matches += refresh(conn, emails, reason="rebuild")
+        conn.commit()
+        renters += len(emails)
+        if progress:
+            progress(renters, matches)
+    return renters, matches
+
+
+def collect_metrics():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    yield "renter_match_refreshes_total", "Renters whose matches were recomputed, by trigger.", "counter", [
+        ({"reason": reason}, count) for reason, count in snapshot.items()
+    ]
@@ -0,0 +1,45 @@
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+def page_size(values):
+    """Read `per_page` from request values, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        size = int(values.get("per_page", DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def _serializer(scope):
+    return URLSafeSerializer(current_app.secret_key, salt=f"page:{scope}")
+
+
+def encode_token(scope, key):
+    """Wrap the sort key of the last row shown into an opaque page token."""
+    return _serializer(scope).dumps(list(key))
+
+
+def decode_token(scope, token):
+    """Return the sort key stored in `token`, or None if missing or tampered with."""
+    if not token:
+        return None
+    try:
+        return _serializer(scope).loads(token)
+    except BadSignature:
+        return None
+
+
+def paginate(rows, limit, scope, key):
+    """
+    Split a `limit + 1` row fetch into the page and the token for the next one.
+
+    `key` maps a row to the JSON-serializable values of its ORDER BY columns.
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_token(scope, key(page[-1]))
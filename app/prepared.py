@@ -0,0 +1,180 @@
+import hashlib
+import os
+import re
+import threading
+
+import psycopg2.errors
+import psycopg2.extensions
+
+# Set DB_PREPARE=0 to send every statement as plain text again.
+PREPARE_ENABLED = os.environ.get("DB_PREPARE", "1") != "0"
+# Registered statements prepared per connection at most; beyond this bound
+# they simply run unprepared.
+PREPARE_MAX = int(os.environ.get("DB_PREPARE_MAX", 100))
+# Generated statements (the /search shapes) have their own per-connection
+# budget, evicting the least recently used, so rare filter combinations
+# neither crowd out the hot statements nor pin a slot forever.
+PREPARE_DYNAMIC_MAX = int(os.environ.get("DB_PREPARE_DYNAMIC_MAX", 20))
+
+STATEMENTS = {}  # name -> query with psycopg2 %s placeholders
+DYNAMIC = set()  # names registered through dynamic()
+
+_PLACEHOLDER = re.compile(r"%s|%%")
+_stats = {"prepares": 0, "executes": 0, "reprepares": 0, "unprepared": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def register(name, query):
+    """Register a hot statement under `name` and return the name."""
+    if STATEMENTS.get(name, query) != query:
+        raise ValueError(f"statement {name!r} is already registered")
+    STATEMENTS[name] = query
+    return name
+
+
+def dynamic(prefix, query):
+    """Register a generated query under a name derived from its text."""
+    name = register(f"{prefix}_{hashlib.sha1(query.encode()).hexdigest()[:16]}", query)
+    DYNAMIC.add(name)
+    return name
+
+
+def _numbered(query):
+    """Rewrite %s placeholders as $1, $2, ... for PREPARE."""
+    count = 0
+
+    def replace(match):
+        nonlocal count
+        if match.group() == "%%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    return _PLACEHOLDER.sub(replace, query), count
+
+
+def _count(stat):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def _prepare(cur, name):
+    conn = cur.connection
+    text, _ = _numbered(STATEMENTS[name])
+    if name in conn.stale_statements:
+        cur.execute(f"DEALLOCATE {name}")
+        conn.stale_statements.discard(name)
+    cur.execute(f"PREPARE {name} AS {text}")
+    conn.prepared_statements.add(name)
+    if name in DYNAMIC:
+        conn.dynamic_statements[name] = True
+    _count("prepares")
+
+
+def _forget(conn, name):
+    conn.prepared_statements.discard(name)
+    conn.dynamic_statements.pop(name, None)
+
+
+def _has_room(cur, name, fresh):
+    """Whether `name` may be prepared, evicting old generated statements for it."""
+    conn = cur.connection
+    if name not in DYNAMIC:
+        return len(conn.prepared_statements) - len(conn.dynamic_statements) < PREPARE_MAX
+    if PREPARE_DYNAMIC_MAX <= 0:
+        return False
+    full = len(conn.dynamic_statements) >= PREPARE_DYNAMIC_MAX
+    if full and not fresh:
+        # A failed DEALLOCATE would abort the caller's transaction; evict
+        # when a statement opens one instead.
+        return False
+    while len(conn.dynamic_statements) >= PREPARE_DYNAMIC_MAX:
+        oldest, _ = conn.dynamic_statements.popitem(last=False)
+        conn.prepared_statements.discard(oldest)
+        conn.stale_statements.discard(oldest)
+        _count("evictions")
+        try:
+            cur.execute(f"DEALLOCATE {oldest}")
+        except psycopg2.errors.InvalidSqlStatementName:
+            # The server lost it already.
+            conn.rollback()
+    return True
+
+
+def _execute(cur, name, params, savepoint=False):
+    args = "(" + ", ".join(["%s"] * len(params)) + ")" if params else ""
+    if not savepoint:
+        cur.execute(f"EXECUTE {name}{args}", params)
+    else:
+        # Same round trip; released from a second cursor so `cur` keeps its rows.
+        cur.execute(f"SAVEPOINT prepared_execute; EXECUTE {name}{args}", params)
+        with cur.connection.cursor() as release:
+            release.execute("RELEASE SAVEPOINT prepared_execute")
+    _count("executes")
+
+
+def execute(cur, name, params=()):
+    """
+    Run the registered statement `name` on `cur`, preparing it on first use.
+
+    Prepared statements live as long as the server session, so pooled
+    connections keep them across requests. When the server has lost the
+    statement or its cached plan no longer fits the table (e.g. `SELECT *`
+    after a column was added), the statement is prepared again if it opened
+    the transaction. Inside an open transaction, a statement prepared by an
+    earlier one runs under a savepoint; if it fails that way, the savepoint is
+    rolled back and the query runs unprepared, to be prepared again on the
+    connection's next use.
+    """
+    conn = cur.connection
+    statements = getattr(conn, "prepared_statements", None)
+    fresh = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    if (
+        not PREPARE_ENABLED
+        or statements is None
+        or (name in conn.stale_statements and not fresh)
+        or (name not in statements and not _has_room(cur, name, fresh))
+    ):
+        _count("unprepared")
+        return cur.execute(STATEMENTS[name], params)
+
+    guarded = not fresh and name in statements
+    if name not in statements:
+        _prepare(cur, name)
+    elif name in conn.dynamic_statements:
+        conn.dynamic_statements.move_to_end(name)
+    try:
+        return _execute(cur, name, params, savepoint=guarded)
+    except (
+        psycopg2.errors.InvalidSqlStatementName,
+        psycopg2.errors.FeatureNotSupported,
+    ) as exc:
+        _forget(conn, name)
+        if isinstance(exc, psycopg2.errors.FeatureNotSupported):
+            conn.stale_statements.add(name)
+        if not fresh:
+            if not guarded:
+                raise
+            cur.execute(
+                "ROLLBACK TO SAVEPOINT prepared_execute;"
+                " RELEASE SAVEPOINT prepared_execute"
+            )
+            _count("unprepared")
+            return cur.execute(STATEMENTS[name], params)
+        conn.rollback()
+        _count("reprepares")
+        _prepare(cur, name)
+        return _execute(cur, name, params)
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats, registered=len(STATEMENTS))
+
+
+def collect_metrics():
+    snapshot = stats()
+    yield "db_prepared_events_total", "Prepared statement activity.", "counter", [
+        ({"event": event}, snapshot[event])
+        for event in ("prepares", "executes", "reprepares", "unprepared", "evictions")
+    ]
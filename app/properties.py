@@ -0,0 +1,192 @@
+from db import dict_cursor
+
+PROPERTY_COLUMNS = (
+    "property_id",
+    "type",
+    "street",
+    "city",
+    "state",
+    "zip",
+    "Sq_Footage",
+    "price",
+    "description",
+    "availability",
+    "latitude",
+    "longitude",
+)
+
+# Subtype table and its columns for each property type that has one.
+SUBTYPES = {
+    "house": ("House", ("No_of_Rooms",)),
+    "apartment": ("Apartment", ("No_of_Rooms", "Building_Type")),
+    "commercial": ("Commercial Building", ("Business_Types", "No_of_Rooms")),
+}
+
+NEIGHBORHOOD_COLUMNS = ("crime_rate", "schools", "vacation_homes", "land")
+
+AGGREGATE_QUERY = """
+    SELECT {property_columns},
+           h."No_of_Rooms" AS house_rooms,
+           a."No_of_Rooms" AS apartment_rooms, a."Building_Type" AS apartment_building_type,
+           c."Business_Types" AS commercial_business_types, c."No_of_Rooms" AS commercial_rooms,
+           n.property_id IS NOT NULL AS has_neighborhood,
+           n.crime_rate, n.schools, n.vacation_homes, n.land
+    FROM "Property Info" p
+    LEFT JOIN "House" h ON h.property_id = p.property_id
+    LEFT JOIN "Apartment" a ON a.property_id = p.property_id
+    LEFT JOIN "Commercial Building" c ON c.property_id = p.property_id
+    LEFT JOIN "Neighborhood" n ON n.property_id = p.property_id
+    WHERE p.property_id = ANY(%s)
+""".format(
+    property_columns=", ".join(f'p."{column}"' for column in PROPERTY_COLUMNS)
+)
+
+
+def _subtype_from_row(row):
+    """Return the subtype dict of the row's own type, like the old per-type SELECT."""
+    if row["type"] == "house" and row["house_rooms"] is not None:
+        return {"No_of_Rooms": row["house_rooms"]}
+    if row["type"] == "apartment" and row["apartment_rooms"] is not None:
+        return {
+            "No_of_Rooms": row["apartment_rooms"],
+            "Building_Type": row["apartment_building_type"],
+        }
+    if row["type"] == "commercial" and row["commercial_business_types"] is not None:
+        return {
+            "Business_Types": row["commercial_business_types"],
+            "No_of_Rooms": row["commercial_rooms"],
+        }
+    return {}
+
+
+def _subtype_tables_from_row(row):
+    """Return the subtype tables that currently hold a row for this property."""
+    tables = set()
+    if row["house_rooms"] is not None:
+        tables.add("House")
+    if row["apartment_rooms"] is not None:
+        tables.add("Apartment")
+    if row["commercial_business_types"] is not None:
+        tables.add("Commercial Building")
+    return tables
+
+
+def _aggregate(row):
+    return {
+        "property": {column: row[column] for column in PROPERTY_COLUMNS},
+        "subtype": _subtype_from_row(row),
+        "subtype_tables": _subtype_tables_from_row(row),
+        "neighborhood": (
+            {column: row[column] for column in NEIGHBORHOOD_COLUMNS}
+            if row["has_neighborhood"]
+            else None
+        ),
+    }
+
+
+def load_properties(conn, property_ids):
+    """
+    Load many properties with their subtype and neighborhood in one query.
+
+    Returns {property_id: {"property", "subtype", "subtype_tables", "neighborhood"}};
+    ids that do not exist are absent.
+    """
+    ids = sorted({int(property_id) for property_id in property_ids})
+    if not ids:
+        return {}
+    with dict_cursor(conn) as cur:
+        cur.execute(AGGREGATE_QUERY, (ids,))
+        return {row["property_id"]: _aggregate(row) for row in cur.fetchall()}
+
+
+def load_property(conn, property_id):
+    return load_properties(conn, [property_id]).get(property_id)
+
+
+def _desired_subtype(ptype, subtype):
+    """Return (table, values) for the subtype row the form asks for, or None."""
+    if ptype not in SUBTYPES:
+        return None
+    table, columns = SUBTYPES[ptype]
+    if ptype in ("house", "apartment") and subtype.get("No_of_Rooms") is None:
+        return None
+    return table, {column: subtype.get(column) for column in columns}
+
+
+def save_property(conn, property_id, fields, subtype, neighborhood):
+    """
+    Insert or update a property, writing only the dependent rows that changed.
+
+    `fields` maps PROPERTY_COLUMNS (minus property_id) to values, `subtype` the
+    subtype columns and `neighborhood` the NEIGHBORHOOD_COLUMNS, or None to
+    leave the neighborhood untouched. For updates the current rows are read
+    under a lock on the "Property Info" row, so concurrent edits cannot act on
+    each other's stale subtype. Returns the property id, or None when the
+    property to update no longer exists.
+    """
+    columns = [column for column in PROPERTY_COLUMNS if column != "property_id"]
+    values = [fields[column] for column in columns]
+    existing = None
+    with conn.cursor() as cur:
+        if property_id:
+            cur.execute(
+                'SELECT 1 FROM "Property Info" WHERE property_id = %s FOR UPDATE',
+                (property_id,),
+            )
+            if cur.fetchone() is None:
+                return None
+            existing = load_property(conn, property_id)
+            assignments = ", ".join(f'"{column}" = %s' for column in columns)
+            cur.execute(
+                f'UPDATE "Property Info" SET {assignments} WHERE property_id = %s',
+                values + [property_id],
+            )
+        else:
+            cur.execute(
+                f'''
+                INSERT INTO "Property Info"({", ".join(f'"{column}"' for column in columns)})
+                VALUES ({", ".join(["%s"] * len(columns))})
+                RETURNING property_id
+                ''',
+                values,
+            )
+            property_id = cur.fetchone()[0]
+
+        current_tables = existing["subtype_tables"] if existing else set()
+        current_type = existing["property"]["type"] if existing else None
+        current_values = existing["subtype"] if existing else {}
+        desired = _desired_subtype(fields["type"], subtype)
+        desired_table = desired[0] if desired else None
+
+        for table in sorted(current_tables - {desired_table}):
+            cur.execute(f'DELETE FROM "{table}" WHERE property_id = %s', (property_id,))
+        if desired and not (
+            desired_table in current_tables
+            and current_type == fields["type"]
+            and all(current_values.get(k) == v for k, v in desired[1].items())
+        ):
+            table, row = desired
+            names = ", ".join(f'"{column}"' for column in row)
+            updates = ", ".join(f'"{column}" = EXCLUDED."{column}"' for column in row)
+            cur.execute(
+                f'''
+                INSERT INTO "{table}"(property_id, {names})
+                VALUES (%s, {", ".join(["%s"] * len(row))})
+                ON CONFLICT (property_id) DO UPDATE SET {updates}
+                ''',
+                [property_id, *row.values()],
+            )
+
+        current_neighborhood = existing["neighborhood"] if existing else None
+        if neighborhood is not None and neighborhood != current_neighborhood:
+            cur.execute(
+                '''
+                INSERT INTO "Neighborhood"(property_id, crime_rate, schools, vacation_homes, land)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (property_id) DO UPDATE
+                SET crime_rate = EXCLUDED.crime_rate, schools = EXCLUDED.schools,
+                    vacation_homes = EXCLUDED.vacation_homes, land = EXCLUDED.land
+                ''',
+                [property_id, *(neighborhood[column] for column in NEIGHBORHOOD_COLUMNS)],
+            )
+    return property_id
@@ -0,0 +1,35 @@
+from db import dict_cursor
+
+DRIFT_QUERY = """
+    SELECT r.renter_email,
+           r.bookings_count, c.bookings_count AS expected_count,
+           r.total_spent, c.total_spent AS expected_spent
+    FROM "Rewards_program" r
+    JOIN renter_rewards_recomputed c ON c.renter_email = r.renter_email
+    WHERE r.bookings_count <> c.bookings_count OR r.total_spent <> c.total_spent
+    ORDER BY r.renter_email
+"""
+
+REBUILD_QUERY = """
+    UPDATE "Rewards_program" r
+    SET bookings_count = c.bookings_count, total_spent = c.total_spent
+    FROM renter_rewards_recomputed c
+    WHERE c.renter_email = r.renter_email
+      AND (r.bookings_count <> c.bookings_count OR r.total_spent <> c.total_spent)
+"""
+
+
+def reconcile(conn, fix=False):
+    """
+    Compare maintained rewards counters with a full recount.
+
+    Returns the drifted rows; with `fix` they are rewritten in the same
+    transaction. Bookings are share-locked so no counter moves mid-check.
+    """
+    with dict_cursor(conn) as cur:
+        cur.execute('LOCK TABLE "Bookings" IN SHARE MODE')
+        cur.execute(DRIFT_QUERY)
+        drift = cur.fetchall()
+        if fix and drift:
+            cur.execute(REBUILD_QUERY)
+    return drift
@@ -0,0 +1,295 @@
+import math
+from datetime import datetime
+from decimal import Decimal
+
+from flask import flash
+
+SEARCH_FIELDS = (
+    "q",
+    "city",
+    "state",
+    "type",
+    "max_price",
+    "only_available",
+    "check_in",
+    "check_out",
+    "lat",
+    "lon",
+    "radius_km",
+    "near_address",
+)
+
+# Inputs shorter than a trigram cannot use the trigram indexes, so they are
+# matched as prefixes against the text_pattern_ops indexes instead.
+TRIGRAM_MIN_LENGTH = 3
+
+SELECT_COLUMNS = """
+    p.property_id, p.type, p.street, p.city, p.state, p.zip, p."Sq_Footage", p.price, p.description, p.availability,
+    n.crime_rate, n.schools, n.vacation_homes, n.land
+"""
+
+RANK_EXPR = "ts_rank(p.search_vector, websearch_to_tsquery('english', %s))::float8"
+DISTANCE_EXPR = "geo_distance_km(%s, %s, p.latitude, p.longitude)"
+
+# Must match geo_cell() in schema.sql.
+GEO_CELL_DEGREES = 0.1
+GEO_COLUMNS = 3600
+# Same sphere as geo_distance_km(), so the bounding box never clips the radius.
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 250
+
+
+def geo_cell(lat, lon):
+    """Grid cell key of a point, as stored in "Property Info".geo_cell."""
+    row = math.floor((lat + 90) / GEO_CELL_DEGREES)
+    return row * GEO_COLUMNS + min(math.floor((lon + 180) / GEO_CELL_DEGREES), GEO_COLUMNS - 1)
+
+
+def bounding_box(lat, lon, radius_km):
+    """Return (lat_lo, lat_hi, lon_lo, lon_hi) enclosing the radius."""
+    dlat = radius_km / KM_PER_DEGREE
+    lat_lo, lat_hi = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    # Degrees of longitude shrink towards the poles; size the box for the
+    # edge furthest from the equator.
+    widest = math.cos(math.radians(max(abs(lat_lo), abs(lat_hi))))
+    if widest * KM_PER_DEGREE * 180 <= radius_km:
+        return lat_lo, lat_hi, -180.0, 180.0
+    dlon = radius_km / (KM_PER_DEGREE * widest)
+    # Boxes crossing the antimeridian are clipped at +/-180 for now.
+    return lat_lo, lat_hi, max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+
+def cell_ranges(lat, lon, radius_km):
+    """Return inclusive (first, last) geo_cell ranges covering the radius, one per grid row."""
+    lat_lo, lat_hi, lon_lo, lon_hi = bounding_box(lat, lon, radius_km)
+    first_column = geo_cell(0.0, lon_lo) % GEO_COLUMNS
+    last_column = geo_cell(0.0, lon_hi) % GEO_COLUMNS
+    ranges = []
+    for row in range(geo_cell(lat_lo, 0.0) // GEO_COLUMNS, geo_cell(lat_hi, 0.0) // GEO_COLUMNS + 1):
+        first, last = row * GEO_COLUMNS + first_column, row * GEO_COLUMNS + last_column
+        if ranges and ranges[-1][1] + 1 == first:
+            # Whole rows are adjacent keys; scan them as one range.
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((first, last))
+    return ranges
+
+
+def parse_filters(values, origin=None):
+    """
+    Normalize submitted search fields; an empty form shows available listings.
+
+    `origin` is a (latitude, longitude) already resolved by the caller (e.g.
+    from a saved address) and takes the place of the lat/lon fields.
+    """
+    if not any(field in values for field in SEARCH_FIELDS):
+        return {"only_available": True}
+    filters = {}
+    for field in ("q", "city", "state"):
+        value = (values.get(field) or "").strip().lower()
+        if value:
+            filters[field] = value
+    if values.get("type"):
+        filters["type"] = values.get("type")
+    if values.get("max_price"):
+        try:
+            filters["max_price"] = Decimal(values.get("max_price"))
+        except ArithmeticError:
+            flash("Max price must be a number.", "warning")
+    if values.get("only_available"):
+        filters["only_available"] = True
+    stay = _parse_stay(values.get("check_in"), values.get("check_out"))
+    if stay:
+        filters["check_in"], filters["check_out"] = stay
+    near = _parse_origin(values, origin)
+    if near:
+        filters["lat"], filters["lon"], filters["radius_km"] = near
+    return filters
+
+
+def _parse_origin(values, origin):
+    """Return (lat, lon, radius_km) for a radius search, or None."""
+    if origin is None:
+        if not (values.get("lat") or values.get("lon")):
+            return None
+        try:
+            origin = float(values.get("lat")), float(values.get("lon"))
+        except (TypeError, ValueError):
+            flash("Latitude and longitude must both be numbers.", "warning")
+            return None
+    lat, lon = origin
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        flash("Latitude must be within ±90 and longitude within ±180.", "warning")
+        return None
+    radius = DEFAULT_RADIUS_KM
+    if values.get("radius_km"):
+        try:
+            radius = float(values.get("radius_km"))
+        except ValueError:
+            flash("Radius must be a number.", "warning")
+            return None
+        if not 0 < radius <= MAX_RADIUS_KM:
+            flash(f"Radius must be between 0 and {MAX_RADIUS_KM} km.", "warning")
+            return None
+    return round(lat, 6), round(lon, 6), radius
+
+
+def _parse_stay(check_in_raw, check_out_raw):
+    """Return (check_in, check_out) dates; a lone date means that single day."""
+    if not (check_in_raw or check_out_raw):
+        return None
+    try:
+        check_in = datetime.strptime(check_in_raw or check_out_raw, "%Y-%m-%d").date()
+        check_out = datetime.strptime(check_out_raw or check_in_raw, "%Y-%m-%d").date()
+    except ValueError:
+        flash("Dates must be in YYYY-MM-DD format.", "warning")
+        return None
+    if check_out < check_in:
+        flash("Check-out must not be before check-in.", "warning")
+        return None
+    return check_in, check_out
+
+
+def _like_escape(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _text_filter(column, value):
+    """Substring match via trigram index, or prefix match for short input."""
+    if len(value) >= TRIGRAM_MIN_LENGTH:
+        return f"LOWER({column}) LIKE %s", f"%{_like_escape(value)}%"
+    return f"LOWER({column}) LIKE %s", f"{_like_escape(value)}%"
+
+
+def preparable(filters):
+    """
+    Whether the page query for `filters` may run as a prepared statement.
+
+    A generic plan cannot turn a parameterized prefix `LIKE` into a range on
+    the text_pattern_ops indexes, so short text inputs run unprepared.
+    """
+    return all(
+        len(filters[field]) >= TRIGRAM_MIN_LENGTH
+        for field in ("city", "state")
+        if field in filters
+    )
+
+
+def where_clauses(filters):
+    """Return (clauses, params) for the non-pagination search filters."""
+    clauses = []
+    params = []
+    if "q" in filters:
+        clauses.append("p.search_vector @@ websearch_to_tsquery('english', %s)")
+        params.append(filters["q"])
+    for field in ("city", "state"):
+        if field in filters:
+            clause, param = _text_filter(f"p.{field}", filters[field])
+            clauses.append(clause)
+            params.append(param)
+    if "type" in filters:
+        clauses.append("p.type = %s")
+        params.append(filters["type"])
+    if "max_price" in filters:
+        clauses.append("p.price <= %s")
+        params.append(filters["max_price"])
+    if filters.get("only_available"):
+        clauses.append("p.availability = TRUE")
+    if "check_in" in filters:
+        # Anti-join probing the no_overlap_per_property GiST index
+        clauses.append(
+            """NOT EXISTS (
+                SELECT 1 FROM "Bookings" b
+                WHERE b.property_id = p.property_id
+                  AND b.stay && daterange(%s, %s, '[]')
+            )"""
+        )
+        params.extend([filters["check_in"], filters["check_out"]])
+    if "lat" in filters:
+        lat, lon, radius = filters["lat"], filters["lon"], filters["radius_km"]
+        ranges = cell_ranges(lat, lon, radius)
+        # Index range scans per grid row, then the box and exact distance.
+        clauses.append(
+            "(" + " OR ".join(["p.geo_cell BETWEEN %s AND %s"] * len(ranges)) + ")"
+        )
+        for first, last in ranges:
+            params.extend([first, last])
+        lat_lo, lat_hi, lon_lo, lon_hi = bounding_box(lat, lon, radius)
+        clauses.append("p.latitude BETWEEN %s AND %s AND p.longitude BETWEEN %s AND %s")
+        params.extend([lat_lo, lat_hi, lon_lo, lon_hi])
+        clauses.append(f"{DISTANCE_EXPR} <= %s")
+        params.extend([lat, lon, radius])
+    return clauses, params
+
+
+def build_query(filters, after, limit):
+    """
+    Build the page query for `filters`, continuing after the sort key `after`.
+
+    Radius searches are ordered by distance, free-text searches by rank and
+    everything else by price.
+    """
+    clauses, params = where_clauses(filters)
+    ranked = "q" in filters
+    select_params = []
+    if "lat" in filters:
+        origin = [filters["lat"], filters["lon"]]
+        columns = SELECT_COLUMNS + f", {DISTANCE_EXPR} AS distance_km"
+        select_params.extend(origin)
+        order_by = "distance_km ASC, p.property_id DESC"
+        if after:
+            clauses.append(
+                f"({DISTANCE_EXPR} > %s OR ({DISTANCE_EXPR} = %s AND p.property_id < %s))"
+            )
+            distance = float(after[0])
+            params.extend(origin + [distance] + origin + [distance, after[1]])
+    elif ranked:
+        columns = SELECT_COLUMNS + f", {RANK_EXPR} AS rank"
+        select_params.append(filters["q"])
+        order_by = "rank DESC, p.property_id DESC"
+        if after:
+            clauses.append(f"({RANK_EXPR}, p.property_id) < (%s, %s)")
+            params.extend([filters["q"], float(after[0]), after[1]])
+    else:
+        columns = SELECT_COLUMNS
+        order_by = "p.price ASC, p.property_id DESC"
+        if after:
+            # The leading price >= bound is what lets the index scan start at
+            # the cursor; the OR alone would only be applied as a filter.
+            price = Decimal(after[0])
+            clauses.append(
+                "p.price >= %s AND (p.price > %s OR (p.price = %s AND p.property_id < %s))"
+            )
+            params.extend([price, price, price, after[1]])
+
+    where_clause = "WHERE " + " AND ".join(clauses) if clauses else ""
+    query = f"""
+        SELECT {columns}
+        FROM "Property Info" p
+        LEFT JOIN "Neighborhood" n ON n.property_id = p.property_id
+        {where_clause}
+        ORDER BY {order_by}
+        LIMIT %s
+    """
+    return query, select_params + params + [limit + 1]
+
+
+# Full rows for ids picked by the in-memory catalog, in /search price order.
+BY_IDS_QUERY = f"""
+    SELECT {SELECT_COLUMNS}
+    FROM "Property Info" p
+    LEFT JOIN "Neighborhood" n ON n.property_id = p.property_id
+    WHERE p.property_id = ANY(%s)
+    ORDER BY p.price ASC, p.property_id DESC
+"""
+
+
+def row_key(filters):
+    """Return the function extracting a row's sort key for page tokens."""
+    if "lat" in filters:
+        return lambda p: (p["distance_km"], p["property_id"])
+    if "q" in filters:
+        return lambda p: (p["rank"], p["property_id"])
+    return lambda p: (str(p["price"]), p["property_id"])
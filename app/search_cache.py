@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import random
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+import cache
+
+# "memory" caches per process, "postgres" shares entries between workers
+# through the unlogged search_cache table, "off" disables the cache.
+SEARCH_CACHE_BACKEND = os.environ.get("SEARCH_CACHE_BACKEND", "memory")
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 2000))
+# Fraction of postgres-backend writes that also trim the table.
+PRUNE_PROBABILITY = 0.02
+
+
+def cache_key(kind, filters=None, after=None, limit=None):
+    """Stable key for a result page: the normalized filters plus paging."""
+
+    def normalize(value):
+        if isinstance(value, Decimal):
+            return str(value.normalize())
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+    parts = [kind, sorted((k, normalize(v)) for k, v in (filters or {}).items())]
+    parts.extend([list(after) if after else None, limit])
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _encode(value):
+    # Tagged so decoding restores the types the rows were read with.
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"cannot cache a {type(value).__name__} column value")
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        if "$decimal" in obj:
+            return Decimal(obj["$decimal"])
+        if "$datetime" in obj:
+            return datetime.fromisoformat(obj["$datetime"])
+        if "$date" in obj:
+            return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def dumps(rows):
+    """Serialize result rows as JSON; Decimal, datetime and date are tagged."""
+    return json.dumps(rows, default=_encode, separators=(",", ":"))
+
+
+def loads(payload):
+    return json.loads(payload, object_hook=_decode)
+
+
+class MemoryBackend:
+    def __init__(self, maxsize):
+        self._entries = cache.TTLCache("search", maxsize, ttl=3600)
+
+    def lookup(self, conn, key):
+        version = current_version(conn)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return version, entry[1]
+        return version, None
+
+    def store(self, conn, key, version, rows):
+        self._entries.set(key, (version, rows))
+
+
+class PostgresBackend:
+    """Entries live in search_cache; a hit is one round trip including the version check."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+
+    def lookup(self, conn, key):
+        if conn.replica:
+            # Unlogged tables are not readable on a standby.
+            return current_version(conn), None
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT v.version, c.payload
+                FROM listing_version v
+                LEFT JOIN search_cache c ON c.key = %s AND c.version = v.version
+                """,
+                (key,),
+            )
+            version, payload = cur.fetchone()
+        return version, loads(payload) if payload is not None else None
+
+    def store(self, conn, key, version, rows):
+        if conn.replica:
+            return
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO search_cache(key, version, payload) VALUES (%s, %s, %s)
+                ON CONFLICT (key) DO UPDATE
+                SET version = EXCLUDED.version, payload = EXCLUDED.payload, created_at = now()
+                """,
+                (key, version, dumps(rows)),
+            )
+            if random.random() < PRUNE_PROBABILITY:
+                cur.execute(
+                    """
+                    DELETE FROM search_cache
+                    WHERE version < %s
+                       OR key IN (SELECT key FROM search_cache ORDER BY created_at DESC OFFSET %s)
+                    """,
+                    (version, self.maxsize),
+                )
+
+
+_BACKENDS = {"memory": MemoryBackend, "postgres": PostgresBackend}
+_backend = None
+_backend_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _get_backend():
+    global _backend
+    if _backend is None and SEARCH_CACHE_BACKEND in _BACKENDS:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _BACKENDS[SEARCH_CACHE_BACKEND](SEARCH_CACHE_SIZE)
+    return _backend
+
+
+def current_version(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM listing_version")
+        return cur.fetchone()[0]
+
+
+def fetch(conn, key, load):
+    """
+    Return the cached rows for `key`, or run `load(version)` and cache its result.
+
+    Entries are tagged with the listing version read before `load` runs, so a
+    concurrent write can only make the cached rows newer than their tag.
+    `load` receives that version (None when caching is off) and must not
+    answer from data older than it.
+    """
+    backend = _get_backend()
+    if backend is None or not cache.CACHE_ENABLED:
+        return load(None)
+    version, rows = backend.lookup(conn, key)
+    with _stats_lock:
+        _stats["hits" if rows is not None else "misses"] += 1
+    if rows is None:
+        rows = [dict(row) for row in load(version)]
+        backend.store(conn, key, version, rows)
+    return rows
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+    snapshot["backend"] = SEARCH_CACHE_BACKEND
+    return snapshot
+
+
+def collect_metrics():
+    snapshot = stats()
+    labels = {"backend": snapshot["backend"]}
+    yield "search_cache_hits_total", "Search result cache hits.", "counter", [(labels, snapshot["hits"])]
+    yield "search_cache_misses_total", "Search result cache misses.", "counter", [(labels, snapshot["misses"])]
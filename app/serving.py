@@ -0,0 +1,71 @@
+import logging
+import signal
+import time
+
+import catalog
+import changefeed
+import db
+import instrumentation
+
+log = logging.getLogger("realestate.serving")
+
+draining = False
+
+
+def warm_templates(app):
+    """Compile every template into the Jinja cache so no request pays for it."""
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def before_fork(app):
+    """
+    Warm-up run once in the master process before workers fork.
+
+    Compiled templates and the listing catalog are then shared copy-on-write
+    by all workers. Nothing here may leave a database connection open.
+    """
+    started = time.monotonic()
+    count = warm_templates(app)
+    if catalog.available():
+        conn = db.connect()
+        try:
+            catalog.load(conn)
+        finally:
+            conn.close()
+    log.info("compiled %d templates in %.2fs", count, time.monotonic() - started)
+
+
+def after_fork():
+    """Open each worker's pool connections before it accepts requests."""
+    db.get_pool().fill()
+    instrumentation.start_flusher()
+
+
+def begin_drain(signum=None, frame=None):
+    """Stop advertising readiness and end open event streams."""
+    global draining
+    draining = True
+    changefeed.feed.close_all()
+
+
+def install_drain_handler():
+    """Run begin_drain before the server's own SIGTERM handling."""
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle(signum, frame):
+        begin_drain()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle)
+
+
+def shutdown():
+    """Close this worker's idle pooled connections and hand over its metrics."""
+    instrumentation.flush(final=True)
+    db.get_pool().closeall()
+    for replica in db.get_replicas():
+        replica.pool.closeall()
@@ -0,0 +1,137 @@
+import os
+
+from db import dict_cursor
+
+# Log rows folded into table_stats per statement by the stats.fold job;
+# `flask stats-refresh` folds until the log is empty.
+FOLD_BATCH = int(os.environ.get("STATS_FOLD_BATCH", 5000))
+
+# Read dashboard totals from pg_class.reltuples instead of the rollup table.
+# Estimates are only as fresh as the last ANALYZE/autovacuum.
+STATS_APPROXIMATE = os.environ.get("STATS_APPROXIMATE") == "1"
+
+# Breakdown dimension -> (ORDER BY, rows shown or None for all).
+BREAKDOWNS = {
+    "property_type": ("row_count DESC, key", None),
+    "property_availability": ("row_count DESC, key", None),
+    "property_city": ("row_count DESC, key", 10),
+    "booking_month": ("key DESC", 12),
+}
+# One index range scan per dimension on idx_table_stats_top (or the primary
+# key for months), so only the rows shown are read.
+BREAKDOWN_QUERY = " UNION ALL ".join(
+    f"""(SELECT dimension, key, row_count FROM table_stats
+         WHERE dimension = '{dimension}' AND row_count > 0
+         ORDER BY {order} LIMIT {limit or 'ALL'})"""
+    for dimension, (order, limit) in BREAKDOWNS.items()
+)
+TOTALS_QUERY = "SELECT stats_total('property') AS property, stats_total('booking') AS booking"
+FOLD_QUERY = "SELECT fold_table_stats_log(%s)"
+# The lock fold_table_stats_log tries; held until commit.
+FOLD_LOCK_QUERY = "SELECT pg_advisory_xact_lock(hashtext('fold_table_stats_log'))"
+
+REBUILD_QUERY = """
+    INSERT INTO table_stats(dimension, key, row_count)
+    SELECT 'property', 'total', COUNT(*) FROM "Property Info"
+    UNION ALL
+    SELECT 'property_type', type, COUNT(*) FROM "Property Info" GROUP BY type
+    UNION ALL
+    SELECT 'property_city', city, COUNT(*) FROM "Property Info" GROUP BY city
+    UNION ALL
+    SELECT 'property_state', COALESCE(state, ''), COUNT(*) FROM "Property Info" GROUP BY state
+    UNION ALL
+    SELECT 'property_place', place_key(city, state), COUNT(*) FROM "Property Info"
+    GROUP BY place_key(city, state)
+    UNION ALL
+    SELECT 'property_availability', availability::TEXT, COUNT(*) FROM "Property Info" GROUP BY availability
+    UNION ALL
+    SELECT 'booking', 'total', COUNT(*) FROM "Bookings"
+    UNION ALL
+    SELECT 'booking_month', to_char(start_date, 'YYYY-MM'), COUNT(*) FROM "Bookings"
+    GROUP BY to_char(start_date, 'YYYY-MM')
+"""
+
+
+def _estimated_totals(cur):
+    cur.execute(
+        """
+        SELECT relname, reltuples::BIGINT AS estimate
+        FROM pg_class
+        WHERE oid IN ('"Property Info"'::regclass, '"Bookings"'::regclass)
+        """
+    )
+    estimates = {row["relname"]: row["estimate"] for row in cur.fetchall()}
+    # reltuples is -1 until the table has been analyzed once
+    return {
+        "property": estimates.get("Property Info", -1),
+        "booking": estimates.get("Bookings", -1),
+    }
+
+
+def dashboard_stats(conn, approximate=None):
+    """
+    Return totals and per-dimension breakdowns for the agent dashboard.
+
+    Totals add the deltas not yet folded, so they are exact; breakdowns read
+    only the top rows of each dimension from table_stats and lag by whatever
+    the stats.fold job has not folded yet. The cost does not grow with the
+    size of the listings or bookings tables.
+    """
+    approximate = STATS_APPROXIMATE if approximate is None else approximate
+    with dict_cursor(conn) as cur:
+        cur.execute(BREAKDOWN_QUERY)
+        rows = cur.fetchall()
+        totals = _estimated_totals(cur) if approximate else {}
+        if not totals or min(totals.values()) < 0:
+            cur.execute(TOTALS_QUERY)
+            totals = cur.fetchone()
+
+    breakdowns = {dimension: [] for dimension in BREAKDOWNS}
+    for row in rows:
+        breakdowns[row["dimension"]].append((row["key"], row["row_count"]))
+    return {
+        "property_count": totals["property"],
+        "booking_count": totals["booking"],
+        "approximate": approximate,
+        **breakdowns,
+    }
+
+
+def fold(conn, batch=FOLD_BATCH):
+    """
+    Fold up to `batch` pending log rows into table_stats. Returns rows folded,
+    or None when another fold is running.
+    """
+    with conn.cursor() as cur:
+        cur.execute(FOLD_QUERY, (batch,))
+        return cur.fetchone()[0]
+
+
+def fold_all(conn, batch=FOLD_BATCH, progress=None):
+    """
+    Fold the whole log, committing per batch. Returns rows folded. Each batch
+    waits for a running fold instead of stopping at it.
+    """
+    total = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(FOLD_LOCK_QUERY)
+        folded = fold(conn, batch)
+        conn.commit()
+        if not folded:
+            return total
+        total += folded
+        if progress:
+            progress(total)
+
+
+def rebuild(conn):
+    """Recompute table_stats from the base tables in one transaction."""
+    with conn.cursor() as cur:
+        cur.execute('LOCK TABLE "Property Info", "Bookings" IN SHARE MODE')
+        # Wait out a running fold, then drop the deltas the counts below include.
+        cur.execute(FOLD_LOCK_QUERY)
+        cur.execute("DELETE FROM table_stats_log")
+        cur.execute("DELETE FROM table_stats")
+        cur.execute(REBUILD_QUERY)
+        return cur.rowcount
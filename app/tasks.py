@@ -0,0 +1,96 @@
+import logging
+
+import analytics
+import jobs
+import matches
+import stats
+from db import dict_cursor
+
+log = logging.getLogger("realestate.tasks")
+
+ANALYTICS_FOLD = "analytics.fold"
+MATCHES_REFRESH = "matches.refresh"
+STATS_FOLD = "stats.fold"
+BOOKING_CONFIRMATION = "booking.confirmation"
+# A fold job that finds another fold running tries again after this many
+# seconds: the running fold may have missed the rows that queued it.
+FOLD_BUSY_DELAY = 1
+
+CONFIRMATION_QUERY = """
+    SELECT b.booking_id, b.start_date, b.end_date, b.total_cost, b.renter_email,
+           u.first_name, p.street, p.city
+    FROM "Bookings" b
+    JOIN "User" u ON u.email = b.renter_email
+    JOIN "Property Info" p ON p.property_id = b.property_id
+    WHERE b.booking_id = %s
+"""
+
+
+def booking_created(conn, booking_id):
+    """Queue the follow-up work of a new booking in the booking's transaction."""
+    jobs.enqueue(conn, BOOKING_CONFIRMATION, {"booking_id": booking_id})
+    jobs.enqueue(conn, ANALYTICS_FOLD, dedupe_key=ANALYTICS_FOLD)
+    jobs.enqueue(conn, STATS_FOLD, dedupe_key=STATS_FOLD)
+
+
+def listings_changed(conn):
+    """Queue the follow-up work of listing writes in their transaction."""
+    jobs.enqueue(conn, MATCHES_REFRESH, dedupe_key=MATCHES_REFRESH)
+    jobs.enqueue(conn, ANALYTICS_FOLD, dedupe_key=ANALYTICS_FOLD)
+    jobs.enqueue(conn, STATS_FOLD, dedupe_key=STATS_FOLD)
+
+
+def _fold_again(conn, kind, folded, batch):
+    """Queue the next fold while the log may hold more, later if it was busy."""
+    if folded is None:
+        jobs.enqueue(conn, kind, dedupe_key=kind, delay=FOLD_BUSY_DELAY)
+    elif folded == batch:
+        jobs.enqueue(conn, kind, dedupe_key=kind)
+
+
+@jobs.handler(ANALYTICS_FOLD)
+def fold_analytics(conn, payload):
+    """Fold one batch of booking changes into the rollups; queue another if more remain."""
+    _fold_again(conn, ANALYTICS_FOLD, analytics.fold(conn), analytics.FOLD_BATCH)
+
+
+@jobs.handler(STATS_FOLD)
+def fold_stats(conn, payload):
+    """Fold one batch of row count changes into table_stats; queue another if more remain."""
+    _fold_again(conn, STATS_FOLD, stats.fold(conn), stats.FOLD_BATCH)
+
+
+@jobs.handler(MATCHES_REFRESH)
+def refresh_matches(conn, payload):
+    """Recompute one batch of dirty renters' matches; queue another if more remain."""
+    with conn.cursor() as cur:
+        cur.execute(matches.DIRTY_QUERY, ("", matches.REFRESH_BATCH))
+        emails = [row[0] for row in cur.fetchall()]
+    matches.refresh(conn, emails)
+    if len(emails) == matches.REFRESH_BATCH:
+        jobs.enqueue(conn, MATCHES_REFRESH, dedupe_key=MATCHES_REFRESH)
+
+
+@jobs.handler(BOOKING_CONFIRMATION)
+def send_booking_confirmation(conn, payload):
+    """
+    Confirm a booking to the renter. There is no mail transport in this
+    project, so the confirmation is written to the log.
+    """
+    with dict_cursor(conn) as cur:
+        cur.execute(CONFIRMATION_QUERY, (payload["booking_id"],))
+        booking = cur.fetchone()
+    if booking is None:
+        # Cancelled before the confirmation went out.
+        return
+    log.info(
+        "booking %s confirmed for %s <%s>: %s, %s from %s to %s, $%s",
+        booking["booking_id"],
+        booking["first_name"],
+        booking["renter_email"],
+        booking["street"],
+        booking["city"],
+        booking["start_date"],
+        booking["end_date"],
+        booking["total_cost"],
+    )
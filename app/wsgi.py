@@ -0,0 +1,15 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+With preload_app the master imports this module, so the warm-up below runs
+once and workers fork with compiled templates (and the catalog) in memory.
+"""
+
+import serving
+from app import app
+
+serving.before_fork(app)
+
+application = app
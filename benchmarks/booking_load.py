@@ -0,0 +1,115 @@
+"""
+Concurrent booking load test against a single property.
+
+Every worker thread repeatedly books a random one-night slot in a window of
+`--slots` nights, so workers collide on the same property and the exclusion
+constraint. Reports throughput, outcome counts and latency percentiles, then
+deletes the bookings it created.
+
+    python benchmarks/booking_load.py --property 1 --threads 16 --duration 10
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import bookings  # noqa: E402
+import db  # noqa: E402
+
+
+def renter_cards():
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT renter_email, card_id FROM \"PaymentCard\" ORDER BY card_id")
+            return cur.fetchall()
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--property", type=int, required=True)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run.")
+    parser.add_argument("--slots", type=int, default=365, help="Nights to spread bookings over.")
+    parser.add_argument("--start", type=date.fromisoformat, default=date.today() + timedelta(days=400))
+    parser.add_argument("--keep", action="store_true", help="Keep the created bookings.")
+    args = parser.parse_args()
+
+    db.POOL_MAX = max(db.POOL_MAX, args.threads)
+    cards = renter_cards()
+    if not cards:
+        sys.exit("No payment cards found; load sample data first.")
+
+    lock = threading.Lock()
+    created = []
+    outcomes = {"booked": 0, "conflict": 0, "rejected": 0, "error": 0}
+    latencies = []
+    deadline = time.monotonic() + args.duration
+
+    def worker():
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            email, card_id = rng.choice(cards)
+            start = args.start + timedelta(days=2 * rng.randrange(args.slots))
+            began = time.perf_counter()
+            try:
+                booking_id, _ = bookings.create_booking(
+                    email, args.property, card_id, start, start + timedelta(days=1)
+                )
+                outcome = "booked"
+            except bookings.BookingConflict:
+                booking_id, outcome = None, "conflict"
+            except bookings.BookingError:
+                booking_id, outcome = None, "rejected"
+            except Exception:
+                booking_id, outcome = None, "error"
+            elapsed = time.perf_counter() - began
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(elapsed)
+                if booking_id:
+                    created.append(booking_id)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    began = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - began
+
+    attempts = sum(outcomes.values())
+    print(f"threads={args.threads} wall={wall:.2f}s attempts={attempts} ({attempts / wall:.1f}/s)")
+    print(f"booked={outcomes['booked']} ({outcomes['booked'] / wall:.1f}/s) "
+          f"conflicts={outcomes['conflict']} rejected={outcomes['rejected']} errors={outcomes['error']}")
+    if latencies:
+        print(
+            "latency ms: "
+            f"mean={statistics.mean(latencies) * 1000:.1f} "
+            f"p50={percentile(latencies, 50) * 1000:.1f} "
+            f"p95={percentile(latencies, 95) * 1000:.1f} "
+            f"p99={percentile(latencies, 99) * 1000:.1f}"
+        )
+    print("pool:", db.pool_stats())
+
+    if created and not args.keep:
+        with db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('DELETE FROM "Bookings" WHERE booking_id = ANY(%s)', (created,))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+In-memory listing catalog benchmark.
+
+Builds a catalog snapshot from synthetic listings (no database needed),
+reports its memory footprint per million listings, then times page lookups
+for common /search filter combinations:
+
+    python benchmarks/catalog_search.py --listings 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import catalog  # noqa: E402
+from datagen import CITIES  # noqa: E402
+
+FILTERS = {
+    "default": {"only_available": True},
+    "city_type": {"city": "chi", "type": "house", "only_available": True},
+    "state_prefix": {"state": "n"},
+    "max_price": {"max_price": Decimal(1500)},
+    "city_max_price": {"city": "san", "max_price": Decimal(3000), "only_available": True},
+    "rare_type": {"type": "land", "city": "ann arbor"},
+}
+
+
+def synthetic_rows(count, seed):
+    rng = random.Random(seed)
+    stamp = datetime.now()
+    for pid in range(1, count + 1):
+        city, state = rng.choice(CITIES)
+        yield (
+            pid,
+            rng.choice(catalog.TYPES),
+            city,
+            state,
+            rng.randrange(300, 5000),
+            Decimal(rng.randrange(500, 12_000, 25)),
+            rng.random() < 0.8,
+            stamp,
+        )
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the in-memory listing catalog.")
+    parser.add_argument("--listings", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=425)
+    args = parser.parse_args()
+    if catalog.np is None:
+        sys.exit("The catalog needs numpy: pip install numpy")
+
+    began = time.perf_counter()
+    snapshot = catalog.Snapshot.from_batches(
+        batches(synthetic_rows(args.listings, args.seed), catalog.LOAD_BATCH)
+    )
+    print(f"built {len(snapshot):,} listings in {time.perf_counter() - began:.1f}s")
+    sizes = snapshot.nbytes()
+    total = sum(sizes.values())
+    for column, size in sizes.items():
+        print(f"{column:>14}: {size:>12,} bytes")
+    print(f"{'per million':>14}: {total / len(snapshot) * 1_000_000:>12,.0f} bytes\n")
+
+    rng = random.Random(args.seed)
+    print(f"{'filters':<16}{'p50 us':>10}{'p99 us':>10}{'pages':>8}")
+    for name, filters in FILTERS.items():
+        samples = []
+        pages = 0
+        for _ in range(args.queries):
+            after = None
+            if rng.random() < 0.5:
+                after = (str(Decimal(rng.randrange(500, 6000, 25))), rng.randrange(args.listings))
+            began = time.perf_counter()
+            ids = snapshot.page(filters, after, 25)
+            samples.append(time.perf_counter() - began)
+            pages += len(ids) > 25
+        samples.sort()
+        p50 = statistics.median(samples) * 1e6
+        p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+        print(f"{name:<16}{p50:>10.1f}{p99:>10.1f}{pages:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Synthetic dataset generator for benchmarks.
+
+Truncates every table in the realestate schema and loads a deterministic
+dataset with COPY. Sizes scale linearly with --scale:
+
+    scale 1 = 2,000 renters, 50 agents, 10,000 properties, ~50,000 bookings
+
+    python benchmarks/datagen.py --scale 10 --yes
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import analytics  # noqa: E402
+import db  # noqa: E402
+import matches  # noqa: E402
+import rewards  # noqa: E402
+import stats  # noqa: E402
+
+BATCH_ROWS = 50_000
+
+CITIES = [
+    ("Chicago", "IL"), ("Evanston", "IL"), ("Naperville", "IL"), ("Springfield", "IL"),
+    ("New York", "NY"), ("Brooklyn", "NY"), ("Buffalo", "NY"), ("Albany", "NY"),
+    ("Los Angeles", "CA"), ("San Francisco", "CA"), ("San Diego", "CA"), ("Oakland", "CA"),
+    ("Austin", "TX"), ("Houston", "TX"), ("Dallas", "TX"), ("San Antonio", "TX"),
+    ("Seattle", "WA"), ("Spokane", "WA"), ("Portland", "OR"), ("Eugene", "OR"),
+    ("Denver", "CO"), ("Boulder", "CO"), ("Phoenix", "AZ"), ("Tucson", "AZ"),
+    ("Miami", "FL"), ("Orlando", "FL"), ("Tampa", "FL"), ("Atlanta", "GA"),
+    ("Boston", "MA"), ("Cambridge", "MA"), ("Detroit", "MI"), ("Ann Arbor", "MI"),
+    ("Minneapolis", "MN"), ("Madison", "WI"), ("Milwaukee", "WI"), ("Columbus", "OH"),
+    ("Cleveland", "OH"), ("Pittsburgh", "PA"), ("Philadelphia", "PA"), ("Nashville", "TN"),
+]
+# City centres; listings and addresses are scattered around them.
+COORDINATES = {
+    "Chicago": (41.88, -87.63), "Evanston": (42.05, -87.69), "Naperville": (41.75, -88.15),
+    "Springfield": (39.80, -89.64), "New York": (40.71, -74.01), "Brooklyn": (40.68, -73.94),
+    "Buffalo": (42.89, -78.88), "Albany": (42.65, -73.76), "Los Angeles": (34.05, -118.24),
+    "San Francisco": (37.77, -122.42), "San Diego": (32.72, -117.16), "Oakland": (37.80, -122.27),
+    "Austin": (30.27, -97.74), "Houston": (29.76, -95.37), "Dallas": (32.78, -96.80),
+    "San Antonio": (29.42, -98.49), "Seattle": (47.61, -122.33), "Spokane": (47.66, -117.43),
+    "Portland": (45.52, -122.68), "Eugene": (44.05, -123.09), "Denver": (39.74, -104.99),
+    "Boulder": (40.01, -105.27), "Phoenix": (33.45, -112.07), "Tucson": (32.22, -110.97),
+    "Miami": (25.76, -80.19), "Orlando": (28.54, -81.38), "Tampa": (27.95, -82.46),
+    "Atlanta": (33.75, -84.39), "Boston": (42.36, -71.06), "Cambridge": (42.37, -71.11),
+    "Detroit": (42.33, -83.05), "Ann Arbor": (42.28, -83.74), "Minneapolis": (44.98, -93.27),
+    "Madison": (43.07, -89.40), "Milwaukee": (43.04, -87.91), "Columbus": (39.96, -83.00),
+    "Cleveland": (41.50, -81.69), "Pittsburgh": (40.44, -80.00), "Philadelphia": (39.95, -75.17),
+    "Nashville": (36.16, -86.78),
+}
+# Standard deviation, in degrees, of the scatter around a city centre.
+SPREAD_DEGREES = 0.08
+STREETS = ["Main St", "Oak Ave", "Lake Shore Dr", "Maple St", "Park Ave", "Elm St", "2nd St", "Cedar Ln"]
+WORDS = ["sunny", "renovated", "quiet", "lake view", "near campus", "parking", "balcony", "garden",
+         "downtown", "spacious", "modern", "pet friendly", "hardwood floors", "walk-in closet"]
+TYPES = ["house", "apartment", "commercial", "vacation_home", "land"]
+
+TABLES = [
+    "Bookings", "Neighborhood", "Commercial Building", "Apartment", "House", "Property Info",
+    "PaymentCard", "Address", "Rewards_program", "ProspectiveRenter", "Agent", "User",
+]
+
+
+def coordinates(rng, city):
+    """A random point near `city`, rounded like a geocoder result."""
+    lat, lon = COORDINATES[city]
+    return round(rng.gauss(lat, SPREAD_DEGREES), 6), round(rng.gauss(lon, SPREAD_DEGREES), 6)
+
+
+def copy_rows(cur, table, columns, rows):
+    """COPY `rows` into `table` in batches so memory stays bounded."""
+    statement = f'COPY "{table}"({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+    total = 0
+    while True:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if count == BATCH_ROWS:
+                break
+        if not count:
+            return total
+        buffer.seek(0)
+        cur.copy_expert(statement, buffer)
+        total += count
+        if count < BATCH_ROWS:
+            return total
+
+
+def generate(conn, scale, seed):
+    rng = random.Random(seed)
+    renters = int(2000 * scale)
+    agents = max(int(50 * scale), 1)
+    property_count = int(10_000 * scale)
+    today = date.today()
+    counts = {}
+
+    with conn.cursor() as cur:
+        cur.execute(
+            "TRUNCATE " + ", ".join(f'"{t}"' for t in TABLES) + ", table_stats, table_stats_log RESTART IDENTITY CASCADE"
+        )
+
+        def users():
+            for i in range(agents):
+                yield f"agent{i}@bench.test", "Agent", f"No{i}", f"555-{i:07d}", "agent"
+            for i in range(renters):
+                yield f"renter{i}@bench.test", "Renter", f"No{i}", f"555-{i:07d}", "renter"
+
+        counts["User"] = copy_rows(cur, "User", ["email", "first_name", "last_name", "phone", "user_type"], users())
+        counts["Agent"] = copy_rows(
+            cur, "Agent", ["email", "job_title", "agency_name", "agency_contact_info"],
+            ((f"agent{i}@bench.test", "Realtor", f"Agency {i % 20}", f"ext {i}") for i in range(agents)),
+        )
+        counts["ProspectiveRenter"] = copy_rows(
+            cur, "ProspectiveRenter", ["email", "desired_move_in_date", "preferred_location", "monthly_budget"],
+            (
+                (
+                    f"renter{i}@bench.test",
+                    today + timedelta(days=rng.randrange(120)),
+                    rng.choice(CITIES)[0],
+                    rng.randrange(800, 6000, 50),
+                )
+                for i in range(renters)
+            ),
+        )
+        counts["Rewards_program"] = copy_rows(
+            cur, "Rewards_program", ["renter_email"],
+            ((f"renter{i}@bench.test",) for i in range(0, renters, 2)),
+        )
+
+        def addresses():
+            for i in range(renters):
+                city, state = rng.choice(CITIES)
+                yield (i + 1, f"renter{i}@bench.test", "Home", f"{rng.randrange(1, 9999)} {rng.choice(STREETS)}",
+                       city, state, f"{rng.randrange(10000, 99999)}", *coordinates(rng, city))
+
+        counts["Address"] = copy_rows(
+            cur, "Address",
+            ["address_id", "email", "label", "street", "city", "state", "zip", "latitude", "longitude"],
+            addresses(),
+        )
+        counts["PaymentCard"] = copy_rows(
+            cur, "PaymentCard",
+            ["card_id", "renter_email", "card_brand", "card_last4", "exp_month", "exp_year", "billing_address_id"],
+            (
+                (i + 1, f"renter{i}@bench.test", rng.choice(["Visa", "Mastercard", "Amex"]),
+                 f"{i % 10000:04d}", rng.randrange(1, 13), today.year + rng.randrange(1, 6), i + 1)
+                for i in range(renters)
+            ),
+        )
+
+        properties = []
+        for i in range(property_count):
+            city, state = rng.choice(CITIES)
+            ptype = rng.choice(TYPES)
+            price = Decimal(rng.randrange(500, 12_000, 25))
+            properties.append((i + 1, ptype, city, state, price))
+
+        counts["Property Info"] = copy_rows(
+            cur, "Property Info",
+            ["property_id", "type", "street", "city", "state", "zip", '"Sq_Footage"', "price", "description", "availability",
+             "latitude", "longitude"],
+            (
+                (pid, ptype, f"{rng.randrange(1, 9999)} {rng.choice(STREETS)}", city, state,
+                 f"{rng.randrange(10000, 99999)}", rng.randrange(300, 5000), price,
+                 ", ".join(rng.sample(WORDS, 3)), rng.random() < 0.8, *coordinates(rng, city))
+                for pid, ptype, city, state, price in properties
+            ),
+        )
+        counts["House"] = copy_rows(
+            cur, "House", ["property_id", '"No_of_Rooms"'],
+            ((p[0], rng.randrange(2, 10)) for p in properties if p[1] == "house"),
+        )
+        counts["Apartment"] = copy_rows(
+            cur, "Apartment", ["property_id", '"No_of_Rooms"', '"Building_Type"'],
+            ((p[0], rng.randrange(1, 6), rng.choice(["Highrise", "Walkup", "Loft"])) for p in properties if p[1] == "apartment"),
+        )
+        counts["Commercial Building"] = copy_rows(
+            cur, "Commercial Building", ["property_id", '"Business_Types"', '"No_of_Rooms"'],
+            ((p[0], rng.choice(["Retail", "Office", "Restaurant"]), rng.randrange(1, 30)) for p in properties if p[1] == "commercial"),
+        )
+        counts["Neighborhood"] = copy_rows(
+            cur, "Neighborhood", ["property_id", "crime_rate", "schools", "vacation_homes", "land"],
+            (
+                (p[0], round(rng.uniform(0, 10), 1), rng.choice(["Good", "Average", "Excellent"]),
+                 p[1] == "vacation_home", p[1] == "land")
+                for p in properties if rng.random() < 0.7
+            ),
+        )
+
+        def bookings():
+            booking_id = 0
+            for pid, ptype, _, _, price in properties:
+                start = today - timedelta(days=365) + timedelta(days=rng.randrange(30))
+                for _ in range(rng.randrange(11)):
+                    nights = rng.randrange(1, 60)
+                    end = start + timedelta(days=nights)
+                    renter = rng.randrange(renters)
+                    booking_id += 1
+                    total = (price * Decimal(max(nights / 30, 1))).quantize(Decimal("0.01"))
+                    yield (booking_id, pid, f"renter{renter}@bench.test", renter + 1, start, end, total, ptype)
+                    start = end + timedelta(days=1 + rng.randrange(20))
+
+        counts["Bookings"] = copy_rows(
+            cur, "Bookings",
+            ["booking_id", "property_id", "renter_email", "card_id", "start_date", "end_date", "total_cost", '"Property_Type"'],
+            bookings(),
+        )
+
+        for table, column in (
+            ("Address", "address_id"),
+            ("PaymentCard", "card_id"),
+            ("Property Info", "property_id"),
+            ("Bookings", "booking_id"),
+        ):
+            cur.execute(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', '{column}'), "
+                f'(SELECT COALESCE(MAX({column}), 0) + 1 FROM "{table}"), false)'
+            )
+
+    # TRUNCATE bypasses the counter triggers, so rebuild derived tables.
+    stats.rebuild(conn)
+    rewards.reconcile(conn, fix=True)
+    analytics.rebuild(conn)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a synthetic benchmark dataset.")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=425)
+    parser.add_argument("--yes", action="store_true", help="Confirm truncating all tables.")
+    args = parser.parse_args()
+    if not args.yes:
+        sys.exit("This truncates every table in the realestate schema; pass --yes to continue.")
+
+    started = time.monotonic()
+    with db.get_connection() as conn:
+        counts = generate(conn, args.scale, args.seed)
+    conn = db.connect()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+        # Bulk-build recommendations once the planner has statistics.
+        conn.autocommit = False
+        _, counts["renter_matches"] = matches.rebuild(conn)
+    finally:
+        conn.close()
+    for table, count in counts.items():
+        print(f"{table:>20}: {count:,}")
+    print(f"loaded in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Radius search benchmark.
+
+Times first and later result pages of /search radius queries around random
+listings, once through the geo_cell grid index (search.build_query) and once
+as a plain distance scan for comparison:
+
+    python benchmarks/datagen.py --scale 100 --yes   # 1M listings
+    python benchmarks/geo_search.py --queries 200
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import db  # noqa: E402
+import search  # noqa: E402
+
+RADII_KM = (1, 5, 10, 25, 50)
+EXTRA_FILTERS = {
+    "radius": {},
+    "radius_type_price": {"type": "apartment", "max_price": Decimal(3000), "only_available": True},
+}
+PAGE = 25
+
+SCAN_QUERY = f"""
+    SELECT {search.SELECT_COLUMNS}, {search.DISTANCE_EXPR} AS distance_km
+    FROM "Property Info" p
+    LEFT JOIN "Neighborhood" n ON n.property_id = p.property_id
+    WHERE {search.DISTANCE_EXPR} <= %s
+    ORDER BY distance_km ASC, p.property_id DESC
+    LIMIT %s
+"""
+
+
+def origins(cur, count, seed):
+    cur.execute("SELECT setseed(%s)", (seed / 1000 % 1,))
+    cur.execute(
+        """SELECT latitude, longitude FROM "Property Info" TABLESAMPLE SYSTEM (1)
+           WHERE latitude IS NOT NULL ORDER BY random() LIMIT %s""",
+        (count,),
+    )
+    rows = cur.fetchall()
+    if not rows:
+        sys.exit("No listings with coordinates; run datagen.py first.")
+    return rows
+
+
+def timed(cur, query, params):
+    began = time.perf_counter()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    return time.perf_counter() - began, rows
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[max(int(len(samples) * fraction) - 1, 0)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark radius search on the geo grid.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=425)
+    parser.add_argument("--no-scan", action="store_true", help="skip the unindexed comparison")
+    parser.add_argument("--explain", action="store_true", help="print one plan per radius")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    conn = db.connect()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT count(*) FROM "Property Info"')
+            print(f"{cur.fetchone()[0]:,} listings\n")
+            points = origins(cur, args.queries, args.seed)
+            print(
+                f"{'filters':<20}{'km':>5}{'cells':>7}{'p50 ms':>9}{'p99 ms':>9}"
+                f"{'page2 ms':>10}{'scan ms':>9}{'rows':>7}"
+            )
+            for name, extra in EXTRA_FILTERS.items():
+                for radius in RADII_KM:
+                    first, second, scans, found = [], [], [], []
+                    for lat, lon in points:
+                        filters = dict(extra, lat=lat, lon=lon, radius_km=radius)
+                        query, params = search.build_query(filters, None, PAGE)
+                        elapsed, rows = timed(cur, query, params)
+                        first.append(elapsed)
+                        found.append(min(len(rows), PAGE))
+                        if len(rows) > PAGE:
+                            last = rows[PAGE - 1]
+                            after = (last[-1], last[0])
+                            query, params = search.build_query(filters, after, PAGE)
+                            second.append(timed(cur, query, params)[0])
+                        if not args.no_scan and not extra and rng.random() < 0.1:
+                            scans.append(timed(cur, SCAN_QUERY, [lat, lon, lat, lon, radius, PAGE + 1])[0])
+                    lat, lon = points[0]
+                    cells = len(search.cell_ranges(lat, lon, radius))
+                    page2 = f"{statistics.median(second) * 1000:>10.2f}" if second else f"{'-':>10}"
+                    scan = f"{statistics.median(scans) * 1000:>9.1f}" if scans else f"{'-':>9}"
+                    print(
+                        f"{name:<20}{radius:>5}{cells:>7}{percentile(first, 0.5):>9.2f}"
+                        f"{percentile(first, 0.99):>9.2f}{page2}{scan}{statistics.mean(found):>7.1f}"
+                    )
+                    if args.explain:
+                        filters = dict(extra, lat=lat, lon=lon, radius_km=radius)
+                        query, params = search.build_query(filters, None, PAGE)
+                        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+                        print("\n".join(f"    {line}" for (line,) in cur.fetchall()))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
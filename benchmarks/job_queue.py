@@ -0,0 +1,135 @@
+"""
+Background job queue throughput benchmark.
+
+Fills the jobs table with benchmark jobs, then drains it with 1, 2, 4, ...
+worker processes leasing through jobs.run_batch (FOR UPDATE SKIP LOCKED),
+and reports jobs per second and enqueue-to-done latency for each level.
+Latency includes the time spent queued behind the preloaded jobs; "wait" is
+the mean time a job was due before a worker claimed it.
+Jobs can simulate database work and fail at random to exercise retries:
+
+    python benchmarks/job_queue.py --jobs 20000 --workers 1,2,4,8,16
+    python benchmarks/job_queue.py --work-ms 5 --fail-rate 0.05 --batch 1
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import db  # noqa: E402
+import jobs  # noqa: E402
+
+KIND = "bench.job"
+FILL_QUERY = """
+    INSERT INTO jobs(kind, payload)
+    SELECT %s, jsonb_build_object('enqueued', extract(epoch FROM clock_timestamp()))
+    FROM generate_series(1, %s)
+"""
+
+# Set in main() before the workers fork.
+work_ms = 0.0
+fail_rate = 0.0
+finished = []
+
+
+@jobs.handler(KIND)
+def bench_job(conn, payload):
+    if work_ms:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_sleep(%s)", (work_ms / 1000,))
+    if fail_rate and random.random() < fail_rate:
+        raise RuntimeError("simulated failure")
+    finished.append(time.time() - payload["enqueued"])
+
+
+def drain(batch, results):
+    random.seed()
+    conn = db.connect()
+    totals = {"claimed": 0, "done": 0, "retried": 0, "dead": 0, "waited": 0.0}
+    try:
+        while True:
+            result = jobs.run_batch(conn, batch)
+            for key, value in result.items():
+                totals[key] += value
+            if result["claimed"]:
+                continue
+            # Nothing claimable: either done, or the rest is leased by other
+            # workers or waiting out a retry delay.
+            with conn.cursor() as cur:
+                cur.execute("SELECT EXISTS (SELECT 1 FROM jobs WHERE kind = %s)", (KIND,))
+                remaining = cur.fetchone()[0]
+            conn.commit()
+            if not remaining:
+                break
+            time.sleep(0.01)
+    finally:
+        conn.close()
+    results.put((totals, finished))
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[max(int(len(samples) * fraction) - 1, 0)] * 1000 if samples else 0.0
+
+
+def main():
+    global work_ms, fail_rate
+    parser = argparse.ArgumentParser(description="Benchmark the background job queue.")
+    parser.add_argument("--jobs", type=int, default=20000, help="Jobs per worker count.")
+    parser.add_argument("--workers", default="1,2,4,8,16", help="Comma separated worker counts.")
+    parser.add_argument("--batch", type=int, default=jobs.CLAIM_BATCH, help="Jobs leased per claim.")
+    parser.add_argument("--work-ms", type=float, default=0.0, help="pg_sleep per job.")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of runs that raise.")
+    args = parser.parse_args()
+    work_ms, fail_rate = args.work_ms, args.fail_rate
+    # Retry at once so failures cost attempts rather than waiting time.
+    jobs.BACKOFF_BASE = 0
+    context = multiprocessing.get_context("fork")
+
+    conn = db.connect()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM jobs WHERE kind <> %s", (KIND,))
+            if cur.fetchone()[0]:
+                sys.exit("The jobs table holds application jobs; drain it with jobs-worker first.")
+            print(
+                f"{'workers':>8}{'batch':>7}{'jobs/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+                f"{'wait ms':>9}{'retried':>9}{'dead':>6}"
+            )
+            for count in [int(value) for value in args.workers.split(",")]:
+                cur.execute("DELETE FROM jobs WHERE kind = %s", (KIND,))
+                cur.execute("DELETE FROM jobs_dead WHERE kind = %s", (KIND,))
+                cur.execute(FILL_QUERY, (KIND, args.jobs))
+                results = context.Queue()
+                workers = [
+                    context.Process(target=drain, args=(args.batch, results)) for _ in range(count)
+                ]
+                started = time.perf_counter()
+                for process in workers:
+                    process.start()
+                collected = [results.get() for _ in workers]
+                elapsed = time.perf_counter() - started
+                for process in workers:
+                    process.join()
+
+                totals = {key: sum(t[key] for t, _ in collected) for key in collected[0][0]}
+                latencies = [sample for _, samples in collected for sample in samples]
+                wait = totals["waited"] / totals["claimed"] * 1000 if totals["claimed"] else 0.0
+                print(
+                    f"{count:>8}{args.batch:>7}{totals['done'] / elapsed:>10.0f}"
+                    f"{percentile(latencies, 0.5):>10.1f}{percentile(latencies, 0.99):>10.1f}"
+                    f"{wait:>9.1f}{totals['retried']:>9}{totals['dead']:>6}"
+                )
+            cur.execute("DELETE FROM jobs_dead WHERE kind = %s", (KIND,))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Planning-time benchmark for the prepared hot statements.
+
+Runs every statement registered in app.py (plus a few /search shapes) on one
+connection, first as plain text and then through prepared.execute, and
+reports mean execution latency and the server's mean planning time taken
+from EXPLAIN (ANALYZE, FORMAT JSON):
+
+    python benchmarks/datagen.py --scale 10 --yes
+    python benchmarks/prepared_statements.py --iterations 500
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+import db  # noqa: E402
+import prepared  # noqa: E402
+import search  # noqa: E402
+from app import (  # noqa: E402
+    HOME_LISTINGS,
+    RENTER_BOOKINGS,
+    RENTER_CARD_CHOICES,
+    RENTER_CARDS,
+    USER_BY_EMAIL,
+)
+
+SEARCHES = [
+    {},
+    {"city": "chi", "type": "house", "only_available": "1"},
+    {"max_price": "2500"},
+    {"q": "lake view parking"},
+]
+
+
+def cases(cur):
+    cur.execute('SELECT renter_email FROM "PaymentCard" ORDER BY random() LIMIT 1')
+    row = cur.fetchone()
+    if row is None:
+        sys.exit("Benchmark needs renters with cards; run datagen.py first.")
+    email = row[0]
+    result = [
+        (USER_BY_EMAIL, (email,)),
+        (HOME_LISTINGS, ()),
+        (RENTER_CARDS, (email,)),
+        (RENTER_CARD_CHOICES, (email,)),
+        (RENTER_BOOKINGS, (email,)),
+    ]
+    for values in SEARCHES:
+        query, params = search.build_query(search.parse_filters(values), None, 25)
+        result.append((prepared.dynamic("search", query), tuple(params)))
+    return result
+
+
+def plain_sql(cur, name, params):
+    return cur.mogrify(prepared.STATEMENTS[name], params).decode()
+
+
+def prepared_sql(cur, name, params):
+    args = "(" + ", ".join(["%s"] * len(params)) + ")" if params else ""
+    return cur.mogrify(f"EXECUTE {name}{args}", params).decode()
+
+
+def planning_ms(cur, statement, iterations):
+    samples = []
+    for _ in range(iterations):
+        cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {statement}")
+        samples.append(cur.fetchone()[0][0]["Planning Time"])
+    return statistics.mean(samples)
+
+
+def latency_ms(run, iterations):
+    samples = []
+    for _ in range(iterations):
+        began = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - began)
+    return statistics.mean(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare plain and prepared hot statements.")
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    conn = db.connect()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            print(
+                f"{'statement':<30}{'plan ms':>9}{'plan ms':>9}{'exec ms':>9}{'exec ms':>9}\n"
+                f"{'':<30}{'plain':>9}{'prep':>9}{'plain':>9}{'prep':>9}"
+            )
+            for name, params in cases(cur):
+                plain = plain_sql(cur, name, params)
+                prepared.execute(cur, name, params)  # prepare before timing
+                cur.fetchall()
+
+                def run_plain():
+                    cur.execute(plain)
+                    cur.fetchall()
+
+                def run_prepared():
+                    prepared.execute(cur, name, params)
+                    cur.fetchall()
+
+                plain_exec = latency_ms(run_plain, args.iterations)
+                prepared_exec = latency_ms(run_prepared, args.iterations)
+                plain_plan = planning_ms(cur, plain, min(args.iterations, 50))
+                prepared_plan = planning_ms(
+                    cur, prepared_sql(cur, name, params), min(args.iterations, 50)
+                )
+                print(
+                    f"{name[:29]:<30}{plain_plan:>9.3f}{prepared_plan:>9.3f}"
+                    f"{plain_exec:>9.3f}{prepared_exec:>9.3f}"
+                )
+    finally:
+        conn.close()
+    print(prepared.stats())
+
+
+if __name__ == "__main__":
+    main()
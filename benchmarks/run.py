@@ -0,0 +1,322 @@
+"""
+Route benchmark for the Flask app.
+
+Drives every route through the Flask test client (or, with --base-url, a
+running server over HTTP) from concurrent threads and reports throughput and
+p50/p95/p99 latency per route. Results are written as JSON under
+benchmarks/results/ so runs can be compared:
+
+    python benchmarks/datagen.py --scale 10 --yes
+    python benchmarks/run.py --requests 200 --concurrency 8
+    python benchmarks/run.py --base-url http://127.0.0.1:8000 --concurrency 32
+    python benchmarks/run.py --compare benchmarks/results/<earlier>.json
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+
+import db  # noqa: E402
+from app import app  # noqa: E402
+
+RESULTS_DIR = os.path.join(HERE, "results")
+
+
+def sample_ids():
+    """Pick the ids the route URLs are built from."""
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('SELECT property_id FROM "Property Info" ORDER BY random() LIMIT 500')
+            properties = [row[0] for row in cur.fetchall()]
+            cur.execute('SELECT email FROM "Agent" ORDER BY random() LIMIT 50')
+            agents = [row[0] for row in cur.fetchall()]
+            cur.execute(
+                'SELECT renter_email, card_id FROM "PaymentCard" ORDER BY random() LIMIT 200'
+            )
+            renters = cur.fetchall()
+            cur.execute('SELECT DISTINCT city FROM "Property Info" LIMIT 50')
+            cities = [row[0] for row in cur.fetchall()]
+    if not (properties and agents and renters):
+        sys.exit("Benchmark needs properties, agents and renters with cards; run datagen.py first.")
+    return {"properties": properties, "agents": agents, "renters": renters, "cities": cities}
+
+
+def build_routes(ids, writes):
+    """Return [(name, role, method, url_factory, data_factory)]."""
+    today = date.today()
+
+    def pid(rng):
+        return rng.choice(ids["properties"])
+
+    def stay(rng, offset=30):
+        start = today + timedelta(days=offset + rng.randrange(300))
+        return start, start + timedelta(days=rng.randrange(1, 30))
+
+    routes = [
+        ("index", None, "GET", lambda rng: "/", None),
+        ("search_default", None, "GET", lambda rng: "/search", None),
+        (
+            "search_city_type",
+            None,
+            "GET",
+            lambda rng: f"/search?city={rng.choice(ids['cities'])}&type=house&only_available=1",
+            None,
+        ),
+        ("search_max_price", None, "GET", lambda rng: f"/search?max_price={rng.randrange(800, 5000)}", None),
+        ("search_keywords", None, "GET", lambda rng: "/search?q=lake+view+parking", None),
+        (
+            "search_dates",
+            None,
+            "GET",
+            lambda rng: "/search?check_in={}&check_out={}&only_available=1".format(*stay(rng)),
+            None,
+        ),
+        ("renter_dashboard", "renter", "GET", lambda rng: "/renter/dashboard", None),
+        ("my_bookings", "renter", "GET", lambda rng: "/my_bookings", None),
+        ("addresses", "renter", "GET", lambda rng: "/addresses", None),
+        ("cards", "renter", "GET", lambda rng: "/cards", None),
+        ("book_property_form", "renter", "GET", lambda rng: f"/book/{pid(rng)}", None),
+        ("agent_dashboard", "agent", "GET", lambda rng: "/agent/dashboard", None),
+        ("agent_properties", "agent", "GET", lambda rng: "/agent/properties", None),
+        (
+            "agent_property_bookings",
+            "agent",
+            "GET",
+            lambda rng: f"/agent/properties/{pid(rng)}/bookings",
+            None,
+        ),
+        ("agent_property_form", "agent", "GET", lambda rng: f"/agent/properties/{pid(rng)}/edit", None),
+        (
+            "api_properties",
+            "agent",
+            "GET",
+            lambda rng: "/api/properties?ids=" + ",".join(str(pid(rng)) for _ in range(25)),
+            None,
+        ),
+        (
+            "api_availability",
+            "agent",
+            "GET",
+            lambda rng: "/api/availability?format=runs&ids="
+            + ",".join(str(pid(rng)) for _ in range(25))
+            + "&start={}&end={}".format(today, today + timedelta(days=89)),
+            None,
+        ),
+        (
+            "export_bookings",
+            "agent",
+            "GET",
+            lambda rng: f"/agent/export/bookings.csv?property_id={pid(rng)}",
+            None,
+        ),
+        ("metrics", None, "GET", lambda rng: "/metrics", None),
+    ]
+    if writes:
+        routes.append(
+            (
+                "book_property_post",
+                "renter",
+                "POST",
+                lambda rng: f"/book/{pid(rng)}",
+                lambda rng, card_id: dict(
+                    zip(("start_date", "end_date"), (d.isoformat() for d in stay(rng, 400))),
+                    card_id=card_id,
+                ),
+            )
+        )
+    return routes
+
+
+class TestClient:
+    """In-process client; logs in by writing the session directly."""
+
+    def __init__(self, email, role):
+        self.client = app.test_client()
+        if role:
+            with self.client.session_transaction() as session:
+                session["user_email"] = email
+                session["user_type"] = role
+
+    def request(self, method, url, data=None):
+        response = self.client.open(url, method=method, data=data)
+        response.get_data()
+        return response.status_code
+
+
+class HttpClient:
+    """Cookie-keeping HTTP client for a running server; logs in through /login."""
+
+    def __init__(self, base_url, email, role):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        if role:
+            self.request("POST", "/login", {"email": email})
+
+    def request(self, method, url, data=None):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        req = urllib.request.Request(self.base_url + url, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            return exc.code
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_route(route, ids, requests, concurrency, base_url=None):
+    name, role, method, url_for, data_for = route
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    per_thread = max(requests // concurrency, 1)
+
+    def worker(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        email = card_id = None
+        if role == "agent":
+            email = rng.choice(ids["agents"])
+        elif role:
+            email, card_id = rng.choice(ids["renters"])
+        if base_url:
+            client = HttpClient(base_url, email, role)
+        else:
+            client = TestClient(email, role)
+        local = []
+        local_errors = 0
+        for _ in range(per_thread):
+            url = url_for(rng)
+            data = data_for(rng, card_id) if method == "POST" else None
+            began = time.perf_counter()
+            status = client.request(method, url, data)
+            local.append(time.perf_counter() - began)
+            if status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - began
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def dataset_size():
+    with db.get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT stats_total('property'), stats_total('booking')")
+            properties, bookings = cur.fetchone()
+            return {"property": properties, "booking": bookings}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous_path):
+    with open(previous_path) as fh:
+        previous = json.load(fh)["routes"]
+    print(f"\n{'route':<26}{'p95 before':>12}{'p95 now':>10}{'rps before':>12}{'rps now':>10}")
+    for name, result in current.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        print(
+            f"{name:<26}{before['p95_ms']:>12.1f}{result['p95_ms']:>10.1f}"
+            f"{before['throughput_rps']:>12.1f}{result['throughput_rps']:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every route of the app.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", action="append", help="Run only these routes (repeatable).")
+    parser.add_argument("--writes", action="store_true", help="Include booking POSTs.")
+    parser.add_argument("--output", help="Result file (default: results/bench-<timestamp>.json).")
+    parser.add_argument("--compare", help="Earlier result file to compare against.")
+    parser.add_argument(
+        "--base-url", help="Benchmark a running server over HTTP instead of the test client."
+    )
+    args = parser.parse_args()
+
+    db.POOL_MAX = max(db.POOL_MAX, args.concurrency + 2)
+    ids = sample_ids()
+    routes = [r for r in build_routes(ids, args.writes) if not args.only or r[0] in args.only]
+
+    results = {}
+    print(f"{'route':<26}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for route in routes:
+        result = run_route(route, ids, args.requests, args.concurrency, args.base_url)
+        results[route[0]] = result
+        print(
+            f"{route[0]:<26}{result['throughput_rps']:>9.1f}{result['p50_ms']:>9.1f}"
+            f"{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}{result['errors']:>8}"
+        )
+
+    report = {
+        "meta": {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "requests_per_route": args.requests,
+            "concurrency": args.concurrency,
+            "target": args.base_url or "test client",
+            "dataset": dataset_size(),
+        },
+        "routes": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nresults written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+-- Verifies that every /search filter combination is index-backed at 1M listings.
+-- Runs inside a transaction and rolls back, so it is safe on a dev database:
+--   psql -d realestate_db -f schema/explain_search.sql
+-- Each plan is printed as a NOTICE and checked: the script stops with an
+-- error if a plan seq-scans "Property Info" or misses the expected index
+-- condition (e.g. the keyset page must start its index scan at the cursor).
+SET search_path TO realestate, public;
+\set ON_ERROR_STOP on
+BEGIN;
+
+CREATE FUNCTION pg_temp.check_plan(label TEXT, query TEXT, expected TEXT[] DEFAULT '{}')
+RETURNS void AS $$
+DECLARE
+    line TEXT;
+    plan TEXT := '';
+    pattern TEXT;
+BEGIN
+    FOR line IN EXECUTE 'EXPLAIN ' || query LOOP
+        plan := plan || line || E'\n';
+    END LOOP;
+    RAISE NOTICE E'%:\n%', label, plan;
+    IF plan ~ 'Seq Scan on "Property Info"' THEN
+        RAISE EXCEPTION '%: sequential scan on "Property Info"', label;
+    END IF;
+    FOREACH pattern IN ARRAY expected LOOP
+        IF plan !~ pattern THEN
+            RAISE EXCEPTION '%: plan does not match %', label, pattern;
+        END IF;
+    END LOOP;
+END$$ LANGUAGE plpgsql;
+
+INSERT INTO "Property Info"(type, street, city, state, zip, "Sq_Footage", price, description, availability)
+SELECT
+    (ARRAY['house','apartment','commercial','vacation_home','land'])[1 + g % 5],
+    g || ' Main St',
+    'City ' || (g % 5000),
+    'State ' || (g % 50),
+    lpad((g % 99999)::text, 5, '0'),
+    500 + g % 3000,
+    500 + (g % 10000),
+    CASE WHEN g % 7 = 0 THEN 'lake view with parking' ELSE 'quiet street' END,
+    g % 3 <> 0
+FROM generate_series(1, 1000000) AS g;
+ANALYZE "Property Info";
+
+SELECT pg_temp.check_plan('city substring (trigram)', $q$
+    SELECT property_id FROM "Property Info" p
+    WHERE LOWER(p.city) LIKE '%city 42%' AND p.availability = TRUE
+    ORDER BY p.price ASC, p.property_id DESC LIMIT 26
+$q$);
+
+SELECT pg_temp.check_plan('short state input (prefix)', $q$
+    SELECT property_id FROM "Property Info" p
+    WHERE LOWER(p.state) LIKE 'st%' AND p.type = 'house'
+    ORDER BY p.price ASC, p.property_id DESC LIMIT 26
+$q$);
+
+SELECT pg_temp.check_plan('city + state + type + max_price + availability', $q$
+    SELECT property_id FROM "Property Info" p
+    WHERE LOWER(p.city) LIKE '%city 42%' AND LOWER(p.state) LIKE '%state 4%'
+      AND p.type = 'house' AND p.price <= 2000 AND p.availability = TRUE
+    ORDER BY p.price ASC, p.property_id DESC LIMIT 26
+$q$);
+
+SELECT pg_temp.check_plan('type + max_price', $q$
+    SELECT property_id FROM "Property Info" p
+    WHERE p.type = 'apartment' AND p.price <= 600
+    ORDER BY p.price ASC, p.property_id DESC LIMIT 26
+$q$);
+
+-- Same predicate as search.build_query: the leading price bound must be an
+-- Index Cond, otherwise page N scans and discards every earlier row.
+SELECT pg_temp.check_plan('availability only (default listing), keyset page', $q$
+    SELECT property_id FROM "Property Info" p
+    WHERE p.availability = TRUE
+      AND p.price >= 900 AND (p.price > 900 OR (p.price = 900 AND p.property_id < 500000))
+    ORDER BY p.price ASC, p.property_id DESC LIMIT 26
+$q$, ARRAY['Index Cond: .*price >= ']);
+
+SELECT pg_temp.check_plan('ranked free text', $q$
+    SELECT property_id, ts_rank(p.search_vector, websearch_to_tsquery('english', 'lake parking')) AS rank
+    FROM "Property Info" p
+    WHERE p.search_vector @@ websearch_to_tsquery('english', 'lake parking') AND LOWER(p.city) LIKE '%city 42%'
+    ORDER BY rank DESC, p.property_id DESC LIMIT 26
+$q$, ARRAY['idx_property_(search|city_trgm)']);
+
+-- The app runs these shapes as prepared statements (prepared.dynamic), and
+-- after a few executions PostgreSQL may settle on a generic plan that never
+-- sees the parameter values. Check the generic plans too. A prefix LIKE
+-- cannot use text_pattern_ops without its value, so short text inputs are
+-- not prepared (search.preparable) and have no parameterized case here.
+SET LOCAL plan_cache_mode = force_generic_plan;
+
+PREPARE search_city_substring(TEXT) AS
+    SELECT property_id FROM "Property Info" p
+    WHERE LOWER(p.city) LIKE $1 AND p.availability = TRUE
+    ORDER BY p.price ASC, p.property_id DESC LIMIT 26;
+SELECT pg_temp.check_plan('city substring (trigram), generic plan', $q$
+    EXECUTE search_city_substring('%city 42%')
+$q$, ARRAY['idx_property_city_trgm']);
+
+PREPARE search_type_price(TEXT, NUMERIC) AS
+    SELECT property_id FROM "Property Info" p
+    WHERE p.type = $1 AND p.price <= $2
+    ORDER BY p.price ASC, p.property_id DESC LIMIT 26;
+SELECT pg_temp.check_plan('type + max_price, generic plan', $q$
+    EXECUTE search_type_price('apartment', 600)
+$q$);
+
+PREPARE search_keyset(NUMERIC, NUMERIC, INT) AS
+    SELECT property_id FROM "Property Info" p
+    WHERE p.availability = TRUE
+      AND p.price >= $1 AND (p.price > $2 OR (p.price = $2 AND p.property_id < $3))
+    ORDER BY p.price ASC, p.property_id DESC LIMIT 26;
+SELECT pg_temp.check_plan('availability only, keyset page, generic plan', $q$
+    EXECUTE search_keyset(900, 900, 500000)
+$q$, ARRAY['Index Cond: .*price >= ']);
+
+ROLLBACK;
@@ -6,6 +6,25 @@ SET search_path = realestate, public;
 
 -- Needed for the no overlap booking rule
 CREATE EXTENSION IF NOT EXISTS btree_gist;
+-- Trigram indexes for substring search on city/state
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Spatial grid for radius search: 0.1 degree cells (about 11 km north-south),
+-- numbered row by row from (-90, -180). app/search.py computes the same keys,
+-- so a radius query becomes a few B-tree range scans, one per row of cells.
+CREATE OR REPLACE FUNCTION geo_cell(lat DOUBLE PRECISION, lon DOUBLE PRECISION) RETURNS BIGINT AS $$
+    SELECT floor((lat + 90) / 0.1)::BIGINT * 3600 + LEAST(floor((lon + 180) / 0.1), 3599)::BIGINT;
+$$ LANGUAGE sql IMMUTABLE STRICT;
+
+-- Great-circle (haversine) distance in kilometres.
+CREATE OR REPLACE FUNCTION geo_distance_km(
+    lat1 DOUBLE PRECISION, lon1 DOUBLE PRECISION, lat2 DOUBLE PRECISION, lon2 DOUBLE PRECISION
+) RETURNS DOUBLE PRECISION AS $$
+    SELECT 2 * 6371.0 * asin(sqrt(
+        power(sin(radians(lat2 - lat1) / 2), 2) +
+        cos(radians(lat1)) * cos(radians(lat2)) * power(sin(radians(lon2 - lon1) / 2), 2)
+    ));
+$$ LANGUAGE sql IMMUTABLE STRICT;
 
 -- ================================
 -- User and subtypes (disjoint)
@@ -81,7 +100,9 @@ CREATE TABLE "Address" (
     street VARCHAR(200) NOT NULL,
     city VARCHAR(100) NOT NULL,
     state VARCHAR(100),
-    zip VARCHAR(20)
+    zip VARCHAR(20),
+    latitude DOUBLE PRECISION CHECK (latitude BETWEEN -90 AND 90),
+    longitude DOUBLE PRECISION CHECK (longitude BETWEEN -180 AND 180)
 );
 CREATE INDEX idx_address_user ON "Address"(email);
 
@@ -114,10 +135,36 @@ CREATE TABLE "Property Info" (
     "Sq_Footage" INT CHECK ("Sq_Footage" IS NULL OR "Sq_Footage" > 0),
     price NUMERIC(12,2) NOT NULL CHECK (price >= 0),
     description TEXT,
-    availability BOOLEAN NOT NULL DEFAULT TRUE
+    availability BOOLEAN NOT NULL DEFAULT TRUE,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    latitude DOUBLE PRECISION CHECK (latitude BETWEEN -90 AND 90),
+    longitude DOUBLE PRECISION CHECK (longitude BETWEEN -180 AND 180),
+    geo_cell BIGINT GENERATED ALWAYS AS (geo_cell(latitude, longitude)) STORED,
+    -- Weighted document for free-text search (city/state rank above street and description)
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(city, '') || ' ' || coalesce(state, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(street, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED
 );
 CREATE INDEX idx_property_city_state ON "Property Info"(city, state);
-CREATE INDEX idx_property_type ON "Property Info"(type);
+CREATE INDEX idx_property_type ON "Property Info"(type, price);
+-- /search filters: substring matches use trigrams, short inputs use prefix
+-- matches on the pattern_ops indexes, keywords use the tsvector index.
+CREATE INDEX idx_property_city_trgm ON "Property Info" USING gin (LOWER(city) gin_trgm_ops);
+CREATE INDEX idx_property_state_trgm ON "Property Info" USING gin (LOWER(state) gin_trgm_ops);
+CREATE INDEX idx_property_city_prefix ON "Property Info"(LOWER(city) text_pattern_ops);
+CREATE INDEX idx_property_state_prefix ON "Property Info"(LOWER(state) text_pattern_ops);
+CREATE INDEX idx_property_search ON "Property Info" USING gin (search_vector);
+-- Keyset pagination: /search orders by (price ASC, property_id DESC), the home
+-- page lists the newest available rows; agent listings use the primary key.
+CREATE INDEX idx_property_price_id ON "Property Info"(price, property_id DESC);
+CREATE INDEX idx_property_available_price_id ON "Property Info"(price, property_id DESC)
+    WHERE availability;
+CREATE INDEX idx_property_available_id ON "Property Info"(property_id DESC)
+    WHERE availability;
+-- Radius search scans ranges of grid cells, then checks the exact distance.
+CREATE INDEX idx_property_geo_cell ON "Property Info"(geo_cell);
 
 -- House
 CREATE TABLE "House" (
@@ -164,10 +211,13 @@ CREATE TABLE "Bookings" (
     end_date DATE NOT NULL,
     total_cost NUMERIC(12,2) NOT NULL CHECK (total_cost >= 0),
     "Property_Type" VARCHAR(20) NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
     CHECK (start_date < end_date)
 );
 
--- Keep Property_Type in sync with Property Info
+-- Keep Property_Type in sync with Property Info. The lookup runs for every
+-- insert, whatever type the caller supplied: it is one primary key probe, and
+-- the type rollups and statistics rely on the column matching the property.
 CREATE OR REPLACE FUNCTION set_booking_property_type() RETURNS trigger AS $$
 DECLARE
     t varchar(20);
@@ -181,7 +231,7 @@ BEGIN
 END$$ LANGUAGE plpgsql;
 
 CREATE TRIGGER trg_bookings_set_type
-BEFORE INSERT OR UPDATE OF property_id ON "Bookings"
+BEFORE INSERT OR UPDATE OF property_id, "Property_Type" ON "Bookings"
 FOR EACH ROW EXECUTE FUNCTION set_booking_property_type();
 
 -- Prevent overlapping bookings on same property
@@ -205,32 +255,80 @@ ALTER TABLE "Bookings"
 --         WHERE c.card_id = card_id AND c.renter_email = renter_email
 --     ));
 
-CREATE INDEX idx_bookings_renter ON "Bookings"(renter_email);
+-- The /my_bookings validator reads the renter's bookings from this index alone
+-- (updated_at and property_id are in it); its join still probes "Property Info"
+-- by primary key once per booking, so the cost follows the renter's booking
+-- count rather than the table sizes.
+CREATE INDEX idx_bookings_renter ON "Bookings"(renter_email, updated_at) INCLUDE (property_id);
 CREATE INDEX idx_bookings_property ON "Bookings"(property_id);
 
--- Optional: mark availability false once booked
-CREATE OR REPLACE FUNCTION mark_unavailable_after_booking() RETURNS trigger AS $$
-BEGIN
-    UPDATE "Property Info" SET availability = FALSE WHERE property_id = NEW.property_id;
-    RETURN NEW;
-END$$ LANGUAGE plpgsql;
-
-CREATE TRIGGER trg_mark_unavailable
-AFTER INSERT ON "Bookings"
-FOR EACH ROW EXECUTE FUNCTION mark_unavailable_after_booking();
+-- availability is the agent's "listed for rent" flag. Bookings no longer flip it
+-- to FALSE (the old trg_mark_unavailable did so permanently after the first
+-- booking); whether a property is free for given dates is answered by an
+-- anti-join on stay, served by the no_overlap_per_property GiST index.
+CREATE OR REPLACE FUNCTION property_free_during(pid INT, requested daterange) RETURNS boolean AS $$
+    SELECT NOT EXISTS (
+        SELECT 1 FROM "Bookings" b
+        WHERE b.property_id = pid AND b.stay && requested
+    );
+$$ LANGUAGE sql STABLE;
 
 -- ================================
 -- Rewards_program (registration) + derived count(Bookings)
 -- matches ERD idea: count of bookings
+-- bookings_count and total_spent are maintained incrementally by triggers on
+-- "Bookings"; `flask --app app rewards-reconcile` checks them against the raw data.
 -- ================================
 CREATE TABLE "Rewards_program" (
     renter_email VARCHAR(200) PRIMARY KEY REFERENCES "ProspectiveRenter"(email) ON DELETE CASCADE,
-    registered_on DATE NOT NULL DEFAULT CURRENT_DATE
-    rewards_earned INTEGER REFERENCES 
+    registered_on DATE NOT NULL DEFAULT CURRENT_DATE,
+    bookings_count INT NOT NULL DEFAULT 0 CHECK (bookings_count >= 0),
+    total_spent NUMERIC(12,2) NOT NULL DEFAULT 0 CHECK (total_spent >= 0)
 );
 
--- Derived count of bookings for registered renters
+-- Seed counters for renters who booked before registering
+CREATE OR REPLACE FUNCTION rewards_seed_counters() RETURNS trigger AS $$
+BEGIN
+    SELECT COUNT(*), COALESCE(SUM(total_cost), 0)
+    INTO NEW.bookings_count, NEW.total_spent
+    FROM "Bookings" b
+    WHERE b.renter_email = NEW.renter_email;
+    RETURN NEW;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_rewards_seed
+BEFORE INSERT ON "Rewards_program"
+FOR EACH ROW EXECUTE FUNCTION rewards_seed_counters();
+
+CREATE OR REPLACE FUNCTION rewards_apply_booking() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "Rewards_program"
+        SET bookings_count = bookings_count - 1,
+            total_spent = total_spent - OLD.total_cost
+        WHERE renter_email = OLD.renter_email;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "Rewards_program"
+        SET bookings_count = bookings_count + 1,
+            total_spent = total_spent + NEW.total_cost
+        WHERE renter_email = NEW.renter_email;
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_rewards_bookings
+AFTER INSERT OR DELETE OR UPDATE OF renter_email, total_cost ON "Bookings"
+FOR EACH ROW EXECUTE FUNCTION rewards_apply_booking();
+
+-- Read path used by the renter dashboard; one primary key lookup per renter
 CREATE OR REPLACE VIEW renter_rewards AS
+SELECT renter_email, bookings_count, total_spent
+FROM "Rewards_program";
+
+-- Derived count of bookings for registered renters, recomputed from scratch.
+-- Used only to reconcile the maintained counters.
+CREATE OR REPLACE VIEW renter_rewards_recomputed AS
 SELECT
     rp.renter_email,
     COUNT(b.booking_id)::INT AS bookings_count,
@@ -240,3 +338,835 @@ LEFT JOIN "Bookings" b
     ON b.renter_email = rp.renter_email
 GROUP BY rp.renter_email;
 
+-- ================================
+-- Statistics rollup
+-- Row counts per table and per dimension, so the agent dashboard never runs
+-- COUNT(*) over the base tables. Statement-level triggers only append
+-- per-statement deltas to table_stats_log: a shared counter row such as
+-- ('booking', 'total') would otherwise serialize every concurrent booking
+-- until commit. fold_table_stats_log moves the log into table_stats; the
+-- stats.fold background job and `flask --app app stats-refresh` run it, and
+-- `flask --app app stats-rebuild` recomputes everything from scratch.
+-- ================================
+CREATE TABLE table_stats (
+    dimension VARCHAR(40) NOT NULL,
+    key TEXT NOT NULL,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, key)
+);
+-- Dashboard breakdowns read the top keys of one dimension.
+CREATE INDEX idx_table_stats_top ON table_stats(dimension, row_count DESC, key);
+
+CREATE TABLE table_stats_log (
+    id BIGSERIAL PRIMARY KEY,
+    dimension VARCHAR(40) NOT NULL,
+    key TEXT NOT NULL,
+    delta BIGINT NOT NULL
+);
+-- Pending changes to the totals, added to table_stats by stats_total.
+CREATE INDEX idx_table_stats_log_total ON table_stats_log(dimension) WHERE key = 'total';
+
+-- "City, ST" key for per-city rollups; city names repeat across states.
+CREATE OR REPLACE FUNCTION place_key(city TEXT, state TEXT) RETURNS TEXT AS $$
+    SELECT city || COALESCE(', ' || state, '');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Exact total of a table: the folded count plus the deltas still pending.
+CREATE OR REPLACE FUNCTION stats_total(dim TEXT) RETURNS BIGINT AS $$
+    SELECT COALESCE((SELECT row_count FROM table_stats WHERE dimension = dim AND key = 'total'), 0)
+         + COALESCE((SELECT sum(delta) FROM table_stats_log WHERE dimension = dim AND key = 'total'), 0)::BIGINT;
+$$ LANGUAGE sql STABLE;
+
+-- The (dimension, key) rows one listing counts towards.
+CREATE OR REPLACE FUNCTION stats_property_keys(
+    type TEXT, city TEXT, state TEXT, availability BOOLEAN
+) RETURNS TABLE(dimension TEXT, key TEXT) AS $$
+    VALUES ('property', 'total'),
+           ('property_type', type),
+           ('property_city', city),
+           ('property_state', COALESCE(state, '')),
+           ('property_place', place_key(city, state)),
+           ('property_availability', availability::TEXT);
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION stats_booking_keys(start_date DATE) RETURNS TABLE(dimension TEXT, key TEXT) AS $$
+    VALUES ('booking', 'total'), ('booking_month', to_char(start_date, 'YYYY-MM'));
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION stats_property_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO table_stats_log(dimension, key, delta)
+        SELECT k.dimension, k.key, count(*)
+        FROM new_rows n CROSS JOIN LATERAL stats_property_keys(n.type, n.city, n.state, n.availability) k
+        GROUP BY k.dimension, k.key;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO table_stats_log(dimension, key, delta)
+        SELECT k.dimension, k.key, -count(*)
+        FROM old_rows o CROSS JOIN LATERAL stats_property_keys(o.type, o.city, o.state, o.availability) k
+        GROUP BY k.dimension, k.key;
+    ELSE
+        INSERT INTO table_stats_log(dimension, key, delta)
+        SELECT k.dimension, k.key, sum(c.delta)
+        FROM old_rows o
+        JOIN new_rows n ON n.property_id = o.property_id
+        CROSS JOIN LATERAL (VALUES
+            (-1, o.type, o.city, o.state, o.availability),
+            (1, n.type, n.city, n.state, n.availability)
+        ) AS c(delta, type, city, state, availability)
+        CROSS JOIN LATERAL stats_property_keys(c.type, c.city, c.state, c.availability) k
+        WHERE (o.type, o.city, o.state, o.availability) IS DISTINCT FROM (n.type, n.city, n.state, n.availability)
+        GROUP BY k.dimension, k.key
+        HAVING sum(c.delta) <> 0;
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_stats_property_insert
+AFTER INSERT ON "Property Info" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION stats_property_change();
+CREATE TRIGGER trg_stats_property_update
+AFTER UPDATE ON "Property Info" REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION stats_property_change();
+CREATE TRIGGER trg_stats_property_delete
+AFTER DELETE ON "Property Info" REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION stats_property_change();
+
+CREATE OR REPLACE FUNCTION stats_booking_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO table_stats_log(dimension, key, delta)
+        SELECT k.dimension, k.key, count(*)
+        FROM new_rows n CROSS JOIN LATERAL stats_booking_keys(n.start_date) k
+        GROUP BY k.dimension, k.key;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO table_stats_log(dimension, key, delta)
+        SELECT k.dimension, k.key, -count(*)
+        FROM old_rows o CROSS JOIN LATERAL stats_booking_keys(o.start_date) k
+        GROUP BY k.dimension, k.key;
+    ELSE
+        INSERT INTO table_stats_log(dimension, key, delta)
+        SELECT k.dimension, k.key, sum(c.delta)
+        FROM old_rows o
+        JOIN new_rows n ON n.booking_id = o.booking_id
+        CROSS JOIN LATERAL (VALUES (-1, o.start_date), (1, n.start_date)) AS c(delta, start_date)
+        CROSS JOIN LATERAL stats_booking_keys(c.start_date) k
+        WHERE o.start_date <> n.start_date
+        GROUP BY k.dimension, k.key
+        HAVING sum(c.delta) <> 0;
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_stats_bookings_insert
+AFTER INSERT ON "Bookings" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION stats_booking_change();
+CREATE TRIGGER trg_stats_bookings_update
+AFTER UPDATE ON "Bookings" REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION stats_booking_change();
+CREATE TRIGGER trg_stats_bookings_delete
+AFTER DELETE ON "Bookings" REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION stats_booking_change();
+
+-- Fold up to `batch` of the oldest deltas (all when NULL) into table_stats;
+-- returns the log rows folded. One fold runs at a time, like the booking
+-- rollup fold; a caller that finds another running returns NULL.
+CREATE OR REPLACE FUNCTION fold_table_stats_log(batch INT) RETURNS INT AS $$
+DECLARE
+    folded INT;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('fold_table_stats_log')) THEN
+        RETURN NULL;
+    END IF;
+    WITH taken AS (
+        DELETE FROM table_stats_log
+        WHERE id IN (SELECT id FROM table_stats_log ORDER BY id LIMIT batch)
+        RETURNING dimension, key, delta
+    ),
+    applied AS (
+        INSERT INTO table_stats AS s (dimension, key, row_count)
+        SELECT dimension, key, sum(delta) FROM taken
+        GROUP BY dimension, key
+        ON CONFLICT (dimension, key) DO UPDATE SET row_count = s.row_count + EXCLUDED.row_count
+    )
+    SELECT count(*) INTO folded FROM taken;
+    RETURN folded;
+END$$ LANGUAGE plpgsql;
+
+-- ================================
+-- Listing version
+-- Bumped by every statement that changes listings or neighborhoods. Cached
+-- search results are keyed on it, so a bump invalidates all of them.
+-- Bookings deliberately do not bump it: every booking would then queue on
+-- this one row. Searches by stay dates, the only results that depend on
+-- bookings, are neither cached nor revalidated against it.
+-- ================================
+CREATE TABLE listing_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO listing_version DEFAULT VALUES;
+
+CREATE OR REPLACE FUNCTION bump_listing_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE listing_version SET version = version + 1, changed_at = clock_timestamp();
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_listing_version_property
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "Property Info"
+FOR EACH STATEMENT EXECUTE FUNCTION bump_listing_version();
+
+CREATE TRIGGER trg_listing_version_neighborhood
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "Neighborhood"
+FOR EACH STATEMENT EXECUTE FUNCTION bump_listing_version();
+
+-- ================================
+-- Booking versions
+-- Per-property counter bumped by every statement that changes the property's
+-- bookings. Availability calendars are cached against the versions of the
+-- properties they cover, so a booking only invalidates its own property.
+-- Properties without a row have never been booked (version 0).
+-- ================================
+CREATE TABLE booking_versions (
+    property_id INT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION bump_booking_versions() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE booking_versions SET version = version + 1;
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO booking_versions(property_id, version)
+        SELECT DISTINCT property_id, 1 FROM new_rows
+        ON CONFLICT (property_id) DO UPDATE SET version = booking_versions.version + 1;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO booking_versions(property_id, version)
+        SELECT DISTINCT property_id, 1 FROM old_rows
+        ON CONFLICT (property_id) DO UPDATE SET version = booking_versions.version + 1;
+    ELSE
+        INSERT INTO booking_versions(property_id, version)
+        SELECT property_id, 1 FROM old_rows UNION SELECT property_id, 1 FROM new_rows
+        ON CONFLICT (property_id) DO UPDATE SET version = booking_versions.version + 1;
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_booking_versions_insert
+AFTER INSERT ON "Bookings" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_booking_versions();
+CREATE TRIGGER trg_booking_versions_update
+AFTER UPDATE ON "Bookings" REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_booking_versions();
+CREATE TRIGGER trg_booking_versions_delete
+AFTER DELETE ON "Bookings" REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION bump_booking_versions();
+CREATE TRIGGER trg_booking_versions_truncate
+AFTER TRUNCATE ON "Bookings"
+FOR EACH STATEMENT EXECUTE FUNCTION bump_booking_versions();
+
+-- ================================
+-- Renter matches ("recommended for you")
+-- renter_matches keeps each renter's best listings for their
+-- preferred_location and monthly_budget, scored by match_score. Candidates
+-- are the available listings in the preferred city (or state, scored lower)
+-- priced closest to the budget: up to `per_side` at or below it and up to
+-- `per_side` at most 10% above it, read from the (location, price) indexes.
+-- Being free on the desired move-in date changes with every booking, so it
+-- is added when recommendations are read (see app/matches.py).
+--
+-- renter_match_state remembers, per renter and location branch, the price
+-- horizon its candidates were drawn from. A listing change only marks the
+-- renters dirty whose horizon covers the listing's old or new price; dirty
+-- renters are recomputed by refresh_renter_matches on their next dashboard
+-- view or by `flask --app app matches-refresh`.
+-- ================================
+CREATE INDEX idx_property_match_city ON "Property Info"(LOWER(city), price) WHERE availability;
+CREATE INDEX idx_property_match_state ON "Property Info"(LOWER(state), price) WHERE availability;
+
+CREATE TABLE renter_matches (
+    renter_email VARCHAR(200) NOT NULL REFERENCES "ProspectiveRenter"(email) ON DELETE CASCADE,
+    property_id INT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (renter_email, property_id)
+);
+-- Top-K retrieval per renter
+CREATE INDEX idx_renter_matches_top ON renter_matches(renter_email, score DESC, property_id DESC);
+
+CREATE TABLE renter_match_state (
+    renter_email VARCHAR(200) PRIMARY KEY REFERENCES "ProspectiveRenter"(email) ON DELETE CASCADE,
+    location TEXT,
+    city_horizon NUMRANGE,
+    state_horizon NUMRANGE,
+    dirty BOOLEAN NOT NULL DEFAULT TRUE,
+    refreshed_at TIMESTAMPTZ
+);
+CREATE INDEX idx_match_state_city ON renter_match_state USING gist (location, city_horizon) WHERE NOT dirty;
+CREATE INDEX idx_match_state_state ON renter_match_state USING gist (location, state_horizon) WHERE NOT dirty;
+CREATE INDEX idx_match_state_dirty ON renter_match_state(renter_email) WHERE dirty;
+
+-- Budget fit in [0, 1]: 1 at the budget, 0.5 at half of it (cheaper is fine,
+-- much cheaper is probably not what they want), 0 at 10% over budget.
+-- Weighted 0.5, plus 0.3 for location (city 1, state 0.5); the last 0.2 is
+-- availability on the move-in date, applied at read time.
+CREATE OR REPLACE FUNCTION match_score(price NUMERIC, budget NUMERIC, location_fit REAL) RETURNS REAL AS $$
+    SELECT (
+        0.5 * GREATEST(CASE
+            WHEN price <= budget THEN 1 - 0.5 * (budget - price) / GREATEST(budget, 0.01)
+            ELSE 1 - (price - budget) / GREATEST(budget * 0.1, 0.01)
+        END, 0)
+        + 0.3 * location_fit
+    )::REAL;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION match_candidates(location TEXT, budget NUMERIC, per_side INT)
+RETURNS TABLE(property_id INT, price NUMERIC, location_fit REAL, branch TEXT, above BOOLEAN) AS $$
+    (SELECT p.property_id, p.price, 1.0::REAL, 'city', FALSE FROM "Property Info" p
+     WHERE p.availability AND LOWER(p.city) = location AND p.price <= budget
+     ORDER BY p.price DESC LIMIT per_side)
+    UNION ALL
+    (SELECT p.property_id, p.price, 1.0::REAL, 'city', TRUE FROM "Property Info" p
+     WHERE p.availability AND LOWER(p.city) = location AND p.price > budget AND p.price <= budget * 1.1
+     ORDER BY p.price LIMIT per_side)
+    UNION ALL
+    (SELECT p.property_id, p.price, 0.5::REAL, 'state', FALSE FROM "Property Info" p
+     WHERE p.availability AND LOWER(p.state) = location AND LOWER(p.city) <> location AND p.price <= budget
+     ORDER BY p.price DESC LIMIT per_side)
+    UNION ALL
+    (SELECT p.property_id, p.price, 0.5::REAL, 'state', TRUE FROM "Property Info" p
+     WHERE p.availability AND LOWER(p.state) = location AND LOWER(p.city) <> location
+       AND p.price > budget AND p.price <= budget * 1.1
+     ORDER BY p.price LIMIT per_side);
+$$ LANGUAGE sql STABLE;
+
+-- Advisory lock key for a lowercased location: one of 64 buckets under the
+-- 'renter_matches' class, so a statement takes at most 64 of these locks
+-- however many locations it touches.
+CREATE OR REPLACE FUNCTION renter_match_lock_bucket(location TEXT) RETURNS INT AS $$
+    SELECT hashtext(location) & 63
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Recompute the matches of `emails`, keeping the best `keep` per renter.
+-- A full side (`per_side` candidates) bounds the horizon at its furthest
+-- price; otherwise every price on that side could become a candidate.
+CREATE OR REPLACE FUNCTION refresh_renter_matches(emails TEXT[], keep INT, per_side INT) RETURNS INT AS $$
+    -- Wait for uncommitted listing writes in these renters' locations, and
+    -- hold off new ones until commit, so the candidates read below include
+    -- every listing whose mark_matches_dirty call could have missed them.
+    -- Exclusive here and shared in the writers, so writes never wait on each
+    -- other. Taken before the row locks: listing writes take them in the
+    -- other order.
+    SELECT pg_advisory_xact_lock(hashtext('renter_matches'), bucket)
+    FROM (
+        SELECT DISTINCT renter_match_lock_bucket(LOWER(TRIM(preferred_location))) AS bucket
+        FROM "ProspectiveRenter"
+        WHERE email = ANY(emails) AND preferred_location IS NOT NULL
+        ORDER BY 1
+    ) l;
+
+    -- Serialize concurrent refreshes of the same renter.
+    INSERT INTO renter_match_state(renter_email)
+    SELECT email FROM "ProspectiveRenter" WHERE email = ANY(emails) ORDER BY email
+    ON CONFLICT (renter_email) DO NOTHING;
+    SELECT 1 FROM renter_match_state WHERE renter_email = ANY(emails) ORDER BY renter_email FOR UPDATE;
+
+    DELETE FROM renter_matches WHERE renter_email = ANY(emails);
+
+    WITH renters AS (
+        SELECT email, LOWER(TRIM(preferred_location)) AS location, monthly_budget AS budget
+        FROM "ProspectiveRenter"
+        WHERE email = ANY(emails)
+    ),
+    candidates AS (
+        SELECT r.email, c.property_id, c.price, c.branch, c.above,
+               match_score(c.price, r.budget, c.location_fit) AS score
+        FROM renters r
+        CROSS JOIN LATERAL match_candidates(r.location, r.budget, per_side) c
+    ),
+    kept AS (
+        INSERT INTO renter_matches(renter_email, property_id, score)
+        SELECT email, property_id, score
+        FROM (
+            SELECT email, property_id, score,
+                   row_number() OVER (PARTITION BY email ORDER BY score DESC, property_id DESC) AS n
+            FROM candidates
+        ) ranked
+        WHERE n <= keep
+    )
+    UPDATE renter_match_state s
+    SET location = h.location,
+        city_horizon = h.city_horizon,
+        state_horizon = h.state_horizon,
+        dirty = FALSE,
+        refreshed_at = now()
+    FROM (
+        SELECT r.email, r.location,
+               numrange(
+                   CASE WHEN count(*) FILTER (WHERE c.branch = 'city' AND NOT c.above) >= per_side
+                        THEN min(c.price) FILTER (WHERE c.branch = 'city' AND NOT c.above) END,
+                   CASE WHEN count(*) FILTER (WHERE c.branch = 'city' AND c.above) >= per_side
+                        THEN max(c.price) FILTER (WHERE c.branch = 'city' AND c.above)
+                        ELSE r.budget * 1.1 END,
+                   '[]') AS city_horizon,
+               numrange(
+                   CASE WHEN count(*) FILTER (WHERE c.branch = 'state' AND NOT c.above) >= per_side
+                        THEN min(c.price) FILTER (WHERE c.branch = 'state' AND NOT c.above) END,
+                   CASE WHEN count(*) FILTER (WHERE c.branch = 'state' AND c.above) >= per_side
+                        THEN max(c.price) FILTER (WHERE c.branch = 'state' AND c.above)
+                        ELSE r.budget * 1.1 END,
+                   '[]') AS state_horizon
+        FROM renters r
+        LEFT JOIN candidates c ON c.email = r.email
+        GROUP BY r.email, r.location, r.budget
+    ) h
+    WHERE s.renter_email = h.email;
+
+    SELECT count(*)::INT FROM renter_matches WHERE renter_email = ANY(emails);
+$$ LANGUAGE sql;
+
+-- Mark renters dirty whose candidate horizon covers one of the listed
+-- (city, state, price) points. Renters already dirty are skipped: they are
+-- recomputed later from a fresh snapshot. One being recomputed right now may
+-- still be dirty, or have a horizon that does not yet cover the price, so
+-- the shared location lock first waits for such refreshes to commit; the
+-- UPDATE then sees their new horizons. Locks are taken in bucket and email
+-- order so concurrent listing writes cannot deadlock on them.
+CREATE OR REPLACE FUNCTION mark_matches_dirty(cities TEXT[], states TEXT[], prices NUMERIC[]) RETURNS void AS $$
+    SELECT pg_advisory_xact_lock_shared(hashtext('renter_matches'), bucket)
+    FROM (
+        SELECT DISTINCT renter_match_lock_bucket(LOWER(k)) AS bucket
+        FROM unnest(cities || states) AS k
+        WHERE k IS NOT NULL
+        ORDER BY 1
+    ) l;
+
+    UPDATE renter_match_state s
+    SET dirty = TRUE
+    FROM (
+        SELECT m.renter_email
+        FROM unnest(cities, states, prices) AS c(city, state, price)
+        JOIN renter_match_state m ON NOT m.dirty AND (
+            (m.location = LOWER(c.city) AND m.city_horizon @> c.price)
+            OR (m.location = LOWER(c.state) AND m.state_horizon @> c.price)
+        )
+        ORDER BY m.renter_email
+        FOR UPDATE OF m
+    ) d
+    WHERE s.renter_email = d.renter_email;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION listing_matches_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM mark_matches_dirty(array_agg(city), array_agg(state), array_agg(price))
+        FROM new_rows WHERE availability;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM mark_matches_dirty(array_agg(city), array_agg(state), array_agg(price))
+        FROM old_rows WHERE availability;
+    ELSE
+        -- Both the old and the new position matter; edits that leave city,
+        -- state, price and availability alone affect no match.
+        PERFORM mark_matches_dirty(array_agg(c.city), array_agg(c.state), array_agg(c.price))
+        FROM old_rows o
+        JOIN new_rows n ON n.property_id = o.property_id
+        CROSS JOIN LATERAL (VALUES
+            (o.city, o.state, o.price, o.availability),
+            (n.city, n.state, n.price, n.availability)
+        ) AS c(city, state, price, availability)
+        WHERE c.availability
+          AND (o.city, o.state, o.price, o.availability)
+              IS DISTINCT FROM (n.city, n.state, n.price, n.availability);
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_matches_property_insert
+AFTER INSERT ON "Property Info" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION listing_matches_change();
+CREATE TRIGGER trg_matches_property_update
+AFTER UPDATE ON "Property Info" REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION listing_matches_change();
+CREATE TRIGGER trg_matches_property_delete
+AFTER DELETE ON "Property Info" REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION listing_matches_change();
+
+CREATE OR REPLACE FUNCTION renter_preferences_change() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO renter_match_state(renter_email) VALUES (NEW.email)
+    ON CONFLICT (renter_email) DO UPDATE SET dirty = TRUE;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_matches_preferences
+AFTER INSERT OR UPDATE OF preferred_location, monthly_budget ON "ProspectiveRenter"
+FOR EACH ROW EXECUTE FUNCTION renter_preferences_change();
+
+-- ================================
+-- Booking rollups (agent analytics)
+-- booking_rollup holds monthly booking totals per dimension and key:
+-- 'city' ("City, ST", see place_key), 'state', 'type' (the booking's
+-- "Property_Type") and 'total' (key 'total'). Booked nights and revenue are
+-- split over the calendar months a stay covers, revenue pro rata to nights;
+-- a booking is counted once, in the month its stay starts. renters counts
+-- the distinct renters with nights in the month, kept exact through
+-- booking_rollup_renters (stays per renter behind each rollup row).
+--
+-- Booking triggers only append +1 (new state) and -1 (old state) rows to
+-- booking_rollup_log, so concurrent bookings never wait on a shared rollup
+-- row. fold_booking_rollup_log moves the oldest log rows into the rollups.
+-- The analytics.fold job (app/tasks.py) runs it after bookings change, and
+-- `flask --app app analytics-refresh` folds the whole log. The analytics
+-- pages read only the rollups and show how many log rows are still pending.
+-- `analytics-rebuild` recomputes everything from "Bookings".
+-- ================================
+CREATE TABLE booking_rollup (
+    dimension VARCHAR(10) NOT NULL CHECK (dimension IN ('city','state','type','total')),
+    key TEXT NOT NULL,
+    month DATE NOT NULL,
+    bookings BIGINT NOT NULL DEFAULT 0,
+    booked_nights BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(16,2) NOT NULL DEFAULT 0,
+    renters BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, key, month)
+);
+-- Month-wide breakdowns (every key of a dimension in one month).
+CREATE INDEX idx_booking_rollup_month ON booking_rollup(dimension, month);
+-- Rows emptied by cancellations are deleted after each fold.
+CREATE INDEX idx_booking_rollup_empty ON booking_rollup(dimension) WHERE booked_nights = 0;
+
+CREATE TABLE booking_rollup_renters (
+    dimension VARCHAR(10) NOT NULL,
+    key TEXT NOT NULL,
+    month DATE NOT NULL,
+    renter_email VARCHAR(200) NOT NULL,
+    stays INT NOT NULL,
+    PRIMARY KEY (dimension, key, month, renter_email)
+);
+CREATE INDEX idx_booking_rollup_renters_empty ON booking_rollup_renters(dimension) WHERE stays = 0;
+
+CREATE TABLE booking_rollup_log (
+    id BIGSERIAL PRIMARY KEY,
+    city VARCHAR(100) NOT NULL,
+    state VARCHAR(100),
+    property_type VARCHAR(20) NOT NULL,
+    renter_email VARCHAR(200) NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    total_cost NUMERIC(12,2) NOT NULL,
+    sign SMALLINT NOT NULL CHECK (sign IN (-1, 1)),
+    logged_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION log_booking_rollup() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO booking_rollup_log(city, state, property_type, renter_email, start_date, end_date, total_cost, sign)
+        SELECT p.city, p.state, n."Property_Type", n.renter_email, n.start_date, n.end_date, n.total_cost, 1
+        FROM new_rows n JOIN "Property Info" p ON p.property_id = n.property_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO booking_rollup_log(city, state, property_type, renter_email, start_date, end_date, total_cost, sign)
+        SELECT p.city, p.state, o."Property_Type", o.renter_email, o.start_date, o.end_date, o.total_cost, -1
+        FROM old_rows o JOIN "Property Info" p ON p.property_id = o.property_id;
+    ELSE
+        -- Only edits to rolled-up columns are logged (not updated_at touches).
+        INSERT INTO booking_rollup_log(city, state, property_type, renter_email, start_date, end_date, total_cost, sign)
+        SELECT p.city, p.state, c.property_type, c.renter_email, c.start_date, c.end_date, c.total_cost, c.sign
+        FROM old_rows o
+        JOIN new_rows n ON n.booking_id = o.booking_id
+        CROSS JOIN LATERAL (VALUES
+            (o.property_id, o."Property_Type", o.renter_email, o.start_date, o.end_date, o.total_cost, -1),
+            (n.property_id, n."Property_Type", n.renter_email, n.start_date, n.end_date, n.total_cost, 1)
+        ) AS c(property_id, property_type, renter_email, start_date, end_date, total_cost, sign)
+        JOIN "Property Info" p ON p.property_id = c.property_id
+        WHERE (o.property_id, o."Property_Type", o.renter_email, o.start_date, o.end_date, o.total_cost)
+              IS DISTINCT FROM
+              (n.property_id, n."Property_Type", n.renter_email, n.start_date, n.end_date, n.total_cost);
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_rollup_bookings_insert
+AFTER INSERT ON "Bookings" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_booking_rollup();
+CREATE TRIGGER trg_rollup_bookings_update
+AFTER UPDATE ON "Bookings" REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_booking_rollup();
+CREATE TRIGGER trg_rollup_bookings_delete
+AFTER DELETE ON "Bookings" REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_booking_rollup();
+
+-- Moving a listing to another city or state moves its bookings' history.
+CREATE OR REPLACE FUNCTION log_listing_rollup() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO booking_rollup_log(city, state, property_type, renter_email, start_date, end_date, total_cost, sign)
+    SELECT c.city, c.state, b."Property_Type", b.renter_email, b.start_date, b.end_date, b.total_cost, c.sign
+    FROM old_rows o
+    JOIN new_rows n ON n.property_id = o.property_id
+    JOIN "Bookings" b ON b.property_id = o.property_id
+    CROSS JOIN LATERAL (VALUES (o.city, o.state, -1), (n.city, n.state, 1)) AS c(city, state, sign)
+    WHERE (o.city, o.state) IS DISTINCT FROM (n.city, n.state);
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_rollup_property_update
+AFTER UPDATE ON "Property Info" REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION log_listing_rollup();
+
+-- No bookings, nothing to roll up (datagen and resets truncate "Bookings").
+CREATE OR REPLACE FUNCTION reset_booking_rollup() RETURNS trigger AS $$
+BEGIN
+    TRUNCATE booking_rollup, booking_rollup_renters, booking_rollup_log;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_rollup_bookings_truncate
+AFTER TRUNCATE ON "Bookings"
+FOR EACH STATEMENT EXECUTE FUNCTION reset_booking_rollup();
+
+-- Fold up to `batch` of the oldest log rows (all of them when NULL) into the
+-- rollups; returns the log rows folded. Folds run one at a time, since two
+-- would upsert the same rollup rows in different orders: a caller that finds
+-- another fold running returns NULL without folding. That fold may have read
+-- the log before the caller's rows committed, so the caller must try again. Revenue shares are
+-- rounded per booking and month, so a -1 row cancels its +1 row exactly.
+CREATE OR REPLACE FUNCTION fold_booking_rollup_log(batch INT) RETURNS INT AS $$
+DECLARE
+    folded INT;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('fold_booking_rollup_log')) THEN
+        RETURN NULL;
+    END IF;
+
+    WITH taken AS (
+        DELETE FROM booking_rollup_log
+        WHERE id IN (SELECT id FROM booking_rollup_log ORDER BY id LIMIT batch)
+        RETURNING *
+    ),
+    months AS (
+        SELECT t.*, m.month::date AS month,
+               LEAST(t.end_date, (m.month + interval '1 month')::date)
+                   - GREATEST(t.start_date, m.month::date) AS nights
+        FROM taken t
+        CROSS JOIN LATERAL generate_series(
+            date_trunc('month', t.start_date::timestamp),
+            date_trunc('month', (t.end_date - 1)::timestamp),
+            interval '1 month'
+        ) AS m(month)
+    ),
+    keyed AS (
+        SELECT g.dimension, g.key, m.month, m.renter_email, m.sign, m.nights,
+               m.month = date_trunc('month', m.start_date::timestamp)::date AS first_month,
+               round(m.total_cost * m.nights / (m.end_date - m.start_date), 2) AS revenue
+        FROM months m
+        CROSS JOIN LATERAL (VALUES
+            ('city', place_key(m.city, m.state)),
+            ('state', COALESCE(m.state, '')),
+            ('type', m.property_type),
+            ('total', 'total')
+        ) AS g(dimension, key)
+    ),
+    renter_deltas AS (
+        SELECT dimension, key, month, renter_email, sum(sign)::INT AS delta
+        FROM keyed
+        GROUP BY dimension, key, month, renter_email
+        HAVING sum(sign) <> 0
+    ),
+    renter_counts AS (
+        INSERT INTO booking_rollup_renters AS r (dimension, key, month, renter_email, stays)
+        SELECT dimension, key, month, renter_email, delta FROM renter_deltas
+        ON CONFLICT (dimension, key, month, renter_email)
+        DO UPDATE SET stays = r.stays + EXCLUDED.stays
+        RETURNING r.dimension, r.key, r.month, r.renter_email, r.stays
+    ),
+    -- A renter joins a row when their stays go from 0 and leaves when they
+    -- drop back to 0.
+    renter_change AS (
+        SELECT c.dimension, c.key, c.month,
+               count(*) FILTER (WHERE c.stays = d.delta)
+               - count(*) FILTER (WHERE c.stays = 0) AS renters
+        FROM renter_counts c
+        JOIN renter_deltas d USING (dimension, key, month, renter_email)
+        GROUP BY c.dimension, c.key, c.month
+    ),
+    totals AS (
+        SELECT dimension, key, month,
+               COALESCE(sum(sign) FILTER (WHERE first_month), 0) AS bookings,
+               sum(sign * nights) AS booked_nights,
+               sum(sign * revenue) AS revenue
+        FROM keyed
+        GROUP BY dimension, key, month
+    ),
+    applied AS (
+        INSERT INTO booking_rollup AS b (dimension, key, month, bookings, booked_nights, revenue, renters)
+        SELECT t.dimension, t.key, t.month, t.bookings, t.booked_nights, t.revenue, COALESCE(c.renters, 0)
+        FROM totals t
+        LEFT JOIN renter_change c USING (dimension, key, month)
+        ON CONFLICT (dimension, key, month) DO UPDATE SET
+            bookings = b.bookings + EXCLUDED.bookings,
+            booked_nights = b.booked_nights + EXCLUDED.booked_nights,
+            revenue = b.revenue + EXCLUDED.revenue,
+            renters = b.renters + EXCLUDED.renters
+    )
+    SELECT count(*) INTO folded FROM taken;
+
+    DELETE FROM booking_rollup_renters WHERE stays = 0;
+    DELETE FROM booking_rollup WHERE booked_nights = 0;
+    RETURN folded;
+END$$ LANGUAGE plpgsql;
+
+-- Row modification stamps for "Property Info" and "Bookings" (conditional GETs).
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_property_touch
+BEFORE UPDATE ON "Property Info"
+FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+CREATE TRIGGER trg_bookings_touch
+BEFORE UPDATE ON "Bookings"
+FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+-- Catalog delta refreshes read the listings stamped after their watermark.
+CREATE INDEX idx_property_updated ON "Property Info"(updated_at);
+
+-- ================================
+-- Change feed
+-- Statement-level triggers publish compact NOTIFY payloads on the
+-- listing_changes channel: {"table", "op", "rows": [...], "more"}, where rows
+-- hold [property_id, booking_id, start_date, end_date] for bookings and
+-- [property_id, availability, price] for listings. At most 100 rows are sent
+-- per statement (NOTIFY payloads are limited to 8000 bytes); "more" marks a
+-- truncated list, after which listeners should treat everything as changed.
+-- ================================
+CREATE OR REPLACE FUNCTION notify_bookings_change() RETURNS trigger AS $$
+DECLARE
+    changed json;
+    total INT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT json_agg(json_build_array(property_id, booking_id, start_date, end_date)) FILTER (WHERE n <= 100), count(*)
+          INTO changed, total
+          FROM (SELECT *, row_number() OVER () AS n FROM old_rows LIMIT 101) r;
+    ELSE
+        SELECT json_agg(json_build_array(property_id, booking_id, start_date, end_date)) FILTER (WHERE n <= 100), count(*)
+          INTO changed, total
+          FROM (SELECT *, row_number() OVER () AS n FROM new_rows LIMIT 101) r;
+    END IF;
+    IF total > 0 THEN
+        PERFORM pg_notify('listing_changes', json_build_object(
+            'table', 'bookings', 'op', TG_OP, 'rows', changed, 'more', total > 100
+        )::text);
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_property_change() RETURNS trigger AS $$
+DECLARE
+    changed json;
+    total INT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT json_agg(json_build_array(property_id, availability, price)) FILTER (WHERE n <= 100), count(*)
+          INTO changed, total
+          FROM (SELECT *, row_number() OVER () AS n FROM old_rows LIMIT 101) r;
+    ELSE
+        SELECT json_agg(json_build_array(property_id, availability, price)) FILTER (WHERE n <= 100), count(*)
+          INTO changed, total
+          FROM (SELECT *, row_number() OVER () AS n FROM new_rows LIMIT 101) r;
+    END IF;
+    IF total > 0 THEN
+        PERFORM pg_notify('listing_changes', json_build_object(
+            'table', 'listings', 'op', TG_OP, 'rows', changed, 'more', total > 100
+        )::text);
+    END IF;
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+-- Transition tables allow only one event per trigger.
+CREATE TRIGGER trg_notify_bookings_insert
+AFTER INSERT ON "Bookings" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_bookings_change();
+CREATE TRIGGER trg_notify_bookings_update
+AFTER UPDATE ON "Bookings" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_bookings_change();
+CREATE TRIGGER trg_notify_bookings_delete
+AFTER DELETE ON "Bookings" REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_bookings_change();
+
+CREATE TRIGGER trg_notify_property_insert
+AFTER INSERT ON "Property Info" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_property_change();
+CREATE TRIGGER trg_notify_property_update
+AFTER UPDATE ON "Property Info" REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_property_change();
+CREATE TRIGGER trg_notify_property_delete
+AFTER DELETE ON "Property Info" REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_property_change();
+
+-- Shared search-result cache for SEARCH_CACHE_BACKEND=postgres. Unlogged:
+-- contents are disposable and are lost on crash, which only costs misses.
+CREATE UNLOGGED TABLE search_cache (
+    key TEXT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    payload TEXT NOT NULL,  -- JSON written by search_cache.dumps
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX idx_search_cache_created ON search_cache(created_at);
+
+-- ================================
+-- Background jobs
+-- Durable work queue. app/jobs.py enqueues in the caller's transaction, so a
+-- job exists exactly when the booking or listing write that needs it commits.
+-- Workers (`flask --app app jobs-worker`) lease ready rows with FOR UPDATE
+-- SKIP LOCKED in a short claim transaction that also counts the attempt,
+-- then run each job in its own transaction: a finished job is deleted in the
+-- same commit as its work. A job whose worker died is claimed again once
+-- locked_until passes. Failed jobs are retried later (run_at moves forward
+-- with exponential backoff); after max_attempts they move to jobs_dead. The
+-- insert trigger wakes idle workers listening on "jobs".
+-- ================================
+CREATE TABLE jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(60) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    -- A job is not enqueued while a committed copy with the same key waits
+    -- unclaimed. Enqueuers racing each other may each add one; jobs with a
+    -- key must be safe to run more than once.
+    dedupe_key TEXT,
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5 CHECK (max_attempts > 0),
+    run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    -- Set while a worker holds the job; NULL while it waits.
+    locked_until TIMESTAMPTZ,
+    enqueued_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_error TEXT
+);
+CREATE INDEX idx_jobs_run_at ON jobs(run_at, id);
+CREATE INDEX idx_jobs_dedupe ON jobs(dedupe_key)
+    WHERE dedupe_key IS NOT NULL AND locked_until IS NULL;
+
+CREATE TABLE jobs_dead (
+    id BIGINT PRIMARY KEY,
+    kind VARCHAR(60) NOT NULL,
+    payload JSONB NOT NULL,
+    attempts INT NOT NULL,
+    enqueued_at TIMESTAMPTZ NOT NULL,
+    failed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_error TEXT
+);
+CREATE INDEX idx_jobs_dead_kind ON jobs_dead(kind, failed_at);
+
+CREATE OR REPLACE FUNCTION notify_jobs() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('jobs', '');
+    RETURN NULL;
+END$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_jobs_notify
+AFTER INSERT ON jobs
+FOR EACH STATEMENT EXECUTE FUNCTION notify_jobs();